@@ -0,0 +1,77 @@
+"""
+Both studies in one WSGI app, picked by Host header:
+
+    COMBINED_HOSTS="draw.example.org=draw,landmarks.example.org=landmarks" \
+    gunicorn --bind 0.0.0.0:5000 --workers 3 --threads 2 src.combined_app:app
+
+The landmark app is built with share_with=the draw app, so each worker holds one
+copy of the route data and media index, opens one DB pool and runs the startup task
+sync once. Per-study settings come from DRAW_* / LANDMARKS_* environment variables
+(e.g. LANDMARKS_MAX_CONCURRENT_USERS=200); the database URL is the draw app's.
+Hosts are used instead of path prefixes because the clients build absolute URLs.
+"""
+from src.shared.config import Config
+from src.shared.factory import create_app
+from src.shared.shared_routes import register_shared_routes
+from src.shared.static_routes import register_static_routes
+from src.shared.batch_routes import register_batch_routes
+from src.shared.answer_routes import register_answer_routes
+from src.shared.telemetry import register_telemetry_routes
+from src.shared.task_stats import register_task_stats_routes
+from src.shared.agreement import register_agreement_routes
+from src.shared.phash import register_phash_routes
+from src.draw_site.draw_routes import register_draw_routes
+from src.landmark_site.landmark_routes import register_landmark_routes
+
+STUDY_ROUTES = {
+    "draw": register_draw_routes,
+    "landmarks": register_landmark_routes,
+}
+
+
+def build_study_app(mode, share_with=None):
+    app = create_app(mode, share_with=share_with)
+    register_shared_routes(app)
+    register_static_routes(app)
+    register_batch_routes(app)
+    register_answer_routes(app)
+    register_telemetry_routes(app)
+    register_task_stats_routes(app)
+    register_agreement_routes(app)
+    register_phash_routes(app)
+    STUDY_ROUTES[mode](app)
+    return app
+
+
+def parse_hosts(spec):
+    """'a.org=draw, b.org:8080=landmarks' -> {'a.org': 'draw', 'b.org:8080': 'landmarks'}"""
+    hosts = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        host, _, study = item.partition("=")
+        if study.strip() not in STUDY_ROUTES:
+            raise ValueError(f"COMBINED_HOSTS: unknown study {study!r} for {host!r}")
+        hosts[host.strip().lower()] = study.strip()
+    return hosts
+
+
+class StudyDispatcher:
+    """WSGI middleware routing each request to a study app by its Host header."""
+
+    def __init__(self, apps, hosts, default):
+        self.apps = apps
+        self.hosts = {host: apps[study] for host, study in hosts.items()}
+        self.default = apps[default]
+
+    def __call__(self, environ, start_response):
+        host = environ.get("HTTP_HOST", "").lower()
+        app = self.hosts.get(host) or self.hosts.get(host.rsplit(":", 1)[0]) or self.default
+        return app(environ, start_response)
+
+
+draw_app = build_study_app("draw")
+landmark_app = build_study_app("landmarks", share_with=draw_app)
+app = StudyDispatcher(
+    {"draw": draw_app, "landmarks": landmark_app},
+    parse_hosts(Config.COMBINED_HOSTS),
+    Config.COMBINED_DEFAULT_STUDY,
+)
@@ -0,0 +1,70 @@
+import io, base64
+from datetime import datetime, timezone
+from flask import render_template, session, jsonify, request, url_for
+from flask_login import login_required, current_user
+from src.shared.models import db, Task, Drawing
+from src.shared.effort import score_image
+from src.shared.phash import hash_drawing
+from src.shared.pairing import ensure_coverage
+
+
+def register_draw_routes(app):
+    drawing_store = app.extensions["drawing_store"]
+
+    @app.route("/")
+    @login_required
+    def draw_survey():
+        return render_template(
+            "draw_survey.html",
+            user_id=session.get("user_id", ""),
+            study_id=session.get("study_id", "")
+        )
+
+    @app.route("/save_drawing", methods=["POST"])
+    @login_required
+    def save_drawing():
+        data = request.json or {}
+        task_id = data.get("task_id")
+        image_base64 = data.get("image", "")
+
+        if not task_id or not image_base64.startswith("data:image"):
+            return jsonify(success=False, error="Invalid payload"), 400
+
+        try:
+            image_data = image_base64.split(",")[1]
+        except IndexError:
+            return jsonify(success=False, error="Invalid base64 image data"), 400
+
+        try:
+            image_bytes = base64.b64decode(image_data)
+        except base64.binascii.Error:
+            return jsonify(success=False, error="Base64 decoding failed"), 400
+
+        filename = f"{current_user.id}_{task_id}.png"
+        filepath = drawing_store.save(filename, io.BytesIO(image_bytes), length=len(image_bytes))
+
+        task = Task.query.get(task_id)
+        if not task:
+            return jsonify(success=False, error="Unknown task_id"), 400
+        drawing = Drawing.query.filter_by(user_id=current_user.id, task_id=task_id).first()
+        if drawing:
+            if drawing.drawing_path is None:
+                task.served_count_draw += 1
+            drawing.drawing_path = filepath
+            drawing.timestamp = datetime.now(timezone.utc)
+        else:
+            task.served_count_draw += 1
+            drawing = Drawing(
+                user_id=current_user.id,
+                task_id=task_id,
+                drawing_path=filepath,
+                timestamp=datetime.now(timezone.utc),
+            )
+            db.session.add(drawing)
+        ensure_coverage(drawing)
+        score_image(current_user.id, task.id, image_bytes)
+        hash_drawing(current_user.id, task.id, image_bytes)
+
+        db.session.commit()
+
+        return jsonify(success=True, file=url_for("get_user_drawing", fname=filename))
@@ -15,8 +15,47 @@ const PROLIFIC_SCREENOUT_URL = "https://app.prolific.com/submissions/complete?cc
 let batch = [], savedAns = {};
 let taskMetrics = {};
 let autoSaveTimer = null;
+// Autosave pacing: save responses carry X-Autosave-Interval-Ms (and Retry-After under
+// load); timer ticks skip the save when nothing changed since the last one.
+let autosaveIntervalMs = AUTOSAVE_INTERVAL_MS;
+let autosaveRetryAt = 0;
+let autosaveDirty = true;
 let saveStatusResetTimer = null;
 
+/* ---------------- Client performance telemetry ---------------- */
+// Timings are batched and sent with navigator.sendBeacon, so they never hold up saves.
+const TELEMETRY_FLUSH_MS = 15000;
+const TELEMETRY_MAX_BATCH = 50;
+let telemetryQueue = [];
+
+function recordTiming(metric, valueMs, taskId = null) {
+  if (!isFinite(valueMs) || valueMs < 0) return;
+  const t = taskId != null ? batch.find(b => b.task_id === taskId) : batch[state.tIdx];
+  telemetryQueue.push({ m: metric, v: Math.round(valueMs), r: t ? t.route_id : null });
+  if (telemetryQueue.length >= TELEMETRY_MAX_BATCH) flushTelemetry();
+}
+
+function flushTelemetry() {
+  if (telemetryQueue.length === 0) return;
+  const body = JSON.stringify({ samples: telemetryQueue.splice(0, telemetryQueue.length) });
+  if (navigator.sendBeacon) {
+    navigator.sendBeacon(BASE + "/telemetry", new Blob([body], { type: "application/json" }));
+  } else {
+    fetch(BASE + "/telemetry", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body,
+      keepalive: true
+    }).catch(() => {});
+  }
+}
+
+setInterval(flushTelemetry, TELEMETRY_FLUSH_MS);
+document.addEventListener("visibilitychange", () => {
+  if (document.visibilityState === "hidden") flushTelemetry();
+});
+window.addEventListener("pagehide", flushTelemetry);
+
 let state = {
   currentPage: "instr-page",
   batch: [],
@@ -557,7 +596,9 @@ function screenOutParticipant(reason = "failed_quiz") {
 // ------------------ Fetch Batch ------------------
 async function fetchBatch() {
   try {
+    const batchStart = performance.now();
     const res = await fetch(BASE + "/next_batch");
+    recordTiming("next_batch_ms", performance.now() - batchStart);
     console.log("Fetched batch from:", BASE + "/next_batch");
 
     const data = await res.json();
@@ -761,7 +802,10 @@ function renderTask(){
   getTaskMetrics(t.task_id);
 
   // Map
-  document.getElementById("map-img").src = BASE + t.map_url;
+  const mapImg = document.getElementById("map-img");
+  const mapStart = performance.now();
+  mapImg.onload = () => recordTiming("map_load_ms", performance.now() - mapStart, t.task_id);
+  mapImg.src = BASE + t.map_url;
   console.log("Map loaded from:", BASE + t.map_url);
 
   // Video
@@ -796,6 +840,8 @@ function renderTask(){
 
     const savedImgEl = document.getElementById("saved-drawing-img");
     if (savedImgEl) {
+      const drawingStart = performance.now();
+      savedImgEl.onload = () => recordTiming("drawing_load_ms", performance.now() - drawingStart, t.task_id);
       savedImgEl.src = BASE + (state.drawing_paths[t.task_id] || "");
     }
   }
@@ -852,6 +898,10 @@ function renderObsVideo(t) {
   // Switch source
   video.setAttribute("data-task-id", t.task_id);
   source.setAttribute("src", url);
+  const videoStart = performance.now();
+  video.addEventListener("loadeddata", () => {
+    recordTiming("video_start_ms", performance.now() - videoStart, t.task_id);
+  }, { once: true });
   video.load();
 
   attachVideoStateHandlers(video, t.task_id);
@@ -895,6 +945,7 @@ function attachVideoStateHandlers(video, taskId) {
   video.ontimeupdate = () => {
     const now = performance.now();
     m.video.maxWatchedTime = Math.max(m.video.maxWatchedTime, video.currentTime || 0);
+    if (isFinite(video.duration)) m.video.durationSec = video.duration;
 
     if (now - lastSavedAtMs >= SAVE_EVERY_MS) {
       lastSavedAtMs = now;
@@ -1903,6 +1954,7 @@ function snapshotCanvasToState(taskId) {
 }
 
 function exportPngWithText() {
+  const exportStart = performance.now();
   const rect = canvas.getBoundingClientRect();
   const scaleX = canvas.width / rect.width;
   const scaleY = canvas.height / rect.height;
@@ -1966,7 +2018,9 @@ function exportPngWithText() {
     octx.drawImage(img, x, y, w, h);
   });
 
-  return out.toDataURL("image/png");
+  const dataUrl = out.toDataURL("image/png");
+  recordTiming("export_png_ms", performance.now() - exportStart);
+  return dataUrl;
 }
 
 const endDraw = (e) => {
@@ -2203,6 +2257,10 @@ function recordStrokeStart(taskId) {
   if (!m.drawing) m.drawing = { strokeCount: 0, firstStrokeMs: null, lastStrokeMs: null, points: [] };
 
   if (m.drawing.firstStrokeMs == null) m.drawing.firstStrokeMs = now;
+  // lets the server normalise stroke coordinates (CSS pixels) for its own effort check
+  const { w, h } = getCanvasCssSize();
+  m.drawing.canvasW = Math.round(w);
+  m.drawing.canvasH = Math.round(h);
 }
 
 function recordStrokeEnd(taskId) {
@@ -2213,9 +2271,18 @@ function recordStrokeEnd(taskId) {
   m.drawing.strokeCount = (m.drawing.strokeCount || 0) + 1;
   m.drawing.lastStrokeMs = now;
 
-  // append sampled points
+  // append sampled points (local entropy estimate only)
   if (!Array.isArray(m.drawing.points)) m.drawing.points = [];
-  for (const p of currentStrokePoints) m.drawing.points.push(p);
+  for (const p of currentStrokePoints) m.drawing.points.push({ x: p.x, y: p.y });
+
+  // full stroke, kept until the server acknowledges it; stored packed server-side
+  if (currentStrokePoints.length) {
+    const first = currentStrokePoints[0].t;
+    const pts = [];
+    for (const p of currentStrokePoints) pts.push(Math.round(p.x), Math.round(p.y), Math.round(p.t - first));
+    if (!Array.isArray(m.drawing.strokeLog)) m.drawing.strokeLog = [];
+    m.drawing.strokeLog.push({ n: m.drawing.strokeCount, t0: Math.round(performance.timeOrigin + first), pts });
+  }
 
   // cap size
   if (m.drawing.points.length > MAX_ENTROPY_POINTS) {
@@ -2233,7 +2300,7 @@ function recordStrokePoint(taskId, x, y) {
     const dx = x - last.x, dy = y - last.y;
     if ((dx*dx + dy*dy) < 16) return; // <4px => skip
   }
-  currentStrokePoints.push({ x, y });
+  currentStrokePoints.push({ x, y, t: performance.now() });
 }
 
 function computeStrokeEntropy01(taskId, grid = 8) {
@@ -2242,11 +2309,12 @@ function computeStrokeEntropy01(taskId, grid = 8) {
   if (pts.length < 20) return 0;
 
   const counts = new Array(grid * grid).fill(0);
+  const { w, h } = getCanvasCssSize();
 
   for (const p of pts) {
-    // points are in canvas coordinates already (0..canvas.width/height)
-    let cx = Math.floor((p.x / canvas.width) * grid);
-    let cy = Math.floor((p.y / canvas.height) * grid);
+    // points are in CSS pixels (see getMousePos), not canvas buffer pixels
+    let cx = Math.floor((p.x / w) * grid);
+    let cy = Math.floor((p.y / h) * grid);
     cx = Math.max(0, Math.min(grid - 1, cx));
     cy = Math.max(0, Math.min(grid - 1, cy));
     counts[cy * grid + cx] += 1;
@@ -2588,16 +2656,39 @@ function validateMarkersPresentOnce() {
 }
 
 // ------------------ Autosave ------------------
+["pointerdown", "pointerup", "keydown", "input", "change", "drop"].forEach(ev =>
+  document.addEventListener(ev, () => { autosaveDirty = true; }, true));
+
+function applyBackpressure(res) {
+  const interval = parseInt(res.headers.get("X-Autosave-Interval-Ms"), 10);
+  if (interval > 0) autosaveIntervalMs = interval;
+  const retryAfter = parseInt(res.headers.get("Retry-After"), 10);
+  autosaveRetryAt = retryAfter > 0 ? Date.now() + retryAfter * 1000 : 0;
+}
+
+function scheduleAutoSave(delayMs) {
+  if (autoSaveTimer) clearTimeout(autoSaveTimer);
+  // +/-20% jitter so clients that loaded together don't keep saving in lockstep
+  autoSaveTimer = setTimeout(autoSaveTick, delayMs * (0.8 + Math.random() * 0.4));
+}
+
+async function autoSaveTick() {
+  if (autosaveDirty && Date.now() >= autosaveRetryAt) {
+    await saveCurrentTaskToBackend({ autosave: true });
+  }
+  scheduleAutoSave(Math.max(autosaveIntervalMs, autosaveRetryAt - Date.now()));
+}
+
 function startAutoSave() {
-  if (autoSaveTimer) clearInterval(autoSaveTimer);
-  autoSaveTimer = setInterval(() => {
-    saveCurrentTaskToBackend();
-  }, AUTOSAVE_INTERVAL_MS);
+  scheduleAutoSave(autosaveIntervalMs);
 }
 
-async function saveCurrentTaskToBackend() {
+async function saveCurrentTaskToBackend({ autosave = false } = {}) {
   const t = batch[state.tIdx];
   if (!t) return;
+  autosaveDirty = false;
+  // timer-driven saves may be refused (503) when the server is overloaded
+  const saveHeaders = autosave ? { "X-Autosave": "1" } : {};
   setSaveStatus("saving", "Saving...");
 
   const taskId = t.task_id;
@@ -2612,54 +2703,150 @@ async function saveCurrentTaskToBackend() {
     // upload an image that includes text overlays
     const png = exportPngWithText();
 
+    let result;
     if (!state.drawing_paths[taskId]) {
-      const result = await saveDrawingToBackend(taskId, png);
+      result = await saveDrawingToBackend(taskId, png, saveHeaders);
       if (result?.file) state.drawing_paths[taskId] = result.file;
     } else {
       // optional: if you want autosave to overwrite/update each time,
       // still call saveDrawingToBackend(taskId, png) and let backend replace it.
-      await saveDrawingToBackend(taskId, png);
+      result = await saveDrawingToBackend(taskId, png, saveHeaders);
+    }
+    if (result?.status === 503) {
+      autosaveDirty = true;
+      setSaveStatus("error", "Server busy. Will retry shortly.");
+      return;
     }
 
     m.timing.drawingDurationMs = performance.now() - m.timing.pageEnterMs;
   }
 
   const landmarks = state.landmarks[taskId] || [];
-
-  const payload = {
-    task_id: taskId,
-    landmarks,
-    drawing: state.drawings[taskId] || null,
-    task_metrics: m,
-    prolific_id: state.prolific?.pid || null
-  };
-
-  console.log("Sending save_answer payload:", payload);
+  const sync = metricsSyncFor(taskId);
 
   try {
-    await fetch(BASE + "/save_answer", {
-      method: "POST",
-      headers: {"Content-Type":"application/json"},
-      body: JSON.stringify(payload)
-    });
+    // a save that got no answer is resent unchanged first; the server drops it if it had landed
+    if (sync.pending) await postAnswer(taskId, sync.pending, saveHeaders);
+    sync.seq += 1;
+    sync.pending = {
+      seq: sync.seq,
+      landmarks,
+      task_metrics: metricsDelta(m, sync.acked),
+      snapshot: additiveSnapshot(m)
+    };
+    saveState();
+    await postAnswer(taskId, sync.pending, saveHeaders);
     setSaveStatus("saved", "All changes saved");
   } catch (err) {
     console.warn("save_answer failed:", err);
+    autosaveDirty = true;
     setSaveStatus("error", "Save failed. Will retry on next autosave.");
   }
 
   saveState();
 }
 
+/* ---------------- Sequenced metrics deltas ----------------
+   save_answer sends what changed since the last acknowledged save, numbered per task.
+   The server applies each (epoch, seq) once, so retries and duplicates are harmless. */
+const ADDITIVE_METRICS = {
+  timing: ["drawingDurationMs", "landmarkDurationMs"],
+  video: ["playCount", "pauseCount", "seekCount", "totalWatchTimeMs"],
+  interactions: ["addLandmark", "deleteLandmark", "reorderLandmark", "undo", "redo"],
+  drawing: ["strokeCount"]
+};
+
+function metricsSyncFor(taskId) {
+  if (!state.saveEpoch) {
+    state.saveEpoch = crypto.randomUUID
+      ? crypto.randomUUID().replace(/-/g, "")
+      : Date.now().toString(16) + Math.random().toString(16).slice(2, 18);
+  }
+  state.metricsSync = state.metricsSync || {};
+  if (!state.metricsSync[taskId]) state.metricsSync[taskId] = { seq: 0, acked: null, pending: null };
+  return state.metricsSync[taskId];
+}
+
+function additiveSnapshot(m) {
+  const snap = {};
+  for (const [group, keys] of Object.entries(ADDITIVE_METRICS)) {
+    snap[group] = {};
+    for (const k of keys) snap[group][k] = m[group]?.[k] ?? null;
+  }
+  return snap;
+}
+
+function metricsDelta(m, acked) {
+  // absolute fields (timestamps, maxWatchedTime, ...) are sent as they are
+  const delta = JSON.parse(JSON.stringify(m));
+  for (const [group, keys] of Object.entries(ADDITIVE_METRICS)) {
+    if (!delta[group]) continue;
+    for (const k of keys) {
+      if (m[group][k] == null) continue;
+      delta[group][k] = Math.max(0, m[group][k] - (acked?.[group]?.[k] || 0));
+    }
+  }
+  if (delta.drawing) {
+    // strokes finished since the acknowledged snapshot; points stay client-side
+    const ackedStrokes = acked?.drawing?.strokeCount || 0;
+    delta.drawing.strokes = (m.drawing.strokeLog || [])
+      .filter(s => s.n > ackedStrokes)
+      .map(({ t0, pts }) => ({ t0, pts }));
+    delete delta.drawing.strokeLog;
+    delete delta.drawing.points;
+    delete delta.drawing.pointsTotal;
+  }
+  return delta;
+}
+
+async function postAnswer(taskId, save, extraHeaders) {
+  const payload = {
+    task_id: taskId,
+    landmarks: save.landmarks,
+    drawing: state.drawings[taskId] || null,
+    task_metrics: save.task_metrics,
+    prolific_id: state.prolific?.pid || null,
+    seq: save.seq,
+    epoch: state.saveEpoch
+  };
+
+  console.log("Sending save_answer payload:", payload);
+
+  const saveStart = performance.now();
+  const res = await fetch(BASE + "/save_answer", {
+    method: "POST",
+    headers: {"Content-Type":"application/json", ...extraHeaders},
+    body: JSON.stringify(payload)
+  });
+  recordTiming("save_answer_rtt_ms", performance.now() - saveStart, taskId);
+  applyBackpressure(res);
+  if (!res.ok) throw new Error(`HTTP error! Status: ${res.status}`);
+
+  // applied, queued or a duplicate of one already applied: the server has this delta
+  const sync = metricsSyncFor(taskId);
+  sync.acked = save.snapshot;
+  const d = getTaskMetrics(taskId).drawing;
+  if (d && Array.isArray(d.strokeLog)) {
+    d.strokeLog = d.strokeLog.filter(s => s.n > (save.snapshot.drawing?.strokeCount || 0));
+  }
+  sync.pending = null;
+}
+
 /* Save drawing to backend (separate endpoint) */
-async function saveDrawingToBackend(task_id, base64image) {
+async function saveDrawingToBackend(task_id, base64image, extraHeaders = {}) {
   try {
+    const saveStart = performance.now();
     const res = await fetch(BASE + "/save_drawing", {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: { "Content-Type": "application/json", ...extraHeaders },
       body: JSON.stringify({ task_id: task_id, image: base64image })
     });
+    recordTiming("save_drawing_rtt_ms", performance.now() - saveStart, task_id);
+    applyBackpressure(res);
 
+    if (res.status === 503) {
+      return { success: false, status: 503, error: "Server busy" };
+    }
     if (!res.ok) {
       throw new Error(`HTTP error! Status: ${res.status}`);
     }
@@ -2676,11 +2863,14 @@ async function saveDrawingToBackend(task_id, base64image) {
 /* Save landmarks to backend (separate endpoint) */
 async function saveLandmarksToBackend(task_id, landmarks) {
   try {
-    await fetch(BASE + "/save_landmarks", {
+    const saveStart = performance.now();
+    const res = await fetch(BASE + "/save_landmarks", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ task_id: task_id, landmarks: landmarks })
     });
+    recordTiming("save_landmarks_rtt_ms", performance.now() - saveStart, task_id);
+    applyBackpressure(res);
   } catch (err) {
     console.warn("saveLandmarksToBackend failed:", err);
   }
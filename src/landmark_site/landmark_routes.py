@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+from flask import render_template, session, jsonify, request
+from flask_login import login_required, current_user
+from src.shared.answer_routes import apply_landmarks, write_landmarks_file
+from src.shared.models import db, Task
+
+
+def register_landmark_routes(app):
+    @app.route("/")
+    @login_required
+    def landmark_survey():
+        return render_template(
+            "landmark_survey.html",
+            user_id=session.get("user_id", ""),
+            study_id=session.get("study_id", "")
+        )
+
+    @app.route("/save_landmarks", methods=["POST"])
+    @login_required
+    def save_landmarks():
+        data = request.json or {}
+        task_id = data.get("task_id")
+        landmarks = data.get("landmarks", [])
+
+        if not task_id:
+            return jsonify(success=False, error="Invalid payload"), 400
+
+        ts = datetime.now(timezone.utc)
+        task = Task.query.get(task_id)
+        if not task:
+            return jsonify(success=False, error="Unknown task_id"), 400
+
+        ingest = app.extensions.get("ingest")
+        if ingest is not None:
+            ingest.enqueue("landmarks", current_user.id, task.id, {"landmarks": landmarks, "ts": ts.isoformat()})
+            return jsonify(success=True, landmarks=landmarks, queued=True), 202
+
+        apply_landmarks(current_user.id, task, landmarks, ts)
+        db.session.commit()
+
+        write_landmarks_file(current_user.id, [{"task_id": task_id, "landmarks": landmarks, "timestamp": ts.isoformat()}])
+
+        return jsonify(success=True, landmarks=landmarks)
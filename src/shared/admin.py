@@ -0,0 +1,19 @@
+import functools
+import hmac
+from flask import abort, current_app, request
+
+
+def admin_required(view):
+    """
+    Serve the view only to requests whose X-Admin-Token header matches ADMIN_TOKEN.
+    Anything else, or every request while ADMIN_TOKEN is unset, gets a 404, so the
+    admin endpoints don't reveal that they exist.
+    """
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        token = current_app.config.get("ADMIN_TOKEN")
+        given = request.headers.get("X-Admin-Token", "")
+        if not token or not hmac.compare_digest(given, token):
+            abort(404)
+        return view(*args, **kwargs)
+    return wrapped
@@ -0,0 +1,230 @@
+"""
+Inter-annotator agreement on landmark orderings. A task's orderings are encoded as one
+integer rank matrix R (annotators x labels, -1 where an annotator did not list a label),
+and every pairwise statistic is computed for all annotator pairs at once:
+
+    kendall     normalised Kendall tau distance over the labels both annotators ranked
+                (0 = same relative order, 1 = reversed)
+    lcs         longest common subsequence / the longer ordering's length
+    positional  labels at the same index / the longer ordering's length
+
+Labels are compared whitespace- and case-insensitively. Results are kept per task in
+LandmarkAgreement, with a consensus ordering (Copeland ranking of the labels at least
+half the annotators used). refresh() recomputes only tasks that got Landmark saves
+since they were last computed.
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from flask import jsonify, request
+from sqlalchemy import func, or_
+from src.shared.models import db, Task, Landmark, LandmarkAgreement
+from src.shared.admin import admin_required
+
+MIN_SUPPORT = 0.5
+# a save stamped just before a refresh may commit after the refresh read the task's rows
+SETTLE_SECONDS = 30
+
+
+def normalize(label):
+    return " ".join(label.split()).casefold()
+
+
+def encode(orderings):
+    """
+    (R, labels): R[a, v] is the index of label v in annotator a's ordering, -1 if absent.
+    Blank and repeated labels are dropped; labels[v] is the most common spelling.
+    """
+    vocab, spellings, seqs = {}, [], []
+    for order in orderings:
+        seq = []
+        for raw in order if isinstance(order, list) else ():
+            if not isinstance(raw, str) or not normalize(raw):
+                continue
+            v = vocab.setdefault(normalize(raw), len(vocab))
+            if v == len(spellings):
+                spellings.append(Counter())
+            if v in seq:
+                continue
+            spellings[v][raw.strip()] += 1
+            seq.append(v)
+        seqs.append(seq)
+    R = np.full((len(seqs), len(vocab)), -1, dtype=np.int32)
+    for a, seq in enumerate(seqs):
+        R[a, seq] = np.arange(len(seq), dtype=np.int32)
+    return R, [c.most_common(1)[0][0] for c in spellings]
+
+
+def precedence(R):
+    """S[a, i, j]: +1 if annotator a put label i before j, -1 if after, 0 unless a ranked both."""
+    present = R >= 0
+    S = np.sign(R[:, None, :] - R[:, :, None]).astype(np.int8)
+    return S * (present[:, :, None] & present[:, None, :])
+
+
+def _lcs_lengths(A, B):
+    """LCS length of each row pair of A and B (padded with values that never match), one DP for all pairs."""
+    pairs, L = A.shape
+    prev = np.zeros((pairs, L + 1), dtype=np.int32)
+    for i in range(L):
+        cur = np.zeros_like(prev)
+        match = A[:, i, None] == B
+        for j in range(L):
+            cur[:, j + 1] = np.where(match[:, j], prev[:, j] + 1, np.maximum(prev[:, j + 1], cur[:, j]))
+        prev = cur
+    return prev[:, L]
+
+
+def pairwise(R):
+    """(ia, ib, kendall, lcs, positional) over all annotator pairs ia < ib; kendall is NaN without shared pairs."""
+    n, V = R.shape
+    ia, ib = np.triu_indices(n, 1)
+    lengths = (R >= 0).sum(1)
+    longest = np.maximum(lengths[ia], lengths[ib]).astype(np.float64)
+
+    iu, ju = np.triu_indices(V, 1)
+    F = precedence(R)[:, iu, ju].astype(np.float64)
+    signed = (F @ F.T)[ia, ib]  # concordant - discordant
+    absF = np.abs(F)
+    comparable = (absF @ absF.T)[ia, ib]  # concordant + discordant
+    with np.errstate(invalid="ignore", divide="ignore"):
+        kendall = np.where(comparable > 0, (comparable - signed) / (2.0 * comparable), np.nan)
+        same = ((R[ia] == R[ib]) & (R[ia] >= 0)).sum(1)
+        positional = np.where(longest > 0, same / longest, np.nan)
+
+        # orderings as padded label-id sequences for the LCS
+        L = int(lengths.max()) if n else 0
+        Q = np.full((n, L), -1, dtype=np.int32)
+        rows, cols = np.nonzero(R >= 0)
+        Q[rows, R[rows, cols]] = cols
+        B = np.where(Q[ib] >= 0, Q[ib], -2)
+        lcs = np.where(longest > 0, _lcs_lengths(Q[ia], B) / longest, np.nan)
+    return ia, ib, kendall, lcs, positional
+
+
+def consensus(R, labels, min_support=MIN_SUPPORT):
+    """
+    (ordering, support) of the labels used by at least min_support of the annotators,
+    ranked by Copeland score (pairwise majority wins), ties broken by mean relative position.
+    """
+    if not len(R):
+        return [], []
+    present = R >= 0
+    support = present.mean(0)
+    keep = np.flatnonzero(support >= min_support)
+    if not len(keep):
+        return [], []
+    S = precedence(R[:, keep])
+    before = (S > 0).sum(0)
+    wins = (before > before.T).sum(1)
+    span = np.maximum(present.sum(1) - 1, 1)[:, None]
+    with np.errstate(invalid="ignore"):
+        rel = np.where(present[:, keep], R[:, keep] / span, np.nan)
+        mean_pos = np.nanmean(rel, 0)
+    order = np.lexsort((mean_pos, -wins))
+    return [labels[keep[k]] for k in order], [round(float(support[keep[k]]), 3) for k in order]
+
+
+def _mean(a):
+    a = a[~np.isnan(a)]
+    return round(float(a.mean()), 4) if len(a) else None
+
+
+def compute(task_id):
+    """Recompute one task's LandmarkAgreement row from its Landmark rows (the caller commits)."""
+    started = datetime.now(timezone.utc)
+    rows = db.session.query(Landmark.user_id, Landmark.landmarks).filter(Landmark.task_id == task_id).order_by(Landmark.user_id).all()
+    R, labels = encode([lm for _, lm in rows])
+    R = R[(R >= 0).any(1)] if len(R) else R
+    ia, ib, kendall, lcs, positional = pairwise(R)
+    ordering, support = consensus(R, labels)
+
+    row = db.session.get(LandmarkAgreement, task_id)
+    if row is None:
+        row = LandmarkAgreement(task_id=task_id)
+        db.session.add(row)
+    row.annotators = int(len(R))
+    row.pairs = int(len(ia))
+    row.kendall_distance = _mean(kendall)
+    row.lcs = _mean(lcs)
+    row.positional = _mean(positional)
+    row.consensus = ordering
+    row.support = support
+    row.computed_at = started - timedelta(seconds=SETTLE_SECONDS)
+    return row
+
+
+def stale_task_ids():
+    """Tasks with Landmark rows saved since their agreement was computed (or never computed)."""
+    latest = (
+        db.session.query(Landmark.task_id, func.max(Landmark.timestamp).label("ts"))
+        .group_by(Landmark.task_id).subquery()
+    )
+    q = (
+        db.session.query(latest.c.task_id)
+        .outerjoin(LandmarkAgreement, LandmarkAgreement.task_id == latest.c.task_id)
+        .filter(or_(LandmarkAgreement.computed_at.is_(None), latest.c.ts > LandmarkAgreement.computed_at))
+        .order_by(latest.c.task_id)
+    )
+    return [tid for (tid,) in q]
+
+
+def refresh(task_ids=None, batch_size=200):
+    """Recompute stale tasks (or the given ones), committing per batch. Yields the running count."""
+    task_ids = stale_task_ids() if task_ids is None else list(task_ids)
+    for start in range(0, len(task_ids), batch_size):
+        for task_id in task_ids[start:start + batch_size]:
+            compute(task_id)
+        db.session.commit()
+        yield min(start + batch_size, len(task_ids))
+
+
+def summarize(row, route_id):
+    return {
+        "route_id": route_id,
+        "task_id": row.task_id,
+        "annotators": row.annotators,
+        "pairs": row.pairs,
+        "kendall_distance": row.kendall_distance,
+        "lcs": row.lcs,
+        "positional": row.positional,
+        "consensus": row.consensus,
+        "support": row.support,
+    }
+
+
+def pair_details(task_id):
+    """Per-pair statistics for one task, by user id."""
+    rows = db.session.query(Landmark.user_id, Landmark.landmarks).filter(Landmark.task_id == task_id).order_by(Landmark.user_id).all()
+    R, _ = encode([lm for _, lm in rows])
+    users = [u for (u, _), used in zip(rows, (R >= 0).any(1)) if used]
+    R = R[(R >= 0).any(1)] if len(R) else R
+    ia, ib, kendall, lcs, positional = pairwise(R)
+
+    def _f(x):
+        return None if np.isnan(x) else round(float(x), 4)
+
+    return [
+        {"users": [users[a], users[b]], "kendall_distance": _f(k), "lcs": _f(c), "positional": _f(p)}
+        for a, b, k, c, p in zip(ia, ib, kendall, lcs, positional)
+    ]
+
+
+def register_agreement_routes(app):
+    @app.route("/admin/agreement")
+    @admin_required
+    def admin_agreement():
+        """?route_id=... (&pairs=1 for per-annotator-pair statistics); recomputed if stale."""
+        route_id = request.args.get("route_id")
+        task = Task.query.filter_by(route_id=route_id).first() if route_id else None
+        if task is None:
+            return jsonify({"status": "error", "message": "unknown route"}), 404
+        row = db.session.get(LandmarkAgreement, task.id)
+        latest = db.session.query(func.max(Landmark.timestamp)).filter(Landmark.task_id == task.id).scalar()
+        if row is None or (latest is not None and latest > row.computed_at):
+            row = compute(task.id)
+            db.session.commit()
+        out = summarize(row, route_id)
+        if request.args.get("pairs") == "1":
+            out["pair_stats"] = pair_details(task.id)
+        return jsonify(out)
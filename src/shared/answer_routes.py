@@ -3,7 +3,10 @@ import os
 from datetime import datetime, timezone
 from flask import request, jsonify
 from flask_login import login_required, current_user
-from src.shared.models import db, Task, Drawing, Landmark
+from src.shared.models import db, Task, Drawing, Landmark, SaveSequence
+from src.shared import effort, task_stats
+from src.shared.strokes import append_strokes
+from src.shared.pairing import record_annotation
 
 
 def _safe_float(x, default=0.0):
@@ -49,6 +52,8 @@ def _merge_metrics(prev: dict, incoming: dict) -> dict:
                 _safe_float(out["video"].get("maxWatchedTime"), 0.0),
                 _safe_float(inc_v.get("maxWatchedTime"), 0.0),
             )
+        if inc_v.get("durationSec") is not None:
+            out["video"]["durationSec"] = inc_v.get("durationSec")
         if "lastPlayStartedMs" in inc_v:
             out["video"]["lastPlayStartedMs"] = inc_v.get("lastPlayStartedMs")
 
@@ -68,6 +73,10 @@ def _merge_metrics(prev: dict, incoming: dict) -> dict:
         if inc_d.get("strokeCount") is not None:
             out["drawing"]["strokeCount"] = _safe_int(out["drawing"].get("strokeCount"), 0) + _safe_int(inc_d.get("strokeCount"), 0)
 
+        for k in ["canvasW", "canvasH"]:
+            if inc_d.get(k) is not None:
+                out["drawing"][k] = inc_d.get(k)
+
         for k in ["firstStrokeMs", "lastStrokeMs"]:
             if inc_d.get(k) is not None:
                 if k == "firstStrokeMs":
@@ -81,9 +90,220 @@ def _merge_metrics(prev: dict, incoming: dict) -> dict:
             merged_pts = prev_pts + inc_d.get("points")
             out["drawing"]["points"] = merged_pts[-2000:]
 
+        # packed into StrokeChunk rows by apply_answer, never kept here; concatenated so saves
+        # coalesced by the ingest queue keep every stroke
+        if isinstance(inc_d.get("strokes"), list):
+            prev_strokes = out["drawing"].get("strokes") if isinstance(out["drawing"].get("strokes"), list) else []
+            out["drawing"]["strokes"] = prev_strokes + inc_d.get("strokes")
+
     return out
 
 
+def normalize_task_metrics(ans: dict) -> dict:
+    """The task_metrics block of a save_answer payload, rebuilt from the legacy fields if absent."""
+    incoming_task_metrics = ans.get("task_metrics")
+    if isinstance(incoming_task_metrics, dict):
+        return incoming_task_metrics
+    incoming_task_metrics = {}
+
+    metrics_in = ans.get("metrics")
+    if isinstance(metrics_in, dict):
+        duration = _safe_float(metrics_in.get("durationMs"), 0.0)
+        incoming_task_metrics["timing"] = {"drawingDurationMs": duration}
+        incoming_task_metrics["interactions"] = {}
+        incoming_task_metrics["video"] = {}
+        cc = metrics_in.get("clickCounts") if isinstance(metrics_in.get("clickCounts"), dict) else {}
+        if cc:
+            incoming_task_metrics["legacy_clickCounts"] = {k: _safe_int(v, 0) for k, v in cc.items()}
+    else:
+        drawing_dur = _safe_float(ans.get("drawing_duration_ms"), 0.0)
+        landmark_dur = _safe_float(ans.get("landmark_duration_ms"), 0.0)
+        incoming_task_metrics["timing"] = {
+            "drawingDurationMs": drawing_dur,
+            "landmarkDurationMs": landmark_dur,
+        }
+        cc = ans.get("click_counts") if isinstance(ans.get("click_counts"), dict) else {}
+        if cc:
+            incoming_task_metrics["legacy_clickCounts"] = {k: _safe_int(v, 0) for k, v in cc.items()}
+    return incoming_task_metrics
+
+
+def parse_sequence(ans: dict):
+    """
+    (epoch, seq) of a sequenced save_answer, None for a legacy one. Sequenced saves carry
+    per-task deltas numbered from 1 within a client epoch (a random id kept with the
+    client's state); legacy saves are merged as they always were. Raises ValueError.
+    """
+    if ans.get("seq") is None:
+        return None
+    epoch = ans.get("epoch")
+    if not isinstance(epoch, str) or not 0 < len(epoch) <= 32:
+        raise ValueError("epoch must be a string of 1-32 characters")
+    if isinstance(ans["seq"], bool) or not isinstance(ans["seq"], int) or ans["seq"] < 1:
+        raise ValueError("seq must be a positive integer")
+    return epoch, ans["seq"]
+
+
+def claim_sequence(study, user_id, task_id, epoch, seq) -> bool:
+    """
+    Move the epoch's high-water mark to seq in the current transaction. False if this
+    save or a later one from the same epoch was already applied; the guarded UPDATE
+    makes a retry that races its original lose cleanly.
+    """
+    now = datetime.now(timezone.utc)
+    moved = SaveSequence.query.filter(
+        SaveSequence.study == study,
+        SaveSequence.user_id == user_id,
+        SaveSequence.task_id == task_id,
+        SaveSequence.epoch == epoch,
+        SaveSequence.seq < seq,
+    ).update({"seq": seq, "updated_at": now}, synchronize_session=False)
+    if moved:
+        return True
+    if db.session.get(SaveSequence, (study, user_id, task_id, epoch)) is not None:
+        return False
+    db.session.add(SaveSequence(study=study, user_id=user_id, task_id=task_id, epoch=epoch, seq=seq, updated_at=now))
+    return True
+
+
+def apply_answer(mode, user_id, task_id, landmarks, incoming_task_metrics, ts):
+    """Stage a save_answer on the session (the caller commits); returns the Drawing/Landmark row."""
+    if mode == "draw":
+        entry = Drawing.query.filter_by(user_id=user_id, task_id=task_id).first()
+        if not entry:
+            entry = Drawing(user_id=user_id, task_id=task_id, timestamp=ts)
+            db.session.add(entry)
+    else:
+        entry = Landmark.query.filter_by(user_id=user_id, task_id=task_id).first()
+        if not entry:
+            entry = Landmark(user_id=user_id, task_id=task_id, timestamp=ts)
+            db.session.add(entry)
+            record_annotation(user_id, task_id)
+        entry.landmarks = landmarks
+
+    entry.timestamp = ts
+
+    prev_metrics = {}
+    try:
+        prev_metrics = json.loads(entry.metrics_json) if entry.metrics_json else {}
+        if not isinstance(prev_metrics, dict):
+            prev_metrics = {}
+    except Exception:
+        prev_metrics = {}
+
+    new_strokes = None
+    inc_d = incoming_task_metrics.get("drawing") if isinstance(incoming_task_metrics, dict) else None
+    if isinstance(inc_d, dict) and "strokes" in inc_d:
+        # popped in place so the answer-file mirror doesn't carry them either
+        new_strokes = append_strokes(mode, user_id, task_id, inc_d.pop("strokes"))
+
+    stats_before = task_stats.contribution(mode, prev_metrics if entry.metrics_json else None)
+    merged = _merge_metrics(prev_metrics, incoming_task_metrics)
+    entry.metrics_json = json.dumps(merged)
+    task_stats.record_answer(mode, task_id, stats_before, task_stats.contribution(mode, merged))
+    effort.score_answer(mode, user_id, task_id, merged, new_strokes)
+    return entry
+
+
+def write_answer_file(user_id, hit_id, mode, saves, routes_data):
+    """
+    Mirror saves into user_answers/<user_id>_answers.json. `saves` is a list of dicts
+    with task_id, route_id, drawing_path, landmarks, task_metrics and timestamp.
+    """
+    save_dir = "user_answers"
+    os.makedirs(save_dir, exist_ok=True)
+    filename = os.path.join(save_dir, f"{user_id}_answers.json")
+
+    data = []
+    if os.path.exists(filename):
+        with open(filename, "r") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                data = []
+
+    for save in saves:
+        task_id = save["task_id"]
+        route_info = routes_data.get(save["route_id"]) or {}
+        map_url = route_info.get("map")
+        video = f"{save['route_id']}.mp4"
+
+        entry_data = next((d for d in data if d.get("task_id") == task_id), None)
+        if not entry_data:
+            entry_data = {
+                "task_id": task_id,
+                "drawing_path": save["drawing_path"],
+                "landmarks": save["landmarks"],
+                "mode": mode,
+                "task_metrics": save["task_metrics"],
+                "timestamp": save["timestamp"],
+                "prolific": hit_id,
+                "map_url": map_url,
+                "video": video,
+            }
+            data.append(entry_data)
+        else:
+            entry_data["landmarks"] = save["landmarks"]
+            entry_data["mode"] = mode
+            entry_data["map_url"] = map_url
+            entry_data["video"] = video
+            prev_file_metrics = entry_data.get("task_metrics") if isinstance(entry_data.get("task_metrics"), dict) else {}
+            entry_data["task_metrics"] = _merge_metrics(prev_file_metrics, save["task_metrics"])
+            entry_data["timestamp"] = save["timestamp"]
+
+    with open(filename, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def apply_landmarks(user_id, task, landmarks, ts):
+    """Stage a save_landmarks on the session (the caller commits)."""
+    entry = Landmark.query.filter_by(user_id=user_id, task_id=task.id).first()
+    if entry:
+        entry.landmarks = landmarks
+        entry.timestamp = ts
+    else:
+        task.served_count_landmarks += 1
+        entry = Landmark(
+            user_id=user_id,
+            task_id=task.id,
+            landmarks=landmarks,
+            timestamp=ts,
+        )
+        db.session.add(entry)
+        record_annotation(user_id, task.id)
+    return entry
+
+
+def write_landmarks_file(user_id, saves):
+    """Mirror saves (dicts with task_id, landmarks, timestamp) into user_landmarks/<user_id>_landmarks.json."""
+    save_dir = "user_landmarks"
+    os.makedirs(save_dir, exist_ok=True)
+    filename = os.path.join(save_dir, f"{user_id}_landmarks.json")
+
+    file_data = []
+    if os.path.exists(filename):
+        with open(filename, "r") as f:
+            try:
+                file_data = json.load(f)
+            except json.JSONDecodeError:
+                file_data = []
+
+    for save in saves:
+        existing_entry = next((d for d in file_data if d.get("task_id") == save["task_id"]), None)
+        if not existing_entry:
+            file_data.append({
+                "task_id": save["task_id"],
+                "landmarks": save["landmarks"],
+                "timestamp": save["timestamp"],
+            })
+        else:
+            existing_entry["landmarks"] = save["landmarks"]
+            existing_entry["timestamp"] = save["timestamp"]
+
+    with open(filename, "w") as f:
+        json.dump(file_data, f, indent=2)
+
+
 def register_answer_routes(app):
     @app.route("/save_answer", methods=["POST"])
     @login_required
@@ -101,99 +321,42 @@ def register_answer_routes(app):
         if not task:
             return jsonify({"status": "failed - unknown task_id"}), 400
 
-        incoming_task_metrics = ans.get("task_metrics")
-        if not isinstance(incoming_task_metrics, dict):
-            incoming_task_metrics = {}
-
-            metrics_in = ans.get("metrics")
-            if isinstance(metrics_in, dict):
-                duration = _safe_float(metrics_in.get("durationMs"), 0.0)
-                incoming_task_metrics["timing"] = {"drawingDurationMs": duration}
-                incoming_task_metrics["interactions"] = {}
-                incoming_task_metrics["video"] = {}
-                cc = metrics_in.get("clickCounts") if isinstance(metrics_in.get("clickCounts"), dict) else {}
-                if cc:
-                    incoming_task_metrics["legacy_clickCounts"] = {k: _safe_int(v, 0) for k, v in cc.items()}
-            else:
-                drawing_dur = _safe_float(ans.get("drawing_duration_ms"), 0.0)
-                landmark_dur = _safe_float(ans.get("landmark_duration_ms"), 0.0)
-                incoming_task_metrics["timing"] = {
-                    "drawingDurationMs": drawing_dur,
-                    "landmarkDurationMs": landmark_dur,
-                }
-                cc = ans.get("click_counts") if isinstance(ans.get("click_counts"), dict) else {}
-                if cc:
-                    incoming_task_metrics["legacy_clickCounts"] = {k: _safe_int(v, 0) for k, v in cc.items()}
-
-        mode = app.config.get("APP_MODE")
-        if mode == "draw":
-            entry = Drawing.query.filter_by(user_id=current_user.id, task_id=task_id).first()
-            if not entry:
-                entry = Drawing(user_id=current_user.id, task_id=task_id, timestamp=ts)
-                db.session.add(entry)
-        else:
-            entry = Landmark.query.filter_by(user_id=current_user.id, task_id=task_id).first()
-            if not entry:
-                entry = Landmark(user_id=current_user.id, task_id=task_id, timestamp=ts)
-                db.session.add(entry)
-            entry.landmarks = landmarks
-
-        entry.timestamp = ts
-
-        prev_metrics = {}
         try:
-            prev_metrics = json.loads(entry.metrics_json) if entry.metrics_json else {}
-            if not isinstance(prev_metrics, dict):
-                prev_metrics = {}
-        except Exception:
-            prev_metrics = {}
+            sequence = parse_sequence(ans)
+        except ValueError as e:
+            return jsonify({"status": f"failed - {e}"}), 400
 
-        merged = _merge_metrics(prev_metrics, incoming_task_metrics)
-        entry.metrics_json = json.dumps(merged)
-
-        db.session.commit()
-
-        save_dir = "user_answers"
-        os.makedirs(save_dir, exist_ok=True)
-        filename = os.path.join(save_dir, f"{current_user.id}_answers.json")
-
-        data = []
-        if os.path.exists(filename):
-            with open(filename, "r") as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError:
-                    data = []
-
-        routes_data = app.extensions.get("routes_data") or {}
-        route_info = routes_data.get(task.route_id) or {}
-        map_url = route_info.get("map")
-        video = f"{task.route_id}.mp4"
+        incoming_task_metrics = normalize_task_metrics(ans)
+        mode = app.config.get("APP_MODE")
 
-        entry_data = next((d for d in data if d.get("task_id") == task_id), None)
-        if not entry_data:
-            entry_data = {
-                "task_id": task_id,
-                "drawing_path": getattr(entry, "drawing_path", None),
-                "landmarks": landmarks,
+        ingest = app.extensions.get("ingest")
+        if ingest is not None:
+            ingest.enqueue("answer", current_user.id, task.id, {
                 "mode": mode,
+                "landmarks": landmarks,
                 "task_metrics": incoming_task_metrics,
-                "timestamp": ts.isoformat(),
-                "prolific": current_user.hit_id,
-                "map_url": map_url,
-                "video": video,
-            }
-            data.append(entry_data)
-        else:
-            entry_data["landmarks"] = landmarks
-            entry_data["mode"] = mode
-            entry_data["map_url"] = map_url
-            entry_data["video"] = video
-            prev_file_metrics = entry_data.get("task_metrics") if isinstance(entry_data.get("task_metrics"), dict) else {}
-            entry_data["task_metrics"] = _merge_metrics(prev_file_metrics, incoming_task_metrics)
-            entry_data["timestamp"] = ts.isoformat()
+                "ts": ts.isoformat(),
+                "hit_id": current_user.hit_id,
+                "sequence": sequence,
+            })
+            return jsonify({"status": "queued"}), 202
+
+        if sequence is not None and not claim_sequence(mode, current_user.id, task.id, *sequence):
+            db.session.rollback()
+            return jsonify({"status": "duplicate", "seq": sequence[1]})
+
+        entry = apply_answer(mode, current_user.id, task_id, landmarks, incoming_task_metrics, ts)
+        # read before the commit expires them, which would reload each with its own query
+        route_id, drawing_path = task.route_id, getattr(entry, "drawing_path", None)
+        db.session.commit()
 
-        with open(filename, "w") as f:
-            json.dump(data, f, indent=2)
+        write_answer_file(current_user.id, current_user.hit_id, mode, [{
+            "task_id": task_id,
+            "route_id": route_id,
+            "drawing_path": drawing_path,
+            "landmarks": landmarks,
+            "task_metrics": incoming_task_metrics,
+            "timestamp": ts.isoformat(),
+        }], app.extensions.get("routes_data") or {})
 
         return jsonify({"status": "ok"})
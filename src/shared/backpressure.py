@@ -0,0 +1,135 @@
+import math
+import threading
+import time
+from flask import g, jsonify, request
+from src.shared.metrics import SAVE_ENDPOINTS
+from src.shared.models import db
+
+
+class AutosavePacer:
+    """
+    Tells autosaving clients how often to come back. Every save response carries
+    X-Autosave-Interval-Ms, derived from a pressure figure where 1.0 means "at the limit":
+    the largest of save latency (EWMA) over its target, DB pool saturation, and the async
+    ingest backlog over its high-water mark.
+
+        interval = base * max(1, pressure / 0.5) ** 2, capped at max
+
+    so clients keep the base interval until half-way to the limit and then back off
+    smoothly. From pressure 1.0 responses also carry Retry-After; from shed_pressure,
+    timer-driven saves (X-Autosave: 1) are refused with 503 before doing any work.
+    Saves the participant triggers by navigating are never refused.
+
+    Pressure is recomputed at most every refresh_seconds, so the ingest backlog query
+    runs once a second per worker rather than once per save. The latency term decays by
+    exp(-dt / decay_seconds) with the time since the last served save: while every save
+    is shed, nothing is observed, and without the decay shedding could outlast the load.
+    """
+
+    def __init__(self, app, base_ms=10000, max_ms=60000, target_ms=250.0, queue_high=5000,
+                 shed_pressure=1.5, refresh_seconds=1.0, alpha=0.2, decay_seconds=10.0):
+        self.app = app
+        self.base_ms = base_ms
+        self.max_ms = max_ms
+        self.target_ms = target_ms
+        self.queue_high = queue_high
+        self.shed_pressure = shed_pressure
+        self.refresh_seconds = refresh_seconds
+        self.alpha = alpha
+        self.decay_seconds = decay_seconds
+        self.latency_ms = 0.0
+        self._observed_at = time.monotonic()
+        self.pressure = 0.0
+        self._computed_at = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, duration_ms):
+        # a lost update under contention only skews one sample of the average
+        now = time.monotonic()
+        self.latency_ms = self._decayed_latency(now)
+        self.latency_ms += self.alpha * (duration_ms - self.latency_ms)
+        self._observed_at = now
+
+    def _decayed_latency(self, now):
+        if self.decay_seconds <= 0:
+            return self.latency_ms
+        return self.latency_ms * math.exp(-max(0.0, now - self._observed_at) / self.decay_seconds)
+
+    def _pool_saturation(self):
+        pool = db.engine.pool
+        if not (hasattr(pool, "checkedout") and hasattr(pool, "size")):
+            return 0.0
+        capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+        return pool.checkedout() / capacity if capacity > 0 else 0.0
+
+    def _ingest_pressure(self):
+        ingest = self.app.extensions.get("ingest")
+        if ingest is None or self.queue_high <= 0:
+            return 0.0
+        return ingest.depth() / self.queue_high
+
+    def current_pressure(self):
+        if time.monotonic() - self._computed_at < self.refresh_seconds:
+            return self.pressure
+        if self._lock.acquire(blocking=False):
+            try:
+                now = time.monotonic()
+                self.pressure = max(
+                    self._decayed_latency(now) / self.target_ms if self.target_ms > 0 else 0.0,
+                    self._pool_saturation(),
+                    self._ingest_pressure(),
+                )
+                self._computed_at = now
+            finally:
+                self._lock.release()
+        return self.pressure
+
+    def interval_ms(self, pressure):
+        return int(min(self.max_ms, self.base_ms * max(1.0, pressure / 0.5) ** 2))
+
+    def decorate(self, response, pressure):
+        interval = self.interval_ms(pressure)
+        response.headers["X-Autosave-Interval-Ms"] = str(interval)
+        if pressure >= 1.0:
+            response.headers["Retry-After"] = str(math.ceil(interval / 1000.0))
+        return response
+
+
+def init_backpressure(app):
+    """Attach the pacer to the save endpoints; see AutosavePacer."""
+    pacer = AutosavePacer(
+        app,
+        base_ms=app.config["AUTOSAVE_INTERVAL_MS"],
+        max_ms=app.config["AUTOSAVE_MAX_INTERVAL_MS"],
+        target_ms=app.config["AUTOSAVE_TARGET_MS"],
+        queue_high=app.config["AUTOSAVE_QUEUE_HIGH"],
+        shed_pressure=app.config["AUTOSAVE_SHED_PRESSURE"],
+    )
+    app.extensions["autosave_pacer"] = pacer
+
+    def _is_save():
+        rule = request.url_rule
+        return rule is not None and rule.rule in SAVE_ENDPOINTS
+
+    @app.before_request
+    def _pace_start():
+        if not _is_save():
+            return None
+        pressure = pacer.current_pressure()
+        if request.headers.get("X-Autosave") == "1" and pressure >= pacer.shed_pressure:
+            metrics = app.extensions.get("metrics")
+            if metrics is not None:
+                metrics.inc("autosaves_shed_total", (("endpoint", request.url_rule.rule),))
+            return pacer.decorate(jsonify(success=False, error="busy", retry=True), pressure), 503
+        g._pace_start = time.perf_counter()
+        return None
+
+    @app.after_request
+    def _pace_record(response):
+        start = g.pop("_pace_start", None)
+        if start is None:
+            return response
+        pacer.observe((time.perf_counter() - start) * 1000.0)
+        return pacer.decorate(response, pacer.current_pressure())
+
+    return pacer
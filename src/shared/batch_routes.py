@@ -1,45 +1,59 @@
-import os, base64
+import base64
 from flask import jsonify
 from flask_login import login_required, current_user
 from sqlalchemy import func
-from src.shared.models import db, Task, Drawing, Landmark, User
+from src.shared.models import db, Task, Drawing, User
+from src.shared.drawing_store import drawing_key
+from src.shared import pairing
 
 NUM_TASKS_PER_BATCH = 6
-def register_batch_routes(app):
-    routes_data = app.extensions["routes_data"]
 
-    def make_trajectory(t):
-        images = [f"{image_filename}" for image_filename in routes_data[t.route_id]["observations"]]
-        return {
-            "task_id": t.id,
-            "route_id": t.route_id,
-            "map_url": f"{routes_data[t.route_id]['map']}",
-            "images": images,
-            "video": f"{t.route_id}.mp4",
-            "landmarks": t.landmarks,
-            "endpoint_order": t.endpoints,
-        }
+def make_trajectory(t, routes_data):
+    images = [f"{image_filename}" for image_filename in routes_data[t.route_id]["observations"]]
+    return {
+        "task_id": t.id,
+        "route_id": t.route_id,
+        "map_url": f"{routes_data[t.route_id]['map']}",
+        "images": images,
+        "video": f"{t.route_id}.mp4",
+        "landmarks": t.landmarks,
+        "endpoint_order": t.endpoints,
+    }
+
+def register_batch_routes(app):
+    reloader = app.extensions["routes_reloader"]
+    media_index = app.extensions["media_index"]
+    drawing_store = app.extensions["drawing_store"]
+    user_cache = app.extensions["user_cache"]
 
     @app.route("/next_batch")
     @login_required
     def next_batch():
         mode = app.config["APP_MODE"]
+        routes_data = app.extensions["routes_data"]  # one snapshot per request; swapped on reload
 
         # --- pick tasks ---
-        if current_user.inflight_batch:
-            tasks = db.session.query(Task).filter(Task.id.in_(current_user.last_batch)).all()
+        # the cached snapshot may predate another worker handing out or completing a batch
+        user = user_cache.refresh(current_user.id)
+        if user is None:
+            return jsonify({"status": "failed - unknown user"}), 401
+        if user.inflight_batch:
+            tasks = db.session.query(Task).filter(Task.id.in_(user.last_batch)).all()
+            # routes removed from the routes file since the batch was handed out are dropped
+            tasks = [t for t in tasks if t.route_id in routes_data]
         else:
-            if mode == "draw":
-                subq = db.session.query(Drawing.task_id).filter_by(user_id=current_user.id)
-            else:
-                subq = db.session.query(Landmark.task_id).filter_by(user_id=current_user.id)
+            # routes whose map/observations/video are missing would only fail in the browser;
+            # routes removed from the routes file keep their tasks but are not scheduled
+            unavailable = media_index.unavailable_route_ids(routes_data) | reloader.retired
 
             if mode == "draw":
                 # draw study: pick routes user hasn't answered
+                subq = db.session.query(Drawing.task_id).filter_by(user_id=current_user.id)
                 least_id_per_route = (
                     db.session.query(Task.route_id, func.max(Task.id).label("max_id"))
                     .filter(Task.served_count_draw == 0)
                     .filter(~Task.id.in_(subq))
+                    .filter(~Task.route_id.in_(unavailable))
                     .group_by(Task.route_id)
                     .subquery()
                 )
@@ -52,64 +66,69 @@ def register_batch_routes(app):
                 )
 
             else:
-                # landmark study: pick tasks that HAVE a drawing from someone,
-                # and that THIS user hasn't already landmarked.
-                # This assumes a Drawing row exists when a drawing is saved.
-                drawn_task_ids = (
-                    db.session.query(Drawing.task_id)
-                    .filter(Drawing.drawing_path.isnot(None))
-                    .distinct()
-                    .subquery()
-                )
-                tasks = (
-                    Task.query
-                    .filter(Task.id.in_(drawn_task_ids))
-                    .filter(Task.served_count_landmarks == 0)
-                    .filter(~Task.id.in_(subq))  # user hasn't responded to these tasks yet
-                    .order_by(Task.route_id)
-                    .limit(NUM_TASKS_PER_BATCH)
-                    .all()
+                # landmark study: one (drawing, annotator) slot per task, best drawings and
+                # least-covered first; see src/shared/pairing.py
+                pairing.release_expired(app.config["LANDMARK_ASSIGNMENT_TTL_SECONDS"])
+                chosen = pairing.assign(
+                    current_user.id,
+                    NUM_TASKS_PER_BATCH,
+                    target=app.config["LANDMARK_TARGET_PER_DRAWING"],
+                    min_effort=app.config["LANDMARK_MIN_EFFORT"],
+                    unavailable_routes=unavailable,
                 )
+                tasks = Task.query.filter(Task.id.in_(chosen)).order_by(Task.route_id).all()
 
-            last_batch = [t.id for t in tasks]
+        # read before the commit below expires the tasks (it would reload them one by one)
+        task_ids = [t.id for t in tasks]
+        trajectories = [make_trajectory(t, routes_data) for t in tasks]
+
+        if not user.inflight_batch:
             db.session.query(User).filter_by(id=current_user.id).update({
-                "last_batch": last_batch,
+                "last_batch": task_ids,
                 "inflight_batch": True
             })
             db.session.commit()
+            user_cache.invalidate(current_user.id)
 
         # --- saved answers payload ---
         saved = {}
         if mode == "draw":
             # send back any saved drawing for this user (optional)
             for r in Drawing.query.filter_by(user_id=current_user.id).filter(
-                Drawing.task_id.in_([t.id for t in tasks]),
+                Drawing.task_id.in_(task_ids),
             ).all():
                 drawing = None
-                if r.drawing_path and os.path.exists(r.drawing_path):
-                    with open(r.drawing_path, "rb") as f:
-                        drawing_data = f.read()
-                    drawing = f"data:image/png;base64,{base64.b64encode(drawing_data).decode('utf-8')}"
+                if r.drawing_path:
+                    try:
+                        with drawing_store.open(drawing_key(r.drawing_path)) as f:
+                            drawing_data = f.read()
+                        drawing = f"data:image/png;base64,{base64.b64encode(drawing_data).decode('utf-8')}"
+                    except FileNotFoundError:
+                        pass
                 saved[r.task_id] = {"drawing": drawing}
         else:
-            # landmark app: you need a drawing to show (from *someone*). Return one drawing per task.
-            # simplest: pick the most recent drawing for that task.
-            for t in tasks:
-                r = (
-                    Drawing.query
-                    .filter_by(task_id=t.id)
-                    .filter(Drawing.drawing_path.isnot(None))
-                    .order_by(Drawing.timestamp.desc())
-                    .first()
-                )
+            # landmark app: the drawing this annotator was paired with for each task
+            paired = pairing.assigned_drawings(current_user.id, task_ids)
+            for task_id in task_ids:
+                r = paired.get(task_id)
+                if r is None:
+                    # batches handed out before pairing existed: the most recent drawing
+                    r = (
+                        Drawing.query
+                        .filter_by(task_id=task_id)
+                        .filter(Drawing.drawing_path.isnot(None))
+                        .order_by(Drawing.timestamp.desc())
+                        .first()
+                    )
                 drawing_url = None
-                if r and r.drawing_path and os.path.exists(r.drawing_path):
-                    fname = os.path.basename(r.drawing_path)
-                    drawing_url = f"/user_drawings/{fname}"
-                saved[t.id] = {"drawing_url": drawing_url}
+                if r and r.drawing_path:
+                    fname = drawing_key(r.drawing_path)
+                    if drawing_store.exists(fname):
+                        drawing_url = f"/user_drawings/{fname}"
+                saved[task_id] = {"drawing_url": drawing_url}
 
         return jsonify({
-            "trajectories": [make_trajectory(t) for t in tasks],
+            "trajectories": trajectories,
             "saved_answers": saved,
             "mode": mode,
         })
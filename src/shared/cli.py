@@ -0,0 +1,197 @@
+import click
+
+
+def register_cli_commands(app):
+
+    @app.cli.command("optimize-drawings")
+    @click.option("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    @click.option("--dry-run", is_flag=True, help="Report savings without rewriting files.")
+    def optimize_drawings_cmd(workers, dry_run):
+        """Losslessly recompress drawings of users with no batch in flight."""
+        from src.shared.drawing_store import LocalDrawingStore
+        from src.shared.png_optimizer import completed_drawing_paths, optimize_drawings
+
+        if not isinstance(app.extensions["drawing_store"], LocalDrawingStore):
+            raise click.ClickException("optimize-drawings rewrites files in place; DRAWING_STORE must be 'local'")
+        counts, before, after = {}, 0, 0
+        for r in optimize_drawings(completed_drawing_paths(), workers=workers, dry_run=dry_run):
+            counts[r["status"]] = counts.get(r["status"], 0) + 1
+            before += r["before"]
+            after += r["after"]
+            if r["status"].startswith("error"):
+                click.echo(f"{r['path']}: {r['status']}", err=True)
+
+        for status, n in sorted(counts.items()):
+            click.echo(f"{status}: {n}")
+        saved = before - after
+        pct = (100.0 * saved / before) if before else 0.0
+        click.echo(f"bytes: {before} -> {after} (saved {saved}, {pct:.1f}%)")
+
+    @app.cli.command("export-dataset")
+    @click.argument("out_dir", type=click.Path(file_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(["jsonl", "tar"]), default="jsonl")
+    @click.option("--shard-size", type=int, default=10000, help="Rows per shard.")
+    @click.option("--workers", type=int, default=8, help="Threads copying drawing files.")
+    @click.option("--full", is_flag=True, help="Ignore the checkpoint and export every row.")
+    @click.option("--effort-ok-only", is_flag=True, help="Leave out answers that failed the effort check.")
+    def export_dataset_cmd(out_dir, fmt, shard_size, workers, full, effort_ok_only):
+        """Stream Drawing/Landmark rows with metrics and route metadata into shards."""
+        from src.shared.export import export_dataset
+
+        stats = export_dataset(
+            out_dir,
+            app.extensions["routes_data"],
+            app.extensions["drawing_store"],
+            fmt=fmt,
+            shard_size=shard_size,
+            workers=workers,
+            incremental=not full,
+            effort_ok_only=effort_ok_only,
+        )
+        for kind, s in stats.items():
+            click.echo(f"{kind}: {s['rows']} rows in {s['shards']} shards, "
+                       f"{s['files']} files copied, {s['missing_files']} missing")
+
+    @app.cli.command("media-index")
+    @click.option("--verbose", is_flag=True, help="List every missing file.")
+    def media_index_cmd(verbose):
+        """Scan the media directories and report routes with missing media."""
+        index = app.extensions["media_index"]
+        index.rescan()
+        for kind, n in index.counts().items():
+            state = "ok" if index.reachable(kind) else "unreachable"
+            click.echo(f"{kind}: {n} files ({state}: {index.roots[kind]})")
+
+        missing = index.missing_route_media(app.extensions["routes_data"])
+        click.echo(f"routes excluded from scheduling: {len(missing)}")
+        for rid, gaps in sorted(missing.items()):
+            click.echo(f"  {rid}: {len(gaps)} missing")
+            if verbose:
+                for g in gaps:
+                    click.echo(f"    {g}")
+
+    @app.cli.command("telemetry-report")
+    @click.option("--by", type=click.Choice(["study", "route", "browser"]), default="study")
+    @click.option("--since-hours", type=float, default=None, help="Only samples from the last N hours.")
+    @click.option("--json", "as_json", is_flag=True, help="One JSON object per line.")
+    def telemetry_report_cmd(by, since_hours, as_json):
+        """Percentiles of client-side timings per study, route or browser."""
+        import json
+        from datetime import datetime, timedelta, timezone
+        from src.shared.telemetry import summarize
+
+        since = datetime.now(timezone.utc) - timedelta(hours=since_hours) if since_hours else None
+        for row in summarize(by=by, since=since):
+            if as_json:
+                click.echo(json.dumps(row))
+            else:
+                click.echo(f"{str(row[by]):>12} {row['metric']:<22} n={row['count']:<7} "
+                           f"p50={row['p50_ms']:<9} p95={row['p95_ms']:<9} p99={row['p99_ms']}")
+
+    @app.cli.command("task-stats")
+    @click.option("--study", type=click.Choice(["draw", "landmarks"]), default=None, help="Default: this app's.")
+    @click.option("--route", "route_id", default=None, help="One route instead of the whole study.")
+    def task_stats_cmd(study, route_id):
+        """Means and percentiles from the task_stats aggregates, as JSON."""
+        import json
+        from src.shared.task_stats import route_stats, study_stats
+
+        study = study or app.config["APP_MODE"]
+        out = study_stats(study) if route_id is None else route_stats(study, route_id)
+        if out is None:
+            raise click.ClickException(f"unknown route {route_id}")
+        click.echo(json.dumps(out, indent=2))
+
+    @app.cli.command("backfill-task-stats")
+    @click.option("--batch-size", type=int, default=50, help="Tasks rebuilt per transaction (on SQLite, saves wait for each).")
+    def backfill_task_stats_cmd(batch_size):
+        """Rebuild task_stats from existing Drawing/Landmark rows; safe while the app serves."""
+        from src.shared.task_stats import backfill
+
+        done = 0
+        for done in backfill(batch_size=batch_size):
+            click.echo(f"tasks rebuilt: {done}")
+        click.echo(f"done: {done} tasks")
+
+    @app.cli.command("score-effort")
+    @click.option("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    @click.option("--stale-only", is_flag=True, help="Only answers never scored or scored by an older scorer.")
+    @click.option("--batch-size", type=int, default=500, help="Answers scored per transaction.")
+    def score_effort_cmd(workers, stale_only, batch_size):
+        """Recompute effort scores for stored answers from their metrics, strokes and drawings."""
+        from sqlalchemy import func
+        from src.shared.effort import rescore
+        from src.shared.models import db, EffortScore
+
+        done = 0
+        for done in rescore(app.extensions["drawing_store"], workers=workers, stale_only=stale_only,
+                            batch_size=batch_size):
+            click.echo(f"answers scored: {done}")
+        for study, ok, n in (db.session.query(EffortScore.study, EffortScore.ok, func.count())
+                             .group_by(EffortScore.study, EffortScore.ok).order_by(EffortScore.study)):
+            click.echo(f"{study} {'ok' if ok else 'low-effort'}: {n}")
+        click.echo(f"done: {done} answers")
+
+    @app.cli.command("landmark-agreement")
+    @click.option("--all", "everything", is_flag=True, help="Recompute every task, not just those with new saves.")
+    @click.option("--batch-size", type=int, default=200, help="Tasks recomputed per transaction.")
+    def landmark_agreement_cmd(everything, batch_size):
+        """Bring per-task landmark agreement and consensus orderings up to date."""
+        from src.shared.agreement import refresh
+        from src.shared.models import db, Landmark
+
+        task_ids = None
+        if everything:
+            task_ids = [tid for (tid,) in db.session.query(Landmark.task_id).distinct().order_by(Landmark.task_id)]
+        done = 0
+        for done in refresh(task_ids, batch_size=batch_size):
+            click.echo(f"tasks recomputed: {done}")
+        click.echo(f"done: {done} tasks")
+
+    @app.cli.command("hash-images")
+    @click.option("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    def hash_images_cmd(workers):
+        """Perceptual-hash changed route maps and drawings saved before hashing existed."""
+        from src.shared.phash import hash_maps, hash_missing_drawings
+        from src.shared.static_routes import MAPS_DIR
+
+        maps = hash_maps(MAPS_DIR, app.extensions["routes_data"], workers=workers)
+        click.echo(f"maps hashed: {maps}")
+        done = 0
+        for done in hash_missing_drawings(app.extensions["drawing_store"], workers=workers):
+            click.echo(f"drawings hashed: {done}")
+        click.echo(f"done: {done} drawings")
+
+    @app.cli.command("flag-duplicates")
+    @click.option("--max-distance", type=click.IntRange(0, 16), default=6, help="Hamming distance (of 64 bits) counted as a duplicate.")
+    def flag_duplicates_cmd(max_distance):
+        """Rebuild duplicate_flag from the stored hashes (run hash-images first)."""
+        import time
+        from src.shared.phash import flag_duplicates
+
+        start = time.perf_counter()
+        counts = flag_duplicates(max_distance)
+        for reason, n in sorted(counts.items()):
+            click.echo(f"{reason}: {n}")
+        click.echo(f"done in {time.perf_counter() - start:.1f}s")
+
+    @app.cli.command("migrate-legacy")
+    @click.argument("source_url")
+    @click.option("--chunk-size", type=int, default=5000, help="Legacy rows per transaction.")
+    @click.option("--restart", is_flag=True, help="Ignore the checkpoint and scan the legacy table from the start.")
+    @click.option("--drawings-dir", type=click.Path(file_okay=False, exists=True), default=None,
+                  help="Copy legacy drawing files from here into the drawing store under their new names.")
+    def migrate_legacy_cmd(source_url, chunk_size, restart, drawings_dir):
+        """Import a legacy (src/old/app.py) database's Response rows as Drawing/Landmark rows; resumable."""
+        from src.shared.legacy_migrate import migrate
+
+        progress = None
+        try:
+            for progress in migrate(source_url, chunk_size=chunk_size, restart=restart,
+                                    store=app.extensions["drawing_store"], drawings_dir=drawings_dir):
+                click.echo(f"legacy rows read: {progress['rows_read']} (last id {progress['last_id']})")
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(", ".join(f"{k}: {progress[k]}" for k in ("users", "tasks", "drawings", "landmarks")) + " created")
+        click.echo("derived tables are not rebuilt: run backfill-task-stats, score-effort --stale-only, "
+                   "hash-images and landmark-agreement next")
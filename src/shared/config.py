@@ -8,6 +8,66 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///mapdatacollection.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     MAX_CONCURRENT_USERS = int(os.getenv("MAX_CONCURRENT_USERS", "0"))  # 0 = no limit
+    USER_CACHE_MAX = int(os.getenv("USER_CACHE_MAX", "10000"))
+    USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))  # 0 = load the user every request
+    MEDIA_RESCAN_SECONDS = float(os.getenv("MEDIA_RESCAN_SECONDS", "300"))
+    ROUTES_RELOAD_SECONDS = float(os.getenv("ROUTES_RELOAD_SECONDS", "30"))  # 0 = only via /admin/reload_routes
+    METRICS_DIR = os.getenv("METRICS_DIR")  # shared by gunicorn workers; unset = per-process only
+    HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "5"))
+
+    # drawing storage: "local" (USER_DRAWINGS_DIR), "sqlite" (one blob file) or "s3" (any S3-compatible store)
+    DRAWING_STORE = os.getenv("DRAWING_STORE", "local")
+    DRAWING_STORE_SQLITE_PATH = os.getenv("DRAWING_STORE_SQLITE_PATH", "drawings.db")
+    DRAWING_ACCEL_PREFIX = os.getenv("DRAWING_ACCEL_PREFIX")  # local: nginx internal location, e.g. /_drawings/
+    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "http://127.0.0.1:9000")
+    S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL")  # what browsers use for redirects; defaults to the endpoint
+    S3_BUCKET = os.getenv("S3_BUCKET", "napkin-map")
+    S3_PREFIX = os.getenv("S3_PREFIX", "drawings/")
+    S3_REGION = os.getenv("S3_REGION", "us-east-1")
+    S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY", "")
+    S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "")
+    S3_REDIRECT = os.getenv("S3_REDIRECT", "1") == "1"  # answer /user_drawings with a presigned redirect
+    S3_PRESIGN_SECONDS = int(os.getenv("S3_PRESIGN_SECONDS", "300"))
+
+    # combined deployment (src/combined_app.py): "host=study,host=study"; other hosts get the default
+    COMBINED_HOSTS = os.getenv("COMBINED_HOSTS", "")
+    COMBINED_DEFAULT_STUDY = os.getenv("COMBINED_DEFAULT_STUDY", "draw")
+
+    # client performance beacons (/telemetry)
+    TELEMETRY_BUFFER_MAX = int(os.getenv("TELEMETRY_BUFFER_MAX", "50000"))
+    TELEMETRY_FLUSH_SECONDS = float(os.getenv("TELEMETRY_FLUSH_SECONDS", "10"))
+
+    # autosave pacing: save responses tell clients when to come back (src/shared/backpressure.py)
+    AUTOSAVE_INTERVAL_MS = int(os.getenv("AUTOSAVE_INTERVAL_MS", "10000"))
+    AUTOSAVE_MAX_INTERVAL_MS = int(os.getenv("AUTOSAVE_MAX_INTERVAL_MS", "60000"))
+    AUTOSAVE_TARGET_MS = float(os.getenv("AUTOSAVE_TARGET_MS", "250"))  # save latency counted as full load
+    AUTOSAVE_QUEUE_HIGH = int(os.getenv("AUTOSAVE_QUEUE_HIGH", "5000"))  # ingest backlog counted as full load
+    AUTOSAVE_SHED_PRESSURE = float(os.getenv("AUTOSAVE_SHED_PRESSURE", "1.5"))
+
+    # autosave ingestion: "sync" commits in the request, "async" spools and returns 202
+    INGEST_MODE = os.getenv("INGEST_MODE", "sync")
+    INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "ingest_spool")
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+    INGEST_FLUSH_SECONDS = float(os.getenv("INGEST_FLUSH_SECONDS", "1"))
+
+    # per-request SQL profiling (off by default)
+    SQL_PROFILE = os.getenv("SQL_PROFILE", "0") == "1"
+    SQL_PROFILE_MAX_QUERIES = int(os.getenv("SQL_PROFILE_MAX_QUERIES", "10"))
+    SQL_PROFILE_MAX_MS = float(os.getenv("SQL_PROFILE_MAX_MS", "100"))
+
+    # stack-sampling profiler for slow requests (off by default; toggled via /admin/profiling)
+    PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0") == "1"
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+    PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+    PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+    PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+    # landmark study pairing (src/shared/pairing.py)
+    LANDMARK_TARGET_PER_DRAWING = int(os.getenv("LANDMARK_TARGET_PER_DRAWING", "3"))  # annotators per drawing
+    LANDMARK_MIN_EFFORT = float(os.getenv("LANDMARK_MIN_EFFORT", "1.0"))  # effort score of preferred drawings
+    LANDMARK_ASSIGNMENT_TTL_SECONDS = float(os.getenv("LANDMARK_ASSIGNMENT_TTL_SECONDS", "7200"))  # then freed
+
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # unset = admin endpoints disabled
 
     # Google OAuth2
     OAUTH_CLIENT_ID     = os.getenv("GOOGLE_CLIENT_ID")
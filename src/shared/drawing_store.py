@@ -0,0 +1,378 @@
+import datetime as dt
+import fcntl
+import hashlib
+import hmac
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from urllib.parse import quote, urlsplit
+import requests
+from flask import Response, abort, redirect, send_file, send_from_directory
+from werkzeug.security import safe_join
+
+CHUNK = 256 * 1024
+REPLACE_LOCK = ".replace.lock"
+
+
+def drawing_key(drawing_path):
+    """Storage key of a Drawing.drawing_path; works for local paths and backend refs alike."""
+    return os.path.basename(drawing_path) if drawing_path else None
+
+
+@contextmanager
+def replace_lock(directory):
+    """
+    Exclusive lock on a drawings directory, held while a file in it is swapped in.
+    LocalDrawingStore.save takes it around its os.replace and the PNG optimizer around
+    its check-and-replace, so an autosave can't land between the two.
+    """
+    with open(os.path.join(directory, REPLACE_LOCK), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+class DrawingStore(ABC):
+    """
+    Where drawing PNGs live. Keys are file names ("<user>_<task>.png");
+    Drawing.drawing_path stores ref(key). open() returns a binary file object and
+    raises FileNotFoundError for unknown keys. send() builds the response for
+    /user_drawings/<key>: a redirect when the backend can hand out a URL the browser
+    fetches directly, a streamed body otherwise. Backends implement the abstract
+    methods; the rest have working defaults built on them.
+    """
+
+    @abstractmethod
+    def save(self, key, stream, length=None):
+        """Store the stream under key; returns ref(key)."""
+
+    @abstractmethod
+    def open(self, key):
+        """A binary file object; FileNotFoundError for an unknown key."""
+
+    @abstractmethod
+    def stat(self, key):
+        """(size, mtime_ns) or None."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove key; a missing key is not an error."""
+
+    @abstractmethod
+    def ref(self, key):
+        """What Drawing.drawing_path stores for key."""
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    def redirect_url(self, key):
+        return None
+
+    def copy_to(self, key, dst_path):
+        try:
+            with self.open(key) as src, open(dst_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, CHUNK)
+            return True
+        except OSError:
+            return False
+
+    def send(self, key):
+        url = self.redirect_url(key)
+        if url:
+            return redirect(url, 302)
+        meta = self.stat(key)
+        if meta is None:
+            abort(404)
+        resp = send_file(self.open(key), mimetype="image/png", download_name=key, conditional=False)
+        resp.content_length = meta[0]
+        return resp
+
+
+class LocalDrawingStore(DrawingStore):
+    """
+    Files under one directory. With accel_prefix set (e.g. "/_drawings/"), send()
+    returns an X-Accel-Redirect so nginx serves the bytes from an internal location.
+    """
+
+    def __init__(self, root, index=None, accel_prefix=None):
+        self.root = str(root)
+        self.index = index  # MediaIndex with a "drawings" root, for existence checks
+        self.accel_prefix = accel_prefix
+
+    def _path(self, key):
+        path = safe_join(self.root, key)
+        if path is None:
+            raise FileNotFoundError(key)
+        return path
+
+    def save(self, key, stream, length=None):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(stream, f, CHUNK)
+        with replace_lock(self.root):
+            os.replace(tmp, path)
+        if self.index is not None:
+            self.index.changed("drawings", key)
+        return path
+
+    def open(self, key):
+        return open(self._path(key), "rb")
+
+    def stat(self, key):
+        if self.index is not None and self.index.reachable("drawings"):
+            return self.index.stat("drawings", key)
+        try:
+            st = os.stat(self._path(key))
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        if self.index is not None:
+            self.index.changed("drawings", key)
+
+    def ref(self, key):
+        return self._path(key)
+
+    def send(self, key):
+        if self.stat(key) is None:
+            abort(404)
+        if self.accel_prefix:
+            resp = Response(mimetype="image/png")
+            resp.headers["X-Accel-Redirect"] = self.accel_prefix.rstrip("/") + "/" + quote(key)
+            return resp
+        return send_from_directory(self.root, key)
+
+
+class SQLiteDrawingStore(DrawingStore):
+    """
+    PNGs as BLOBs in one SQLite file, read and written in chunks through incremental
+    blob I/O, so a drawing is never held in memory whole.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " key TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, data BLOB NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def save(self, key, stream, length=None):
+        if length is None:
+            data = stream.read()
+            length = len(data)
+            stream = None
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO blobs (key, size, mtime_ns, data) VALUES (?, ?, ?, zeroblob(?))",
+                (key, length, time.time_ns(), length),
+            )
+            rowid = conn.execute("SELECT rowid FROM blobs WHERE key = ?", (key,)).fetchone()[0]
+            with conn.blobopen("blobs", "data", rowid) as blob:
+                if stream is None:
+                    blob.write(data)
+                else:
+                    written = 0
+                    while written < length:
+                        chunk = stream.read(min(CHUNK, length - written))
+                        if not chunk:
+                            raise ValueError(f"stream ended after {written} of {length} bytes")
+                        blob.write(chunk)
+                        written += len(chunk)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.ref(key)
+
+    def open(self, key):
+        row = self._conn().execute("SELECT rowid FROM blobs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(key)
+        return self._conn().blobopen("blobs", "data", row[0], readonly=True)
+
+    def stat(self, key):
+        row = self._conn().execute("SELECT size, mtime_ns FROM blobs WHERE key = ?", (key,)).fetchone()
+        return tuple(row) if row else None
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM blobs WHERE key = ?", (key,))
+
+    def ref(self, key):
+        return f"sqlite://{self.path}/{key}"
+
+
+# ---------------- S3-compatible ----------------
+def _hmac(key, msg):
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def sigv4_signature(secret_key, region, amz_date, canonical_request):
+    """AWS Signature Version 4 for service s3; also used by the stand-in server to verify requests."""
+    date = amz_date[:8]
+    scope = f"{date}/{region}/s3/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+    k = _hmac(("AWS4" + secret_key).encode("utf-8"), date)
+    for part in (region, "s3", "aws4_request"):
+        k = _hmac(k, part)
+    return hmac.new(k, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def canonical_request(method, path, query, headers, signed_headers, payload_hash):
+    """query: list of (name, value) pairs, unencoded; headers: lowercase name -> value."""
+    cq = "&".join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(query))
+    ch = "".join(f"{h}:{headers[h].strip()}\n" for h in signed_headers)
+    return "\n".join([method, quote(path, safe="/-_.~"), cq, ch, ";".join(signed_headers), payload_hash])
+
+
+class S3DrawingStore(DrawingStore):
+    """
+    Objects in an S3-compatible bucket (AWS, MinIO, or src/tools/s3_standin.py),
+    addressed path-style and signed with SigV4 over plain `requests`. Uploads and
+    downloads stream; with redirect=True, /user_drawings answers with a presigned GET
+    so the browser fetches the object from the store directly.
+    """
+
+    def __init__(self, endpoint_url, bucket, access_key, secret_key, region="us-east-1",
+                 prefix="drawings/", public_url=None, redirect=True, presign_seconds=300, timeout=30.0):
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.public_url = (public_url or endpoint_url).rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.prefix = prefix
+        self.redirect = redirect
+        self.presign_seconds = presign_seconds
+        self.timeout = timeout
+        self._http = None
+        self._http_pid = None
+
+    def _session(self):
+        # pooled connections must not be shared with forked workers (gunicorn --preload)
+        if self._http is None or self._http_pid != os.getpid():
+            self._http, self._http_pid = requests.Session(), os.getpid()
+        return self._http
+
+    def _path(self, key):
+        return f"/{self.bucket}/{self.prefix}{key}"
+
+    def _request(self, method, key, stream=False, **kw):
+        path = self._path(key)
+        amz_date = dt.datetime.now(dt.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        headers = {
+            "host": urlsplit(self.endpoint_url).netloc,
+            "x-amz-content-sha256": "UNSIGNED-PAYLOAD",
+            "x-amz-date": amz_date,
+        }
+        signed = sorted(headers)
+        creq = canonical_request(method, path, [], headers, signed, "UNSIGNED-PAYLOAD")
+        sig = sigv4_signature(self.secret_key, self.region, amz_date, creq)
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={';'.join(signed)}, Signature={sig}"
+        )
+        headers.update(kw.pop("headers", {}))
+        return self._session().request(method, self.endpoint_url + quote(path, safe="/-_.~"), headers=headers,
+                                 stream=stream, timeout=self.timeout, **kw)
+
+    def save(self, key, stream, length=None):
+        headers = {"content-type": "image/png"}
+        if length is not None:
+            headers["content-length"] = str(length)
+        r = self._request("PUT", key, data=stream, headers=headers)
+        r.raise_for_status()
+        return self.ref(key)
+
+    def open(self, key):
+        r = self._request("GET", key, stream=True)
+        if r.status_code == 404:
+            r.close()
+            raise FileNotFoundError(key)
+        r.raise_for_status()
+        r.raw.decode_content = True
+        return r.raw
+
+    def stat(self, key):
+        r = self._request("HEAD", key)
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        modified = r.headers.get("Last-Modified")
+        mtime = int(dt.datetime.strptime(modified, "%a, %d %b %Y %H:%M:%S GMT").replace(
+            tzinfo=dt.timezone.utc).timestamp() * 1e9) if modified else 0
+        return int(r.headers.get("Content-Length", 0)), mtime
+
+    def delete(self, key):
+        r = self._request("DELETE", key)
+        if r.status_code not in (200, 204, 404):
+            r.raise_for_status()
+
+    def ref(self, key):
+        return f"s3://{self.bucket}/{self.prefix}{key}"
+
+    def presign(self, key, method="GET", expires=None):
+        path = self._path(key)
+        amz_date = dt.datetime.now(dt.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        query = [
+            ("X-Amz-Algorithm", "AWS4-HMAC-SHA256"),
+            ("X-Amz-Credential", f"{self.access_key}/{scope}"),
+            ("X-Amz-Date", amz_date),
+            ("X-Amz-Expires", str(expires or self.presign_seconds)),
+            ("X-Amz-SignedHeaders", "host"),
+        ]
+        headers = {"host": urlsplit(self.public_url).netloc}
+        creq = canonical_request(method, path, query, headers, ["host"], "UNSIGNED-PAYLOAD")
+        query.append(("X-Amz-Signature", sigv4_signature(self.secret_key, self.region, amz_date, creq)))
+        qs = "&".join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in query)
+        return f"{self.public_url}{quote(path, safe='/-_.~')}?{qs}"
+
+    def redirect_url(self, key):
+        return self.presign(key) if self.redirect else None
+
+
+def make_drawing_store(config, root, index=None):
+    backend = config.get("DRAWING_STORE", "local")
+    if backend == "local":
+        return LocalDrawingStore(root, index=index, accel_prefix=config.get("DRAWING_ACCEL_PREFIX"))
+    if backend == "sqlite":
+        return SQLiteDrawingStore(config["DRAWING_STORE_SQLITE_PATH"])
+    if backend == "s3":
+        return S3DrawingStore(
+            config["S3_ENDPOINT_URL"],
+            config["S3_BUCKET"],
+            config["S3_ACCESS_KEY"],
+            config["S3_SECRET_KEY"],
+            region=config["S3_REGION"],
+            prefix=config["S3_PREFIX"],
+            public_url=config.get("S3_PUBLIC_URL"),
+            redirect=config["S3_REDIRECT"],
+            presign_seconds=config["S3_PRESIGN_SECONDS"],
+        )
+    raise ValueError(f"DRAWING_STORE: unknown backend {backend!r}")
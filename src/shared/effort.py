@@ -0,0 +1,286 @@
+"""
+Server-side effort scoring. Recomputes the browser's effort gate (checkEffortRequirements
+in app.js: stroke count, drawing span, 8x8 stroke entropy, video reach and watch time)
+from what was actually saved, adds ink coverage / blank-canvas checks on the stored
+PNG, and keeps the result in EffortScore so scheduling and exports can filter on it.
+
+Answers are scored as they are saved: save_answer updates the metric features,
+save_drawing the ink coverage, each in its own transaction. A save only bins its own
+stroke points, into the answer's running StrokeGrid. rescore() recomputes the
+whole corpus with a process pool, e.g. after THRESHOLDS change (bump SCORER_VERSION).
+"""
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import batched
+import numpy as np
+from PIL import Image
+from src.shared.models import db, Drawing, Landmark, StrokeChunk, StrokeGrid, EffortScore
+from src.shared.strokes import join_chunks, load_strokes
+from src.shared.drawing_store import drawing_key
+
+SCORER_VERSION = 1
+GRID = 8
+MIN_ENTROPY_POINTS = 20
+INK_LEVEL = 240  # grey levels darker than this (on white) count as ink
+
+# same thresholds as the client gate, plus ink coverage
+THRESHOLDS = {
+    "stroke_count": 5,
+    "span_s": 10.0,
+    "entropy": 0.15,
+    "reached_frac": 0.70,
+    "watch_frac": 0.50,
+    "ink_coverage": 0.002,
+}
+DRAWING_FEATURES = ("stroke_count", "span_s", "entropy", "ink_coverage")
+VIDEO_FEATURES = ("reached_frac", "watch_frac")
+MODELS = {"draw": Drawing, "landmarks": Landmark}
+
+
+def _num(x):
+    try:
+        x = float(x)
+    except (TypeError, ValueError):
+        return None
+    return x if np.isfinite(x) else None
+
+
+def grid_counts(x, y, width, height, grid=GRID):
+    """Points per cell of a grid x grid partition of the width x height canvas, row-major."""
+    cx = np.clip((np.asarray(x, dtype=np.float64) * (grid / width)).astype(np.int64), 0, grid - 1)
+    cy = np.clip((np.asarray(y, dtype=np.float64) * (grid / height)).astype(np.int64), 0, grid - 1)
+    return np.bincount(cy * grid + cx, minlength=grid * grid)
+
+
+def counts_entropy(counts):
+    """Normalised (0..1) Shannon entropy of grid_counts."""
+    counts = np.asarray(counts)
+    n = int(counts.sum())
+    if n < MIN_ENTROPY_POINTS:
+        return 0.0
+    p = counts[counts > 0] / n
+    return float(-(p * np.log(p)).sum() / np.log(len(counts)))
+
+
+def grid_entropy(x, y, width, height, grid=GRID):
+    """Normalised (0..1) Shannon entropy of points binned on a grid x grid canvas partition."""
+    if len(x) < MIN_ENTROPY_POINTS or not width or not height:
+        return 0.0
+    return counts_entropy(grid_counts(x, y, width, height, grid))
+
+
+def ink_coverage(png_bytes):
+    """Fraction of canvas pixels carrying ink; transparent pixels count as background."""
+    with Image.open(io.BytesIO(png_bytes)) as im:
+        if im.mode in ("RGBA", "LA", "PA") or "transparency" in im.info:
+            rgba = im.convert("RGBA")
+            white = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+            grey = Image.alpha_composite(white, rgba).convert("L")
+        else:
+            grey = im.convert("L")
+    a = np.asarray(grey)
+    return float(np.count_nonzero(a < INK_LEVEL)) / a.size if a.size else 0.0
+
+
+def metric_features(study, metrics, strokes=None, counts=None):
+    """
+    Features derivable from merged metrics and the stroke history: either decoded
+    (strokes) or already binned on the reported canvas (counts, see score_answer).
+    """
+    drawing = metrics.get("drawing") or {}
+    video = metrics.get("video") or {}
+    out = dict.fromkeys(DRAWING_FEATURES[:-1] + VIDEO_FEATURES)
+
+    length = _num(video.get("durationSec"))
+    if length:
+        out["reached_frac"] = (_num(video.get("maxWatchedTime")) or 0.0) / length
+        out["watch_frac"] = (_num(video.get("totalWatchTimeMs")) or 0.0) / 1000.0 / length
+    if study != "draw":
+        return out
+
+    out["stroke_count"] = int(_num(drawing.get("strokeCount")) or 0)
+    first, last = _num(drawing.get("firstStrokeMs")), _num(drawing.get("lastStrokeMs"))
+    out["span_s"] = (last - first) / 1000.0 if first is not None and last is not None else 0.0
+
+    if counts is not None:
+        out["entropy"] = counts_entropy(counts)
+        return out
+    if strokes is not None:
+        x, y = strokes.x, strokes.y
+    else:
+        # legacy saves: the trailing window of points kept in metrics_json
+        pts = [p for p in drawing.get("points") or () if isinstance(p, dict)]
+        x = np.array([_num(p.get("x")) or 0.0 for p in pts])
+        y = np.array([_num(p.get("y")) or 0.0 for p in pts])
+    width, height = _num(drawing.get("canvasW")), _num(drawing.get("canvasH"))
+    if not (width and height) and len(x):
+        # older clients did not report the canvas size; use the drawn extent
+        width, height = float(np.max(x)) + 1.0, float(np.max(y)) + 1.0
+    out["entropy"] = grid_entropy(x, y, width, height)
+    return out
+
+
+def evaluate(study, features):
+    """
+    (score, flags): flags names each failed check, score is the mean over checks of
+    min(1, value / threshold). Video checks are skipped while the video length is
+    unknown, as in the browser; a drawing without a stored image fails ink_coverage.
+    """
+    names = (DRAWING_FEATURES if study == "draw" else ()) + VIDEO_FEATURES
+    flags, parts = [], []
+    for name in names:
+        value = features.get(name)
+        if value is None and name in VIDEO_FEATURES:
+            continue
+        ratio = min(1.0, max(0.0, (value or 0.0) / THRESHOLDS[name]))
+        parts.append(ratio)
+        if ratio < 1.0:
+            flags.append(name)
+    return (round(sum(parts) / len(parts), 4) if parts else 1.0), flags
+
+
+def _apply(row, study, features):
+    for name, value in features.items():
+        setattr(row, name, value)
+    current = {name: getattr(row, name) for name in THRESHOLDS}
+    row.score, flags = evaluate(study, current)
+    row.flags = flags
+    row.ok = not flags
+    row.blank = row.ink_coverage is not None and row.ink_coverage < THRESHOLDS["ink_coverage"]
+    row.version = SCORER_VERSION
+    row.scored_at = datetime.now(timezone.utc)
+
+
+def _row(study, user_id, task_id):
+    row = db.session.get(EffortScore, (study, user_id, task_id))
+    if row is None:
+        row = EffortScore(study=study, user_id=user_id, task_id=task_id)
+        db.session.add(row)
+    return row
+
+
+def _history_counts(study, user_id, task_id, new_strokes, width, height):
+    """
+    grid_counts of the answer's whole stroke history, new_strokes (just appended) included,
+    kept up to date in its StrokeGrid. The history is decoded only to start the grid or
+    when the canvas size changes. None if the answer has no strokes.
+    """
+    row = db.session.get(StrokeGrid, (study, user_id, task_id))
+    if row is not None and (row.width, row.height) == (width, height) and len(row.counts) == GRID * GRID:
+        if new_strokes is None:
+            return row.counts
+        counts = np.asarray(row.counts) + grid_counts(new_strokes.x, new_strokes.y, width, height)
+    else:
+        history = load_strokes(study, user_id, task_id)
+        if history is None:
+            return None
+        counts = grid_counts(history.x, history.y, width, height)
+        if row is None:
+            row = StrokeGrid(study=study, user_id=user_id, task_id=task_id)
+            db.session.add(row)
+        row.width, row.height = width, height
+    row.counts = counts.tolist()
+    row.updated_at = datetime.now(timezone.utc)
+    return row.counts
+
+
+def score_answer(study, user_id, task_id, metrics, new_strokes=None):
+    """
+    Stage the metric features of a just-merged save_answer (the caller commits).
+    new_strokes are the Strokes the save appended, if any.
+    """
+    strokes = counts = None
+    if study == "draw":
+        drawing = metrics.get("drawing") or {}
+        width, height = _num(drawing.get("canvasW")), _num(drawing.get("canvasH"))
+        if width and height:
+            counts = _history_counts(study, user_id, task_id, new_strokes, width, height)
+        else:
+            # without a canvas size the grid spans the drawn extent, which every save can move
+            strokes = load_strokes(study, user_id, task_id)
+    _apply(_row(study, user_id, task_id), study, metric_features(study, metrics, strokes, counts))
+
+
+def score_image(user_id, task_id, png_bytes):
+    """Stage the ink coverage of a just-saved drawing (the caller commits)."""
+    try:
+        coverage = ink_coverage(png_bytes)
+    except (OSError, Image.UnidentifiedImageError, Image.DecompressionBombError):
+        coverage = 0.0
+    _apply(_row("draw", user_id, task_id), "draw", {"ink_coverage": coverage})
+
+
+# ---- bulk ----
+def _score_job(job):
+    """Worker: (study, user_id, task_id, metrics_json, stroke chunk blobs, png_bytes) -> features. No DB."""
+    study, user_id, task_id, metrics_json, blobs, png = job
+    try:
+        metrics = json.loads(metrics_json) if metrics_json else {}
+    except ValueError:
+        metrics = {}
+    features = metric_features(study, metrics if isinstance(metrics, dict) else {}, join_chunks(blobs))
+    if study == "draw":
+        try:
+            features["ink_coverage"] = ink_coverage(png) if png is not None else None
+        except (OSError, Image.UnidentifiedImageError, Image.DecompressionBombError):
+            features["ink_coverage"] = 0.0
+    return (study, user_id, task_id), features
+
+
+def _read_png(store, ref):
+    if not ref:
+        return None
+    try:
+        with store.open(drawing_key(ref)) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _ids(study, stale_only):
+    model = MODELS[study]
+    q = db.session.query(model.id)
+    if stale_only:
+        q = q.outerjoin(EffortScore, db.and_(
+            EffortScore.study == study, EffortScore.user_id == model.user_id, EffortScore.task_id == model.task_id,
+        )).filter(db.or_(EffortScore.version.is_(None), EffortScore.version < SCORER_VERSION))
+    return [i for (i,) in q.order_by(model.id)]
+
+
+def _jobs(study, store, ids):
+    model = MODELS[study]
+    chunks = {}
+    for user_id, task_id, blob in (
+        db.session.query(StrokeChunk.user_id, StrokeChunk.task_id, StrokeChunk.blob)
+        .join(model, db.and_(model.user_id == StrokeChunk.user_id, model.task_id == StrokeChunk.task_id))
+        .filter(StrokeChunk.study == study, model.id.in_(ids))
+        .order_by(StrokeChunk.seq)
+    ):
+        chunks.setdefault((user_id, task_id), []).append(blob)
+    cols = [model.user_id, model.task_id, model.metrics_json]
+    if study == "draw":
+        cols.append(Drawing.drawing_path)
+    return [
+        (study, row[0], row[1], row[2], chunks.get((row[0], row[1]), ()),
+         _read_png(store, row[3]) if study == "draw" else None)
+        for row in db.session.query(*cols).filter(model.id.in_(ids))
+    ]
+
+
+def rescore(store, workers=None, stale_only=False, batch_size=500):
+    """
+    Score every answer (or only those never scored / scored by an older SCORER_VERSION)
+    on a process pool, committing per batch; only one batch of images is held in memory.
+    Yields the running count.
+    """
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for study in MODELS:
+            for ids in batched(_ids(study, stale_only), batch_size):
+                for (study_, user_id, task_id), features in pool.map(_score_job, _jobs(study, store, ids), chunksize=16):
+                    _apply(_row(study_, user_id, task_id), study_, features)
+                db.session.commit()
+                done += len(ids)
+                yield done
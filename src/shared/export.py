@@ -0,0 +1,230 @@
+import io
+import json
+import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import and_, or_
+from src.shared.models import db, Task, User, Drawing, Landmark, EffortScore
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+def _load_checkpoint(out_dir):
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return {"run": 0}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _save_checkpoint(out_dir, checkpoint):
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _parse_metrics(raw):
+    if not raw:
+        return {}
+    try:
+        m = json.loads(raw)
+    except (TypeError, ValueError):
+        return {}
+    return m if isinstance(m, dict) else {}
+
+
+def iter_export_rows(kind, since=None, batch_size=1000, effort_ok_only=False):
+    """
+    Stream Drawing or Landmark rows (kind = 'drawings' | 'landmarks') joined with their
+    task, user and effort score, ordered by (timestamp, id) so the last row seen is a valid
+    resume point. Rows updated after a previous export have a newer timestamp and are
+    exported again; consumers should keep the latest record per id. effort_ok_only skips
+    rows whose stored effort score failed (or that were never scored).
+    """
+    model = Drawing if kind == "drawings" else Landmark
+    study = "draw" if kind == "drawings" else "landmarks"
+    cols = [
+        model.id, model.user_id, model.task_id, model.metrics_json, model.timestamp,
+        Task.route_id, User.hit_id, User.prolific_pid, User.prolific_study_id, User.prolific_session_id,
+        EffortScore.score.label("effort_score"), EffortScore.ok.label("effort_ok"),
+        EffortScore.flags.label("effort_flags"),
+    ]
+    cols.append(Drawing.drawing_path if kind == "drawings" else Landmark.landmarks)
+
+    q = (
+        db.session.query(*cols)
+        .join(Task, Task.id == model.task_id)
+        .join(User, User.id == model.user_id)
+        .outerjoin(EffortScore, and_(
+            EffortScore.study == study, EffortScore.user_id == model.user_id, EffortScore.task_id == model.task_id,
+        ))
+    )
+    if effort_ok_only:
+        q = q.filter(EffortScore.ok.is_(True))
+    if since:
+        last_ts = datetime.fromisoformat(since["timestamp"])
+        q = q.filter(or_(
+            model.timestamp > last_ts,
+            and_(model.timestamp == last_ts, model.id > since["id"]),
+        ))
+    q = q.order_by(model.timestamp, model.id).execution_options(stream_results=True, yield_per=batch_size)
+
+    yield from q
+
+
+def _record(kind, row, routes_data):
+    route = routes_data.get(row.route_id) or {}
+    rec = {
+        "kind": kind[:-1],
+        "id": row.id,
+        "user_id": row.user_id,
+        "task_id": row.task_id,
+        "route_id": row.route_id,
+        "hit_id": row.hit_id,
+        "prolific_pid": row.prolific_pid,
+        "prolific_study_id": row.prolific_study_id,
+        "prolific_session_id": row.prolific_session_id,
+        "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+        "metrics": _parse_metrics(row.metrics_json),
+        "effort": None if row.effort_score is None else {
+            "score": row.effort_score, "ok": row.effort_ok, "flags": row.effort_flags,
+        },
+        "route": {
+            "map": route.get("map"),
+            "observations": route.get("observations", []),
+            "landmarks": route.get("landmarks", []),
+            "endpoints": route.get("endpoints", []),
+        },
+    }
+    if kind == "drawings":
+        rec["drawing_path"] = row.drawing_path
+        rec["drawing_file"] = os.path.basename(row.drawing_path) if row.drawing_path else None
+    else:
+        rec["landmarks"] = row.landmarks
+    return rec
+
+
+class ShardWriter:
+    """
+    Writes records into fixed-size shards. 'jsonl' shards go next to a shared drawings/
+    directory filled by a thread pool; 'tar' shards bundle the JSONL and PNGs together.
+    PNGs are streamed out of the drawing store. Only the current shard's pending file
+    list is ever held in memory.
+    """
+
+    def __init__(self, out_dir, kind, run, store, fmt="jsonl", shard_size=10000, workers=8):
+        self.out_dir = out_dir
+        self.store = store
+        self.kind = kind
+        self.run = run
+        self.fmt = fmt
+        self.shard_size = shard_size
+        self.pool = ThreadPoolExecutor(max_workers=workers) if fmt == "jsonl" else None
+        self.shard_idx = 0
+        self.rows_in_shard = 0
+        self.rows = 0
+        self.files = 0
+        self.missing_files = 0
+        self._fh = None
+        self._pending = []
+        if fmt == "jsonl":
+            os.makedirs(os.path.join(out_dir, "drawings"), exist_ok=True)
+
+    def _shard_name(self):
+        return f"{self.kind}-r{self.run:04d}-{self.shard_idx:05d}"
+
+    def _open(self):
+        if self.fmt == "jsonl":
+            self._fh = open(os.path.join(self.out_dir, self._shard_name() + ".jsonl"), "w")
+        else:
+            self._fh = io.StringIO()
+
+    def write(self, rec):
+        if self._fh is None:
+            self._open()
+        self._fh.write(json.dumps(rec, separators=(",", ":")) + "\n")
+        if rec.get("drawing_path"):
+            self._pending.append(rec["drawing_file"])
+        self.rows += 1
+        self.rows_in_shard += 1
+        if self.rows_in_shard >= self.shard_size:
+            self._close_shard()
+
+    def _close_shard(self):
+        if self._fh is None:
+            return
+        if self.fmt == "jsonl":
+            self._fh.close()
+            dst_dir = os.path.join(self.out_dir, "drawings")
+            futures = [self.pool.submit(self.store.copy_to, name, os.path.join(dst_dir, name)) for name in self._pending]
+            for fut in futures:
+                if fut.result():
+                    self.files += 1
+                else:
+                    self.missing_files += 1
+        else:
+            name = self._shard_name()
+            data = self._fh.getvalue().encode("utf-8")
+            with tarfile.open(os.path.join(self.out_dir, name + ".tar"), "w") as tar:
+                info = tarfile.TarInfo(name + ".jsonl")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+                for fname in self._pending:
+                    meta = self.store.stat(fname)
+                    if meta is None:
+                        self.missing_files += 1
+                        continue
+                    info = tarfile.TarInfo(f"drawings/{fname}")
+                    info.size, info.mtime = meta[0], meta[1] // 1_000_000_000
+                    with self.store.open(fname) as src:
+                        tar.addfile(info, src)
+                    self.files += 1
+        self._fh = None
+        self._pending = []
+        self.rows_in_shard = 0
+        self.shard_idx += 1
+
+    def close(self):
+        self._close_shard()
+        if self.pool:
+            self.pool.shutdown()
+
+
+def export_dataset(out_dir, routes_data, store, fmt="jsonl", shard_size=10000, workers=8,
+                   incremental=True, batch_size=1000, effort_ok_only=False):
+    """
+    Export Drawing and Landmark rows to out_dir. With incremental=True only rows newer
+    than the checkpoint left by the previous run are written; effort_ok_only leaves out
+    answers that failed the stored effort check. Returns per-kind stats.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint = _load_checkpoint(out_dir)
+    run = checkpoint.get("run", 0) + 1
+    stats = {}
+
+    for kind in ("drawings", "landmarks"):
+        writer = ShardWriter(out_dir, kind, run, store, fmt=fmt, shard_size=shard_size, workers=workers)
+        last = None
+        try:
+            since = checkpoint.get(kind) if incremental else None
+            for row in iter_export_rows(kind, since=since, batch_size=batch_size, effort_ok_only=effort_ok_only):
+                writer.write(_record(kind, row, routes_data))
+                last = row
+        finally:
+            writer.close()
+        if last is not None and last.timestamp is not None:
+            checkpoint[kind] = {"timestamp": last.timestamp.isoformat(), "id": last.id}
+        stats[kind] = {
+            "rows": writer.rows,
+            "shards": writer.shard_idx,
+            "files": writer.files,
+            "missing_files": writer.missing_files,
+        }
+
+    checkpoint["run"] = run
+    checkpoint["exported_at"] = datetime.now().isoformat()
+    _save_checkpoint(out_dir, checkpoint)
+    return stats
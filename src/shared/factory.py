@@ -3,11 +3,32 @@ from flask_login import LoginManager
 from pathlib import Path
 from src.shared.config import Config
 from src.shared.models import db, Task
-from src.shared.utils import parse_routes
+from src.shared.media_index import MediaIndex
+from src.shared.metrics import init_metrics
+from src.shared.sql_profiler import init_sql_profiler
+from src.shared.profiler import init_profiler
+from src.shared.health import init_health
+from src.shared.backpressure import init_backpressure
+from src.shared.ingest import init_ingest
+from src.shared.task_stats import ensure_stats_rows
+from src.shared.pairing import ensure_coverage_rows
+from src.shared.drawing_store import make_drawing_store
+from src.shared import prefork
+from src.shared.routes_reload import init_routes_reload, upsert_tasks, retired_route_ids
 
-def create_app(mode: str) -> Flask:
+def sync_tasks(routes_data):
+    """Create or update one Task row per route; call inside an app context."""
+    upsert_tasks(routes_data)
+    ensure_stats_rows([tid for (tid,) in db.session.query(Task.id)])
+    ensure_coverage_rows()
+    db.session.commit()
+
+
+def create_app(mode: str, share_with: Flask = None) -> Flask:
     """
     mode: 'draw' or 'landmarks'
+    share_with: an app already built in this process (see src/combined_app.py); the new
+    app reuses its route data, media index and DB engine, and skips the task sync.
     """
     app_dir = Path(__file__).resolve().parents[1]  # src/
     if mode == "draw":
@@ -23,41 +44,65 @@ def create_app(mode: str) -> Flask:
     app = Flask(__name__, template_folder=str(template_dir), static_folder=str(static_dir))
     app.config.from_object(Config)
     app.config["APP_MODE"] = mode  # useful in templates/JS if needed
+    # per-study overrides, e.g. LANDMARKS_MAX_CONCURRENT_USERS=200
+    app.config.from_prefixed_env(mode.upper())
+    prefork.register(app)
 
     db.init_app(app)
+    if share_with is not None:
+        # one pool for both studies; flask-sqlalchemy keeps its engines per app
+        for engine in db._app_engines[app].values():
+            engine.dispose()
+        db._app_engines[app] = db._app_engines[share_with]
+    init_metrics(app)
+    init_sql_profiler(app)
+    init_profiler(app)
+    init_health(app)
+    init_backpressure(app)
 
     login_mgr = LoginManager()
     login_mgr.init_app(app)
     login_mgr.login_view = "login_page"
 
-    # --- preload tasks (same as your unified app) ---
-    routes_data = parse_routes()
-    app.extensions["routes_data"] = routes_data  # stash for route handlers
-
-    with app.app_context():
-        db.create_all()
-        for _, rd in routes_data.items():
-            rid = rd["route_id"]
-            t = Task.query.filter_by(route_id=rid).first()
-            if t is None:
-                t = Task(
-                    route_id=rid,
-                    served_count_draw=0,
-                    served_count_landmarks=0,
-                    landmarks=rd["landmarks"],
-                    endpoints=rd["endpoints"],
-                )
-                db.session.add(t)
-            else:
-                t.landmarks = rd["landmarks"]
-                t.endpoints = rd["endpoints"]
-        db.session.commit()
-
-    # attach login user_loader (needs User model)
-    from src.shared.models import User
+    # parsed once per process; handlers read app.extensions["routes_data"] per request,
+    # which the reloader replaces when ROUTES_FILE changes (src/shared/routes_reload.py)
+    reloader = init_routes_reload(app, share_with=share_with)
+    if share_with is not None:
+        app.extensions["media_index"] = share_with.extensions["media_index"]
+        app.extensions["drawing_store"] = share_with.extensions["drawing_store"]
+    else:
+        routes_data = reloader.data
+
+        # scanned lazily on first use, then refreshed incrementally
+        from src.shared.static_routes import MAPS_DIR, OBSERVATIONS_DIR, VIDEO_DIR, USER_DRAWINGS_DIR
+        roots = {"maps": MAPS_DIR, "observations": OBSERVATIONS_DIR, "videos": VIDEO_DIR}
+        if app.config["DRAWING_STORE"] == "local":
+            roots["drawings"] = USER_DRAWINGS_DIR  # other backends answer existence themselves
+        media_index = MediaIndex(roots, rescan_seconds=app.config["MEDIA_RESCAN_SECONDS"])
+        app.extensions["media_index"] = media_index
+        app.extensions["drawing_store"] = make_drawing_store(
+            app.config, USER_DRAWINGS_DIR, index=media_index if "drawings" in roots else None,
+        )
+
+        with app.app_context():
+            db.create_all()
+            sync_tasks(routes_data)
+            reloader.retired = retired_route_ids(routes_data)
+    init_ingest(app)
+
+    # attach login user_loader: cached snapshots instead of a User query per request
+    from src.shared.user_cache import UserCache
+    user_cache = UserCache(
+        max_entries=app.config["USER_CACHE_MAX"],
+        ttl_seconds=app.config["USER_CACHE_TTL_SECONDS"],
+    )
+    app.extensions["user_cache"] = user_cache
 
     @login_mgr.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.get(int(user_id))
+
+    from src.shared.cli import register_cli_commands
+    register_cli_commands(app)
 
     return app
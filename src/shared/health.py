@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from flask import jsonify
+from sqlalchemy import text
+from src.shared.models import db
+
+
+def routes_fingerprint(routes_data) -> str:
+    """Short stable hash of the parsed routes, to tell which route file a worker is serving."""
+    blob = json.dumps(routes_data, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+
+class HealthState:
+    """
+    What /healthz and /readyz report. The report is rebuilt at most every
+    `cache_seconds`; probes in between (and probes that arrive while another
+    thread is rebuilding) get the previous one, so a tight probe interval adds
+    at most one `SELECT 1` per worker per window.
+
+    Readiness fails only when the database can't be reached or no routes are loaded.
+    Pool saturation is reported but doesn't fail it: a full pool is load, and taking
+    every busy worker out of rotation at once would only move that load elsewhere.
+    """
+
+    def __init__(self, app, cache_seconds=5.0):
+        self.app = app
+        self.cache_seconds = cache_seconds
+        self.started_at = time.time()
+        self.routes = {"loaded": False, "count": 0, "fingerprint": None, "loaded_at": None}
+        self.backlogs = {}  # name -> callable returning the number of queued writes
+        self._report = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def set_routes(self, routes_data):
+        self.routes = {
+            "loaded": bool(routes_data),
+            "count": len(routes_data),
+            "fingerprint": routes_fingerprint(routes_data),
+            "loaded_at": time.time(),
+        }
+        self._built_at = 0.0
+
+    def add_backlog(self, name, depth_fn):
+        self.backlogs[name] = depth_fn
+
+    # ---- checks ----
+    def _pool_stats(self):
+        pool = db.engine.pool
+        if not (hasattr(pool, "checkedout") and hasattr(pool, "size")):
+            return None
+        capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+        in_use = pool.checkedout()
+        return {
+            "size": pool.size(),
+            "checked_out": in_use,
+            "overflow": pool.overflow(),
+            "capacity": capacity,
+            "saturation": round(in_use / capacity, 3) if capacity else 0.0,
+        }
+
+    def _check_db(self):
+        pool = self._pool_stats()
+        if pool is not None and pool["capacity"] > 0 and pool["checked_out"] >= pool["capacity"]:
+            # every connection is busy, so the database answered a moment ago; checking out
+            # another would make the probe wait out the pool timeout
+            return {"ok": True, "latency_ms": None, "pool": pool}
+        start = time.perf_counter()
+        try:
+            with db.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except Exception as e:
+            return {"ok": False, "error": str(e).splitlines()[0][:200]}
+        out = {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000.0, 2)}
+        if pool is not None:
+            out["pool"] = pool
+        return out
+
+    def _check_media(self):
+        index = self.app.extensions.get("media_index")
+        if index is None:
+            return {"ok": True}
+        roots = {kind: index.reachable(kind) for kind in index.roots}
+        return {"ok": all(roots.values()), "reachable": roots, "files": index.counts()}
+
+    def _check_backlogs(self):
+        depths = {}
+        for name, depth_fn in self.backlogs.items():
+            try:
+                depths[name] = int(depth_fn())
+            except Exception:
+                depths[name] = None
+        return depths
+
+    def _build(self):
+        with self.app.app_context():
+            database = self._check_db()
+        media = self._check_media()
+        # media gaps degrade the service (routes are skipped) but don't take it out of rotation
+        ready = database["ok"] and self.routes["loaded"]
+        return {
+            "status": "ready" if ready else "unavailable",
+            "ready": ready,
+            "mode": self.app.config.get("APP_MODE"),
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "database": database,
+            "routes": self.routes,
+            "media": media,
+            "write_backlog": self._check_backlogs(),
+            "checked_at": time.time(),
+        }
+
+    def report(self):
+        if self._report is not None and time.monotonic() - self._built_at < self.cache_seconds:
+            return self._report
+        if not self._lock.acquire(blocking=self._report is None):
+            return self._report
+        try:
+            if self._report is None or time.monotonic() - self._built_at >= self.cache_seconds:
+                self._report = self._build()
+                self._built_at = time.monotonic()
+            return self._report
+        finally:
+            self._lock.release()
+
+
+def init_health(app):
+    """Register /healthz (liveness, always 200) and /readyz (503 until the worker can serve)."""
+    health = HealthState(app, cache_seconds=app.config["HEALTH_CACHE_SECONDS"])
+    app.extensions["health"] = health
+
+    @app.route("/healthz")
+    def healthz():
+        return jsonify(health.report()), 200
+
+    @app.route("/readyz")
+    def readyz():
+        report = health.report()
+        return jsonify(report), 200 if report["ready"] else 503
+
+    return health
@@ -0,0 +1,337 @@
+import atexit
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy.exc import OperationalError
+from src.shared.answer_routes import (
+    _merge_metrics, apply_answer, apply_landmarks, write_answer_file, write_landmarks_file,
+)
+from src.shared.models import db, Task, IngestOffset, SaveSequence
+
+
+class IngestSpool:
+    """
+    Durable local queue of validated saves: an SQLite file in WAL mode, shared by
+    every worker on the host. An append is one small local commit, which survives a
+    worker crash; the spool id tells the consumer a recreated file apart from the old one.
+    Saves that cannot be applied are moved to its dead table for inspection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " kind TEXT NOT NULL, user_id INTEGER NOT NULL, task_id INTEGER NOT NULL,"
+            " payload TEXT NOT NULL, enqueued_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead ("
+            " seq INTEGER PRIMARY KEY,"
+            " kind TEXT NOT NULL, user_id INTEGER NOT NULL, task_id INTEGER NOT NULL,"
+            " payload TEXT NOT NULL, enqueued_at REAL NOT NULL, error TEXT NOT NULL, failed_at REAL NOT NULL)"
+        )
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('spool_id', ?)", (uuid.uuid4().hex,))
+        self.spool_id = conn.execute("SELECT value FROM meta WHERE key = 'spool_id'").fetchone()[0]
+
+    def _conn(self):
+        # one connection per thread and process; sqlite connections must not cross a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def append(self, kind, user_id, task_id, payload):
+        self._conn().execute(
+            "INSERT INTO spool (kind, user_id, task_id, payload, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+            (kind, user_id, task_id, json.dumps(payload), time.time()),
+        )
+
+    def read(self, after_seq, limit):
+        return self._conn().execute(
+            "SELECT seq, kind, user_id, task_id, payload FROM spool WHERE seq > ? ORDER BY seq LIMIT ?",
+            (after_seq, limit),
+        ).fetchall()
+
+    def bury(self, seq, error):
+        """Copy one spooled save to the dead table (idempotent; the caller deletes it from the spool)."""
+        self._conn().execute(
+            "INSERT OR REPLACE INTO dead (seq, kind, user_id, task_id, payload, enqueued_at, error, failed_at)"
+            " SELECT seq, kind, user_id, task_id, payload, enqueued_at, ?, ? FROM spool WHERE seq = ?",
+            (error, time.time(), seq),
+        )
+
+    def delete_through(self, seq):
+        self._conn().execute("DELETE FROM spool WHERE seq <= ?", (seq,))
+
+    def backlog(self, after_seq):
+        """(pending saves, enqueue time of the oldest one or None)."""
+        return self._conn().execute(
+            "SELECT COUNT(*), MIN(enqueued_at) FROM spool WHERE seq > ?", (after_seq,)
+        ).fetchone()
+
+
+class IngestConsumer:
+    """
+    Applies spooled saves in batched transactions. Saves for the same (kind, user,
+    task) within a batch are coalesced: the latest landmarks and timestamp win and
+    the metrics deltas are merged in arrival order, so each row is written once.
+    Sequenced answers at or below their epoch's SaveSequence high-water mark are dropped
+    before merging, and the marks move in the same commit as the saves.
+
+    Every worker runs a consumer thread, but an exclusive lock on <spool>.lock lets
+    only one of them drain at a time. The last applied sequence number is committed
+    to IngestOffset in the same transaction as the saves, so after a crash the next
+    consumer resumes exactly where the last commit left off.
+
+    A batch that fails for any reason but a database error (OperationalError, retried on
+    the next tick) is retried in halves until the failing save is alone. That save goes
+    to the spool's dead table, and the offset moves past it, so one bad payload can't
+    stall the queue. The user_answers/user_landmarks side files are a best-effort mirror
+    written after the commit. A crash between the two loses that batch's mirror entries,
+    which is accepted: the database is the record.
+    """
+
+    def __init__(self, app, spool, batch_size=500, flush_seconds=1.0):
+        self.app = app
+        self.spool = spool
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._last_seq = 0
+        self._consumer_pid = None
+        self._drain_lock = threading.Lock()
+
+    # ---- producer side ----
+    def enqueue(self, kind, user_id, task_id, payload):
+        self._ensure_consumer()
+        self.spool.append(kind, user_id, task_id, payload)
+        metrics = self.app.extensions.get("metrics")
+        if metrics is not None:
+            metrics.inc("ingest_enqueued_total", (("kind", kind),))
+
+    def depth(self):
+        return self.spool.backlog(self._last_seq)[0]
+
+    # ---- consumer side ----
+    def _ensure_consumer(self):
+        if self._consumer_pid == os.getpid():
+            return
+        self._consumer_pid = os.getpid()
+
+        def _loop():
+            while True:
+                time.sleep(self.flush_seconds)
+                try:
+                    self.drain()
+                except Exception as e:
+                    self.app.logger.warning("ingest drain failed: %s", e)
+
+        threading.Thread(target=_loop, name="ingest-consumer", daemon=True).start()
+        atexit.register(self.drain)
+
+    def drain(self):
+        """Apply everything currently spooled, if no other process is already doing so."""
+        if not self._drain_lock.acquire(blocking=False):
+            return 0
+        try:
+            with open(self.spool.path + ".lock", "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    self._report_lag(None)
+                    return 0
+                applied = 0
+                limit = self.batch_size
+                with self.app.app_context():
+                    while True:
+                        try:
+                            n = self._apply_batch(limit)
+                        except OperationalError:
+                            # database down or busy: the same batch is retried on the next tick
+                            db.session.rollback()
+                            raise
+                        except Exception as e:
+                            db.session.rollback()
+                            if limit > 1:
+                                limit = max(1, limit // 2)  # narrow down to the save that fails
+                                continue
+                            self._dead_letter(e)
+                            limit = self.batch_size
+                            continue
+                        applied += n
+                        if n < limit:
+                            break
+                self._report_lag(self._last_seq)
+                return applied
+        finally:
+            self._drain_lock.release()
+
+    def _report_lag(self, after_seq):
+        metrics = self.app.extensions.get("metrics")
+        if metrics is None:
+            return
+        if after_seq is None:
+            # another process owns the queue and reports it; don't double count
+            metrics.set_gauge("ingest_queue_depth", 0.0)
+            metrics.set_gauge("ingest_lag_seconds", 0.0)
+            return
+        pending, oldest = self.spool.backlog(after_seq)
+        metrics.set_gauge("ingest_queue_depth", float(pending))
+        metrics.set_gauge("ingest_lag_seconds", max(0.0, time.time() - oldest) if oldest else 0.0)
+
+    def _offset(self):
+        offset = db.session.get(IngestOffset, self.spool.spool_id)
+        if offset is None:
+            offset = IngestOffset(spool_id=self.spool.spool_id, last_seq=0)
+            db.session.add(offset)
+        self._last_seq = offset.last_seq
+        return offset
+
+    def _dead_letter(self, error):
+        """Move the next spooled save (which fails on its own) to the dead table and step past it."""
+        offset = self._offset()
+        rows = self.spool.read(offset.last_seq, 1)
+        if not rows:
+            db.session.rollback()
+            return
+        seq = rows[0][0]
+        self.spool.bury(seq, f"{type(error).__name__}: {error}"[:1000])
+        offset.last_seq = seq
+        offset.updated_at = datetime.now(timezone.utc)
+        db.session.commit()
+        self._last_seq = seq
+        self.spool.delete_through(seq)
+        self.app.logger.error("ingest: save %d moved to the dead table: %r", seq, error)
+        metrics = self.app.extensions.get("metrics")
+        if metrics is not None:
+            metrics.inc("ingest_dead_letters_total", (("kind", rows[0][1]),))
+
+    def _apply_batch(self, limit):
+        start = time.perf_counter()
+        offset = self._offset()
+        rows = self.spool.read(offset.last_seq, limit)
+        if not rows:
+            db.session.rollback()
+            # applied earlier but not yet deleted (crash between commit and delete)
+            self.spool.delete_through(self._last_seq)
+            return 0
+
+        parsed = [(seq, kind, user_id, task_id, json.loads(payload)) for seq, kind, user_id, task_id, payload in rows]
+        marks = self._sequence_marks(parsed)
+        groups = {}
+        replays = 0
+        for seq, kind, user_id, task_id, p in parsed:
+            if p.get("sequence"):
+                epoch, client_seq = p["sequence"]
+                key = (p["mode"], user_id, task_id, epoch)
+                mark = marks.get(key)
+                if mark is not None and mark.seq >= client_seq:
+                    replays += 1
+                    continue
+                if mark is None:
+                    mark = marks[key] = SaveSequence(study=p["mode"], user_id=user_id, task_id=task_id, epoch=epoch)
+                    db.session.add(mark)
+                mark.seq, mark.updated_at = client_seq, datetime.now(timezone.utc)
+            grp = groups.get((kind, user_id, task_id))
+            if grp is None:
+                grp = groups[(kind, user_id, task_id)] = {"task_metrics": {}}
+            grp["task_metrics"] = _merge_metrics(grp["task_metrics"], p.get("task_metrics"))
+            grp.update(seq=seq, payload=p)
+
+        tasks = {t.id: t for t in Task.query.filter(Task.id.in_({k[2] for k in groups}))}
+        answer_files, landmark_files = {}, {}
+        # replay in the order of each key's latest save, as the synchronous path would have
+        for (kind, user_id, task_id), grp in sorted(groups.items(), key=lambda kv: kv[1]["seq"]):
+            task = tasks.get(task_id)
+            if task is None:
+                continue
+            p = grp["payload"]
+            ts = datetime.fromisoformat(p["ts"])
+            landmarks = p.get("landmarks", [])
+            if kind == "answer":
+                entry = apply_answer(p["mode"], user_id, task_id, landmarks, grp["task_metrics"], ts)
+                answer_files.setdefault((user_id, p.get("hit_id"), p["mode"]), []).append({
+                    "task_id": task_id,
+                    "route_id": task.route_id,
+                    "drawing_path": getattr(entry, "drawing_path", None),
+                    "landmarks": landmarks,
+                    "task_metrics": grp["task_metrics"],
+                    "timestamp": p["ts"],
+                })
+            elif kind == "landmarks":
+                apply_landmarks(user_id, task, landmarks, ts)
+                landmark_files.setdefault(user_id, []).append(
+                    {"task_id": task_id, "landmarks": landmarks, "timestamp": p["ts"]})
+
+        offset.last_seq = rows[-1][0]
+        offset.updated_at = datetime.now(timezone.utc)
+        db.session.commit()
+        self._last_seq = offset.last_seq
+        self.spool.delete_through(self._last_seq)
+
+        # committed: a failure from here on must not send the batch to the dead table
+        routes_data = self.app.extensions.get("routes_data") or {}
+        try:
+            for (user_id, hit_id, mode), saves in answer_files.items():
+                write_answer_file(user_id, hit_id, mode, saves, routes_data)
+            for user_id, saves in landmark_files.items():
+                write_landmarks_file(user_id, saves)
+        except (OSError, ValueError) as e:
+            self.app.logger.warning("ingest: side files not written for saves through %d: %s", self._last_seq, e)
+
+        metrics = self.app.extensions.get("metrics")
+        if metrics is not None:
+            metrics.inc("ingest_applied_total", value=float(len(rows)))
+            metrics.inc("ingest_coalesced_total", value=float(len(rows) - replays - len(groups)))
+            metrics.inc("ingest_replays_total", value=float(replays))
+            metrics.observe("ingest_batch_duration_seconds", time.perf_counter() - start)
+        return len(rows)
+
+    @staticmethod
+    def _sequence_marks(parsed):
+        """SaveSequence rows for the sequenced saves in a batch, keyed by (study, user, task, epoch)."""
+        keys = {(p["mode"], user_id, task_id, p["sequence"][0]) for _, _, user_id, task_id, p in parsed if p.get("sequence")}
+        if not keys:
+            return {}
+        found = SaveSequence.query.filter(
+            SaveSequence.user_id.in_({k[1] for k in keys}),
+            SaveSequence.task_id.in_({k[2] for k in keys}),
+            SaveSequence.epoch.in_({k[3] for k in keys}),
+        )
+        marks = {(m.study, m.user_id, m.task_id, m.epoch): m for m in found}
+        return {k: m for k, m in marks.items() if k in keys}
+
+
+def init_ingest(app):
+    """
+    Opt-in (INGEST_MODE=async): save_answer and save_landmarks spool their writes and
+    return 202. Needs the tables to exist, so create_app calls it after the startup sync.
+    """
+    if app.config.get("INGEST_MODE") != "async":
+        return None
+    spool = IngestSpool(os.path.join(app.config["INGEST_SPOOL_DIR"], f"{app.config['APP_MODE']}.db"))
+    consumer = IngestConsumer(
+        app,
+        spool,
+        batch_size=app.config["INGEST_BATCH_SIZE"],
+        flush_seconds=app.config["INGEST_FLUSH_SECONDS"],
+    )
+    app.extensions["ingest"] = consumer
+    app.extensions["health"].add_backlog("ingest", consumer.depth)
+    # apply whatever a previous run left in the spool before taking traffic
+    recovered = consumer.drain()
+    if recovered:
+        app.logger.info("ingest: applied %d spooled saves left by a previous run", recovered)
+    return consumer
@@ -0,0 +1,242 @@
+"""
+Import from the legacy schema of src/old/app.py into this one. The legacy schema has one
+Response row per (user, task) with landmarks, drawing_path, duration and metrics_json,
+and a single served_count on Task. Each Response becomes:
+
+    a Drawing    if it has a drawing_path            (drawing_path, metrics_json, timestamp)
+    a Landmark   if it has a non-empty landmark list (landmarks, metrics_json, timestamp)
+
+Legacy users are matched to User rows by hit_id, and legacy tasks to Task rows by
+route_id. Any that are missing are created; routes absent from the routes file stay
+unscheduled. duration is dropped, because it was derived from the timing block in
+metrics_json, which is kept.
+
+Responses are read from the source database in keyset-paginated chunks (id > last id,
+by primary key), so memory use is bounded by the chunk size whatever the source size. Each
+chunk commits together with its MigrationCheckpoint row, so an interrupted run resumes
+after the last committed chunk. A (user, task) that already has a Drawing or Landmark
+is never written again, so reruns (and --restart) are idempotent. At the end,
+served_count_draw / served_count_landmarks are recomputed from the rows with one grouped
+UPDATE each.
+
+Drawing files keep their legacy names (<legacy user>_<legacy task>.png), unless
+drawings_dir is given. Then each file is copied into the drawing store under its new key,
+since legacy names can collide with those of new users. A file missing from drawings_dir
+leaves its Drawing row without a drawing_path.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from sqlalchemy import MetaData, Table, create_engine, func, insert, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import NoSuchTableError
+from src.shared.models import db, User, Task, Drawing, Landmark, MigrationCheckpoint
+from src.shared.drawing_store import drawing_key
+from src.shared.task_stats import ensure_stats_rows
+from src.shared.pairing import ensure_coverage_rows
+
+REQUIRED = {
+    "response": ("id", "user_id", "task_id"),
+    "user": ("id", "hit_id"),
+    "task": ("id", "route_id"),
+}
+RESPONSE_COLUMNS = ("id", "user_id", "task_id", "landmarks", "drawing_path", "metrics_json", "timestamp")
+USER_COLUMNS = ("hit_id", "prolific_pid", "prolific_study_id", "prolific_session_id", "created_at", "passed_quiz")
+TASK_COLUMNS = ("route_id", "landmarks", "endpoints")
+
+
+def source_key(url):
+    """Checkpoint key of a source database: a hash of its URL, password left out."""
+    safe = make_url(url).render_as_string(hide_password=True)
+    return "legacy:" + hashlib.sha256(safe.encode()).hexdigest()[:16]
+
+
+def reflect(engine):
+    """The legacy response/user/task tables. Raises ValueError if a required column is missing."""
+    md = MetaData()
+    tables = {}
+    for name, needed in REQUIRED.items():
+        try:
+            t = Table(name, md, autoload_with=engine)
+        except NoSuchTableError:
+            raise ValueError(f"legacy database has no {name!r} table") from None
+        missing = [c for c in needed if c not in t.c]
+        if missing:
+            raise ValueError(f"legacy table {name!r} has no column(s) {', '.join(missing)}")
+        tables[name] = t
+    return tables
+
+
+def _json_list(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    return value if isinstance(value, list) else []
+
+
+def _json_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _select(table, names):
+    return select(*(table.c[n] for n in names if n in table.c))
+
+
+def _resolve_users(conn, legacy, legacy_ids):
+    """({legacy user id: User.id}, created) for the given legacy ids; missing users are created by hit_id."""
+    rows = conn.execute(_select(legacy["user"], ("id",) + USER_COLUMNS).where(legacy["user"].c.id.in_(legacy_ids))).mappings().all()
+    hit_ids = [r["hit_id"] for r in rows]
+    have = dict(db.session.query(User.hit_id, User.id).filter(User.hit_id.in_(hit_ids)))
+    new = [
+        {**{c: r[c] for c in USER_COLUMNS if c in r}, "last_batch": [], "inflight_batch": False}
+        for r in {r["hit_id"]: r for r in rows if r["hit_id"] not in have}.values()
+    ]
+    if new:
+        db.session.execute(insert(User), new)
+        have = dict(db.session.query(User.hit_id, User.id).filter(User.hit_id.in_(hit_ids)))
+    return {r["id"]: have[r["hit_id"]] for r in rows}, len(new)
+
+
+def _resolve_tasks(conn, legacy, legacy_ids):
+    """({legacy task id: Task.id}, created) for the given legacy ids; missing tasks are created by route_id."""
+    rows = conn.execute(_select(legacy["task"], ("id",) + TASK_COLUMNS).where(legacy["task"].c.id.in_(legacy_ids))).mappings().all()
+    route_ids = [str(r["route_id"]) for r in rows]
+    have = dict(db.session.query(Task.route_id, Task.id).filter(Task.route_id.in_(route_ids)))
+    new = [
+        {
+            "route_id": rid,
+            "served_count_draw": 0,
+            "served_count_landmarks": 0,
+            "landmarks": _json_list(r.get("landmarks")),
+            "endpoints": _json_list(r.get("endpoints")),
+        }
+        for rid, r in {str(r["route_id"]): r for r in rows if str(r["route_id"]) not in have}.items()
+    ]
+    if new:
+        db.session.execute(insert(Task), new)
+        have = dict(db.session.query(Task.route_id, Task.id).filter(Task.route_id.in_(route_ids)))
+        ensure_stats_rows([have[t["route_id"]] for t in new])
+    return {r["id"]: have[str(r["route_id"])] for r in rows}, len(new)
+
+
+def _existing(model, user_ids, task_ids):
+    return set(
+        db.session.query(model.user_id, model.task_id)
+        .filter(model.user_id.in_(user_ids), model.task_id.in_(task_ids))
+    )
+
+
+def _copy_drawing(store, drawings_dir, legacy_path, user_id, task_id):
+    """Copy a legacy drawing file into the store under its new key; its ref, or None if the file is missing."""
+    src = os.path.join(drawings_dir, drawing_key(legacy_path))
+    try:
+        with open(src, "rb") as f:
+            return store.save(f"{user_id}_{task_id}.png", f, length=os.fstat(f.fileno()).st_size)
+    except FileNotFoundError:
+        return None
+
+
+def _migrate_chunk(conn, legacy, rows, ckpt, store, drawings_dir):
+    users, n_users = _resolve_users(conn, legacy, list({r["user_id"] for r in rows}))
+    tasks, n_tasks = _resolve_tasks(conn, legacy, list({r["task_id"] for r in rows}))
+    mapped = [(r, users.get(r["user_id"]), tasks.get(r["task_id"])) for r in rows]
+    mapped = [(r, u, t) for r, u, t in mapped if u is not None and t is not None]  # dangling legacy ids
+    uids, tids = {u for _, u, _ in mapped}, {t for _, _, t in mapped}
+    have_d, have_l = _existing(Drawing, uids, tids), _existing(Landmark, uids, tids)
+
+    drawings, landmarks = [], []
+    for r, u, t in mapped:
+        ts = r.get("timestamp") or datetime.now(timezone.utc)
+        metrics = _json_text(r.get("metrics_json"))
+        path = r.get("drawing_path")
+        if path and (u, t) not in have_d:
+            if drawings_dir is not None:
+                path = _copy_drawing(store, drawings_dir, path, u, t)
+            drawings.append({"user_id": u, "task_id": t, "drawing_path": path, "metrics_json": metrics, "timestamp": ts})
+            have_d.add((u, t))
+        marks = _json_list(r.get("landmarks"))
+        if marks and (u, t) not in have_l:
+            landmarks.append({"user_id": u, "task_id": t, "landmarks": marks, "metrics_json": metrics, "timestamp": ts})
+            have_l.add((u, t))
+    if drawings:
+        db.session.execute(insert(Drawing), drawings)
+    if landmarks:
+        db.session.execute(insert(Landmark), landmarks)
+
+    ckpt.last_id = rows[-1]["id"]
+    ckpt.rows_read += len(rows)
+    ckpt.users += n_users
+    ckpt.tasks += n_tasks
+    ckpt.drawings += len(drawings)
+    ckpt.landmarks += len(landmarks)
+    ckpt.updated_at = datetime.now(timezone.utc)
+
+
+def recount_served():
+    """Set served_count_draw / served_count_landmarks from the Drawing and Landmark rows (the caller commits)."""
+    for column, model, where in (
+        ("served_count_draw", Drawing, (Drawing.drawing_path.isnot(None),)),
+        ("served_count_landmarks", Landmark, ()),
+    ):
+        counts = (
+            select(model.task_id, func.count().label("n"))
+            .where(*where).group_by(model.task_id)
+            .subquery()
+        )
+        db.session.execute(update(Task).values({column: 0}))
+        db.session.execute(update(Task).where(Task.id == counts.c.task_id).values({column: counts.c.n}))
+
+
+def _progress(ckpt):
+    return {c: getattr(ckpt, c) for c in ("last_id", "rows_read", "users", "tasks", "drawings", "landmarks")}
+
+
+def migrate(source_url, chunk_size=5000, restart=False, store=None, drawings_dir=None):
+    """
+    Import every legacy Response after the checkpoint, chunk_size rows per transaction.
+    Yields the progress after each chunk, and once more after the recount.
+    """
+    if make_url(source_url) == db.engine.url:
+        raise ValueError("the legacy database must not be the one the app uses")
+    db.create_all()
+    for model in (Drawing, Landmark):
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)  # tables that predate the index don't get it from create_all
+
+    key = source_key(source_url)
+    ckpt = db.session.get(MigrationCheckpoint, key)
+    if ckpt is None or restart:
+        if ckpt is not None:
+            db.session.delete(ckpt)
+            db.session.flush()
+        ckpt = MigrationCheckpoint(source=key, last_id=0, rows_read=0, users=0, tasks=0, drawings=0, landmarks=0)
+        db.session.add(ckpt)
+    ckpt.finished_at = None
+    db.session.commit()
+
+    source = create_engine(source_url)
+    try:
+        legacy = reflect(source)
+        response = legacy["response"]
+        q = _select(response, RESPONSE_COLUMNS).order_by(response.c.id).limit(chunk_size)
+        with source.connect() as conn:
+            while True:
+                rows = conn.execute(q.where(response.c.id > ckpt.last_id)).mappings().all()
+                if not rows:
+                    break
+                _migrate_chunk(conn, legacy, rows, ckpt, store, drawings_dir)
+                db.session.commit()
+                yield _progress(ckpt)
+    finally:
+        source.dispose()
+
+    recount_served()
+    ensure_coverage_rows()
+    ckpt.finished_at = datetime.now(timezone.utc)
+    db.session.commit()
+    yield _progress(ckpt)
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+
+
+class MediaIndex:
+    """
+    In-memory index of the media directories (relative path -> (size, mtime_ns)).
+
+    The first lookup triggers a full scan; after that, lookups trigger an incremental
+    rescan at most every `rescan_seconds`, which only re-lists directories whose
+    mtime changed (i.e. files were added, removed or renamed). Roots that do not
+    exist on this host are reported as unreachable and never count media as missing.
+
+    A lookup of a file that isn't indexed probes the disk once; a miss is then
+    remembered until the next rescan, so repeated requests for missing media don't
+    touch the disk. Writers in this process call changed() to drop a stale entry.
+    """
+
+    MAX_MISSES = 100000  # per root; beyond that the remembered misses are dropped
+
+    def __init__(self, roots: dict, rescan_seconds: float = 300.0):
+        self.roots = {kind: str(path) for kind, path in roots.items()}
+        self.rescan_seconds = rescan_seconds
+        self._files = {kind: {} for kind in self.roots}
+        self._dirs = {kind: {} for kind in self.roots}  # rel_dir -> (mtime_ns, files, subdirs)
+        self._missing = {kind: set() for kind in self.roots}  # probed and absent since the last rescan
+        self._reachable = {kind: False for kind in self.roots}
+        self._scanned_at = None
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._unavailable = None
+
+    # ---- scanning ----
+    def _scan_dir(self, kind, root, rel_dir, files, dirs):
+        path = os.path.join(root, rel_dir) if rel_dir else root
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+
+        old = self._dirs[kind].get(rel_dir)
+        if old and old[0] == st.st_mtime_ns:
+            # listing unchanged since the last scan: reuse it instead of re-stat'ing every file
+            _, file_rels, subdirs = old
+            prev = self._files[kind]
+            for rel in file_rels:
+                if rel in prev:
+                    files[rel] = prev[rel]
+        else:
+            file_rels, subdirs = [], []
+            with os.scandir(path) as it:
+                for entry in it:
+                    rel = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                    try:
+                        if entry.is_dir():
+                            subdirs.append(rel)
+                        elif entry.is_file():
+                            est = entry.stat()
+                            files[rel] = (est.st_size, est.st_mtime_ns)
+                            file_rels.append(rel)
+                    except OSError:
+                        continue
+
+        dirs[rel_dir] = (st.st_mtime_ns, file_rels, subdirs)
+        for sub in subdirs:
+            self._scan_dir(kind, root, sub, files, dirs)
+
+    def rescan(self):
+        with self._lock:
+            self._rescan_locked()
+
+    def _rescan_locked(self):
+        for kind, root in self.roots.items():
+            files, dirs = {}, {}
+            self._reachable[kind] = os.path.isdir(root)
+            if self._reachable[kind]:
+                self._scan_dir(kind, root, "", files, dirs)
+            # swap whole dicts so concurrent readers never see a half-built index
+            self._files[kind] = files
+            self._dirs[kind] = dirs
+            self._missing[kind] = set()
+        self._scanned_at = time.monotonic()
+        self.generation += 1
+
+    def _maybe_refresh(self):
+        if self._scanned_at is None:
+            self.rescan()
+            return
+        if time.monotonic() - self._scanned_at < self.rescan_seconds:
+            return
+        # one request pays for the rescan; the rest keep reading the previous index
+        if self._lock.acquire(blocking=False):
+            try:
+                self._rescan_locked()
+            finally:
+                self._lock.release()
+
+    # ---- lookups ----
+    def reachable(self, kind) -> bool:
+        self._maybe_refresh()
+        return self._reachable.get(kind, False)
+
+    def stat(self, kind, rel):
+        """(size, mtime_ns) for a file under a media root, or None if it is not there."""
+        self._maybe_refresh()
+        rel = os.path.normpath(rel).lstrip(os.sep)
+        meta = self._files.get(kind, {}).get(rel)
+        if meta is None and self._reachable.get(kind):
+            missing = self._missing[kind]
+            if rel in missing:
+                return None
+            # not indexed yet (e.g. written since the last rescan): probe once and remember it
+            try:
+                st = os.stat(os.path.join(self.roots[kind], rel))
+            except OSError:
+                if len(missing) >= self.MAX_MISSES:
+                    missing.clear()
+                missing.add(rel)
+                return None
+            meta = (st.st_size, st.st_mtime_ns)
+            self._files[kind][rel] = meta
+        return meta
+
+    def changed(self, kind, rel):
+        """Forget what is known about one file (written or removed in this process); the next lookup probes it."""
+        rel = os.path.normpath(rel).lstrip(os.sep)
+        self._files.get(kind, {}).pop(rel, None)
+        self._missing.get(kind, set()).discard(rel)
+
+    def exists(self, kind, rel) -> bool:
+        return self.stat(kind, rel) is not None
+
+    def counts(self) -> dict:
+        return {kind: len(files) for kind, files in self._files.items()}
+
+    # ---- route availability ----
+    def missing_route_media(self, routes_data) -> dict:
+        """route_id -> list of media paths that are missing, for routes with any missing media."""
+        missing = {}
+        for rid, rd in routes_data.items():
+            gaps = []
+            if self.reachable("maps") and not self.exists("maps", os.path.basename(rd["map"])):
+                gaps.append(rd["map"])
+            if self.reachable("observations"):
+                gaps.extend(o for o in rd["observations"] if not self.exists("observations", os.path.basename(o)))
+            if self.reachable("videos") and not self.exists("videos", f"{rid}.mp4"):
+                gaps.append(f"{rid}.mp4")
+            if gaps:
+                missing[rid] = gaps
+        return missing
+
+    def unavailable_route_ids(self, routes_data) -> set:
+        """Route ids to keep out of scheduling; cached until the index or the routes change."""
+        self._maybe_refresh()
+        cached = self._unavailable
+        if cached is None or cached[0] != self.generation or cached[1] is not routes_data:
+            cached = (self.generation, routes_data, set(self.missing_route_media(routes_data)))
+            self._unavailable = cached
+        return cached[2]
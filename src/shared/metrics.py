@@ -0,0 +1,272 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+SAVE_ENDPOINTS = ("/save_answer", "/save_drawing", "/save_landmarks")
+
+# name -> (type, help)
+METRICS = {
+    "http_requests_total": ("counter", "Requests handled, by endpoint and status."),
+    "http_request_duration_seconds": ("histogram", "Request latency, by endpoint."),
+    "http_request_size_bytes": ("histogram", "Request body size, by endpoint."),
+    "http_response_size_bytes": ("histogram", "Response body size, by endpoint."),
+    "http_requests_in_flight": ("gauge", "Requests currently being handled."),
+    "autosaves_total": ("counter", "Successful save requests, by endpoint."),
+    "autosaves_shed_total": ("counter", "Timer-driven saves refused with 503 under load, by endpoint."),
+    "db_commit_duration_seconds": ("histogram", "Time spent in session.commit (flush included)."),
+    "ingest_enqueued_total": ("counter", "Saves written to the ingest spool, by kind."),
+    "ingest_applied_total": ("counter", "Spooled saves applied to the database (before coalescing)."),
+    "ingest_coalesced_total": ("counter", "Spooled saves folded into a later save for the same user and task."),
+    "ingest_replays_total": ("counter", "Spooled sequenced saves dropped as already applied."),
+    "ingest_dead_letters_total": ("counter", "Spooled saves that failed on their own and were moved to the dead-letter table."),
+    "ingest_batch_duration_seconds": ("histogram", "Time to apply and commit one spool batch."),
+    "ingest_queue_depth": ("gauge", "Spooled saves not yet applied."),
+    "ingest_lag_seconds": ("gauge", "Age of the oldest spooled save not yet applied."),
+}
+
+
+class MetricsRegistry:
+    """
+    Per-process counters, gauges and histograms. With a directory configured, each
+    process periodically dumps its values to <dir>/<pid>.json from a daemon thread and
+    /metrics sums every file, so the numbers are correct across gunicorn workers.
+    Gauges of processes that have exited are dropped; their counters are kept.
+    """
+
+    def __init__(self, directory=None, flush_interval=2.0, const_labels=(), name=None):
+        self.directory = directory
+        self.name = name  # tells apart registries sharing a process (combined deployment)
+        self.flush_interval = flush_interval
+        self.const_labels = tuple(const_labels)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._flusher_pid = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    # ---- recording (hot path: a lock and a couple of dict updates) ----
+    def inc(self, name, labels=(), value=1.0):
+        key = (name, self.const_labels + labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def add_gauge(self, name, labels=(), value=1.0):
+        key = (name, self.const_labels + labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0.0) + value
+
+    def set_gauge(self, name, value, labels=()):
+        key = (name, self.const_labels + labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, labels=(), buckets=LATENCY_BUCKETS):
+        key = (name, self.const_labels + labels)
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = {"buckets": list(buckets), "counts": [0] * (len(buckets) + 1), "sum": 0.0}
+            h["counts"][bisect_left(buckets, value)] += 1
+            h["sum"] += value
+
+    # ---- multiprocess files ----
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "counters": [[n, list(l), v] for (n, l), v in self._counters.items()],
+                "gauges": [[n, list(l), v] for (n, l), v in self._gauges.items()],
+                "histograms": [[n, list(l), h["buckets"], list(h["counts"]), h["sum"]]
+                               for (n, l), h in self._histograms.items()],
+            }
+
+    def flush(self):
+        if not self.directory:
+            return
+        fname = f"{os.getpid()}-{self.name}.json" if self.name else f"{os.getpid()}.json"
+        path = os.path.join(self.directory, fname)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def ensure_flusher(self):
+        # started lazily so each forked worker gets its own thread
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def _loop():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+        threading.Thread(target=_loop, name="metrics-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _snapshots(self):
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        snaps = []
+        for fname in os.listdir(self.directory):
+            if not fname.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, fname), "r") as f:
+                    snaps.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snaps
+
+    def collect(self):
+        counters, gauges, histograms = {}, {}, {}
+        for snap in self._snapshots():
+            alive = _pid_alive(snap.get("pid"))
+            for n, l, v in snap["counters"]:
+                key = (n, tuple(map(tuple, l)))
+                counters[key] = counters.get(key, 0.0) + v
+            if alive:
+                for n, l, v in snap["gauges"]:
+                    key = (n, tuple(map(tuple, l)))
+                    gauges[key] = gauges.get(key, 0.0) + v
+            for n, l, buckets, counts, total in snap["histograms"]:
+                key = (n, tuple(map(tuple, l)))
+                h = histograms.setdefault(key, {"buckets": buckets, "counts": [0] * len(counts), "sum": 0.0})
+                h["counts"] = [a + b for a, b in zip(h["counts"], counts)]
+                h["sum"] += total
+        return counters, gauges, histograms
+
+    # ---- exposition ----
+    def render(self):
+        counters, gauges, histograms = self.collect()
+        by_name = {}
+        for (n, l), v in sorted(counters.items()):
+            by_name.setdefault(n, []).append(f"{n}{_fmt_labels(l)} {_fmt(v)}")
+        for (n, l), v in sorted(gauges.items()):
+            by_name.setdefault(n, []).append(f"{n}{_fmt_labels(l)} {_fmt(v)}")
+        for (n, l), h in sorted(histograms.items(), key=lambda kv: kv[0]):
+            lines = by_name.setdefault(n, [])
+            cum = 0
+            for le, c in zip(list(h["buckets"]) + ["+Inf"], h["counts"]):
+                cum += c
+                lines.append(f"{n}_bucket{_fmt_labels(l + (('le', str(le)),))} {cum}")
+            lines.append(f"{n}_sum{_fmt_labels(l)} {_fmt(h['sum'])}")
+            lines.append(f"{n}_count{_fmt_labels(l)} {cum}")
+
+        out = []
+        for n in sorted(by_name):
+            kind, help_text = METRICS.get(n, ("untyped", ""))
+            out.append(f"# HELP {n} {help_text}")
+            out.append(f"# TYPE {n} {kind}")
+            out.extend(by_name[n])
+        return "\n".join(out) + "\n"
+
+
+def _pid_alive(pid):
+    if pid is None or pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _fmt(v):
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _endpoint_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else "unmatched"
+
+
+def init_metrics(app):
+    """Attach the registry, request hooks, commit timing and the /metrics endpoint."""
+    registry = MetricsRegistry(
+        directory=app.config.get("METRICS_DIR"),
+        const_labels=(("app", app.config["APP_MODE"]),),
+        name=app.config["APP_MODE"],
+    )
+    app.extensions["metrics"] = registry
+
+    @app.before_request
+    def _metrics_start():
+        registry.ensure_flusher()
+        g._metrics_start = time.perf_counter()
+        registry.add_gauge("http_requests_in_flight")
+        if request.content_length:
+            registry.observe("http_request_size_bytes", request.content_length,
+                             (("endpoint", _endpoint_label()),), SIZE_BUCKETS)
+
+    @app.after_request
+    def _metrics_record(response):
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return response
+        endpoint = _endpoint_label()
+        registry.observe("http_request_duration_seconds", time.perf_counter() - start, (("endpoint", endpoint),))
+        registry.inc("http_requests_total", (("endpoint", endpoint), ("status", str(response.status_code))))
+        size = response.calculate_content_length()
+        if size is not None:
+            registry.observe("http_response_size_bytes", size, (("endpoint", endpoint),), SIZE_BUCKETS)
+        if endpoint in SAVE_ENDPOINTS and response.status_code < 400:
+            registry.inc("autosaves_total", (("endpoint", endpoint),))
+        return response
+
+    @app.teardown_request
+    def _metrics_done(exc=None):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            # after_request never ran: the view raised
+            endpoint = _endpoint_label()
+            registry.observe("http_request_duration_seconds", time.perf_counter() - start, (("endpoint", endpoint),))
+            registry.inc("http_requests_total", (("endpoint", endpoint), ("status", "500")))
+        registry.add_gauge("http_requests_in_flight", value=-1.0)
+
+    # Session events are global: with several apps in one process, only count our own commits
+    def _ours():
+        return not has_app_context() or current_app._get_current_object() is app
+
+    @event.listens_for(Session, "before_commit")
+    def _commit_start(session):
+        if _ours():
+            session.info["_metrics_commit_start"] = time.perf_counter()
+
+    @event.listens_for(Session, "after_commit")
+    def _commit_end(session):
+        start = session.info.pop("_metrics_commit_start", None)
+        if start is not None:
+            registry.observe("db_commit_duration_seconds", time.perf_counter() - start)
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+    return registry
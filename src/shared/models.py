@@ -39,6 +39,8 @@ class Drawing(db.Model):
     metrics_json = db.Column(db.Text, nullable=True)
     timestamp       = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
+    __table_args__ = (db.Index("ix_drawing_user_task", "user_id", "task_id"),)
+
 class Landmark(db.Model):
     id              = db.Column(db.Integer, primary_key=True)
     user_id         = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
@@ -46,3 +48,197 @@ class Landmark(db.Model):
     landmarks       = db.Column(db.JSON, default=list)
     metrics_json = db.Column(db.Text, nullable=True)
     timestamp       = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (db.Index("ix_landmark_user_task", "user_id", "task_id"),)
+
+class ClientTelemetry(db.Model):
+    # append-only client timing samples; no FKs so inserts stay cheap
+    id              = db.Column(db.Integer, primary_key=True)
+    received_at     = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    user_id         = db.Column(db.Integer, nullable=True)
+    study           = db.Column(db.String(16), nullable=False)
+    route_id        = db.Column(db.String, nullable=True)
+    metric          = db.Column(db.String(32), nullable=False)
+    value_ms        = db.Column(db.Float, nullable=False)
+    browser         = db.Column(db.String(16), nullable=True)
+
+    __table_args__ = (db.Index("ix_client_telemetry_metric_study", "metric", "study"),)
+
+class IngestOffset(db.Model):
+    # highest spool sequence applied to this database; committed together with the saves it covers
+    spool_id        = db.Column(db.String(32), primary_key=True)
+    last_seq        = db.Column(db.Integer, nullable=False, default=0)
+    updated_at      = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class SaveSequence(db.Model):
+    # high-water mark of sequenced save_answer deltas per (study, user, task, client epoch);
+    # a save at or below its epoch's mark is a replay and is not applied again. One mark
+    # per epoch, so saves from two tabs or a late retry from an older epoch can interleave
+    # without either being applied twice. (The table replaced save_sequence, which kept a
+    # single mark per task.)
+    __tablename__ = "save_sequence_epoch"
+    study           = db.Column(db.String(16), primary_key=True)
+    user_id         = db.Column(db.Integer, primary_key=True)
+    task_id         = db.Column(db.Integer, primary_key=True)
+    epoch           = db.Column(db.String(32), primary_key=True)
+    seq             = db.Column(db.Integer, nullable=False)
+    updated_at      = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class TaskStats(db.Model):
+    # running per-task aggregates over Drawing/Landmark metrics, updated in each save's
+    # transaction (src/shared/task_stats.py); histograms are bucket counts
+    __tablename__ = "task_stats"
+    study           = db.Column(db.String(16), primary_key=True)
+    task_id         = db.Column(db.Integer, db.ForeignKey("task.id"), primary_key=True)
+    answers         = db.Column(db.Integer, nullable=False, default=0)
+    duration_n      = db.Column(db.Integer, nullable=False, default=0)
+    duration_sum    = db.Column(db.Float, nullable=False, default=0.0)
+    duration_sumsq  = db.Column(db.Float, nullable=False, default=0.0)
+    duration_hist   = db.Column(db.JSON, default=list)
+    strokes_n       = db.Column(db.Integer, nullable=False, default=0)
+    strokes_sum     = db.Column(db.Float, nullable=False, default=0.0)
+    strokes_sumsq   = db.Column(db.Float, nullable=False, default=0.0)
+    watch_n         = db.Column(db.Integer, nullable=False, default=0)
+    watch_sum       = db.Column(db.Float, nullable=False, default=0.0)
+    watch_sumsq     = db.Column(db.Float, nullable=False, default=0.0)
+    watch_hist      = db.Column(db.JSON, default=list)
+    updated_at      = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class StrokeData(db.Model):
+    # stroke totals of one answer; the history itself is its StrokeChunk rows, appended one
+    # per save. Replaced stroke_data, which rewrote the whole history as one blob per save
+    __tablename__ = "stroke_totals"
+    study           = db.Column(db.String(16), primary_key=True)
+    user_id         = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    task_id         = db.Column(db.Integer, db.ForeignKey("task.id"), primary_key=True)
+    n_chunks        = db.Column(db.Integer, nullable=False, default=0)
+    n_strokes       = db.Column(db.Integer, nullable=False, default=0)
+    n_points        = db.Column(db.Integer, nullable=False, default=0)
+    updated_at      = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class StrokeChunk(db.Model):
+    # the strokes of one save, packed by src/shared/strokes.py; an answer's full history is
+    # its chunks in seq order
+    __tablename__ = "stroke_chunk"
+    study           = db.Column(db.String(16), primary_key=True)
+    user_id         = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    task_id         = db.Column(db.Integer, db.ForeignKey("task.id"), primary_key=True)
+    seq             = db.Column(db.Integer, primary_key=True)
+    n_strokes       = db.Column(db.Integer, nullable=False)
+    n_points        = db.Column(db.Integer, nullable=False)
+    blob            = db.Column(db.LargeBinary, nullable=False)
+    created_at      = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class StrokeGrid(db.Model):
+    # running GRID x GRID histogram of an answer's stroke points on its canvas, so scoring a
+    # save bins only the new points (src/shared/effort.py)
+    __tablename__ = "stroke_grid"
+    study           = db.Column(db.String(16), primary_key=True)
+    user_id         = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    task_id         = db.Column(db.Integer, db.ForeignKey("task.id"), primary_key=True)
+    width           = db.Column(db.Float, nullable=False)
+    height          = db.Column(db.Float, nullable=False)
+    counts          = db.Column(db.JSON, nullable=False)
+    updated_at      = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class EffortScore(db.Model):
+    # server-side effort gate per answer (src/shared/effort.py); NULL features are not known yet
+    __tablename__ = "effort_score"
+    study           = db.Column(db.String(16), primary_key=True)
+    user_id         = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    task_id         = db.Column(db.Integer, db.ForeignKey("task.id"), primary_key=True)
+    score           = db.Column(db.Float, nullable=False, default=0.0)
+    ok              = db.Column(db.Boolean, nullable=False, default=False, index=True)
+    blank           = db.Column(db.Boolean, nullable=False, default=False)
+    flags           = db.Column(db.JSON, default=list)
+    stroke_count    = db.Column(db.Integer, nullable=True)
+    span_s          = db.Column(db.Float, nullable=True)
+    entropy         = db.Column(db.Float, nullable=True)
+    reached_frac    = db.Column(db.Float, nullable=True)
+    watch_frac      = db.Column(db.Float, nullable=True)
+    ink_coverage    = db.Column(db.Float, nullable=True)
+    version         = db.Column(db.Integer, nullable=False, default=0)
+    scored_at       = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class LandmarkAgreement(db.Model):
+    # inter-annotator agreement over a task's landmark orderings (src/shared/agreement.py);
+    # the statistics are means over annotator pairs
+    __tablename__ = "landmark_agreement"
+    task_id         = db.Column(db.Integer, db.ForeignKey("task.id"), primary_key=True)
+    annotators      = db.Column(db.Integer, nullable=False, default=0)
+    pairs           = db.Column(db.Integer, nullable=False, default=0)
+    kendall_distance = db.Column(db.Float, nullable=True)
+    lcs             = db.Column(db.Float, nullable=True)
+    positional      = db.Column(db.Float, nullable=True)
+    consensus       = db.Column(db.JSON, default=list)
+    support         = db.Column(db.JSON, default=list)
+    computed_at     = db.Column(db.DateTime, nullable=False)
+
+class ImageHash(db.Model):
+    # 64-bit perceptual hash of a drawing or route map (src/shared/phash.py); c0..c3 are its
+    # 16-bit quarters, indexed for multi-index Hamming lookups
+    __tablename__ = "image_hash"
+    id              = db.Column(db.Integer, primary_key=True)
+    kind            = db.Column(db.String(8), nullable=False)  # "drawing" | "map"
+    key             = db.Column(db.String(255), nullable=False)  # drawing key or map file name
+    user_id         = db.Column(db.Integer, nullable=True)
+    task_id         = db.Column(db.Integer, nullable=True)
+    route_id        = db.Column(db.String, nullable=True)
+    phash           = db.Column(db.BigInteger, nullable=False)
+    bits            = db.Column(db.Integer, nullable=False)
+    c0              = db.Column(db.Integer, nullable=False, index=True)
+    c1              = db.Column(db.Integer, nullable=False, index=True)
+    c2              = db.Column(db.Integer, nullable=False, index=True)
+    c3              = db.Column(db.Integer, nullable=False, index=True)
+    source_mtime_ns = db.Column(db.BigInteger, nullable=True)
+    updated_at      = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (db.UniqueConstraint("kind", "key", name="uq_image_hash_kind_key"),)
+
+class DuplicateFlag(db.Model):
+    # drawings found near-identical to another drawing or a route map by `flask flag-duplicates`
+    __tablename__ = "duplicate_flag"
+    id              = db.Column(db.Integer, primary_key=True)
+    user_id         = db.Column(db.Integer, nullable=False, index=True)
+    task_id         = db.Column(db.Integer, nullable=False)
+    reason          = db.Column(db.String(8), nullable=False)  # "self" | "shared" | "map"
+    other           = db.Column(db.String(264), nullable=False)  # "<kind>:<key>" of the match
+    distance        = db.Column(db.Integer, nullable=False)
+    flagged_at      = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class DrawingCoverage(db.Model):
+    # landmark-study slots per drawing (src/shared/pairing.py): slots counts annotators paired
+    # with it (open assignments plus finished ones), annotated only the finished ones
+    __tablename__ = "drawing_coverage"
+    drawing_id      = db.Column(db.Integer, db.ForeignKey("drawing.id"), primary_key=True)
+    task_id         = db.Column(db.Integer, db.ForeignKey("task.id"), nullable=False)
+    slots           = db.Column(db.Integer, nullable=False, default=0)
+    annotated       = db.Column(db.Integer, nullable=False, default=0)
+    updated_at      = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (db.Index("ix_drawing_coverage_task_slots", "task_id", "slots"),)
+
+class LandmarkAssignment(db.Model):
+    # which drawing an annotator was given for a task; open until they save landmarks for it
+    __tablename__ = "landmark_assignment"
+    user_id         = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    task_id         = db.Column(db.Integer, db.ForeignKey("task.id"), primary_key=True)
+    drawing_id      = db.Column(db.Integer, db.ForeignKey("drawing.id"), nullable=False)
+    assigned_at     = db.Column(db.DateTime, nullable=False)
+    done            = db.Column(db.Boolean, nullable=False, default=False)
+
+    __table_args__ = (db.Index("ix_landmark_assignment_open", "done", "assigned_at"),)
+
+class MigrationCheckpoint(db.Model):
+    # keyset position of a legacy import (src/shared/legacy_migrate.py); committed together
+    # with the rows of each chunk, so a rerun resumes after the last committed one
+    __tablename__ = "migration_checkpoint"
+    source          = db.Column(db.String(64), primary_key=True)
+    last_id         = db.Column(db.Integer, nullable=False, default=0)
+    rows_read       = db.Column(db.Integer, nullable=False, default=0)
+    users           = db.Column(db.Integer, nullable=False, default=0)
+    tasks           = db.Column(db.Integer, nullable=False, default=0)
+    drawings        = db.Column(db.Integer, nullable=False, default=0)
+    landmarks       = db.Column(db.Integer, nullable=False, default=0)
+    finished_at     = db.Column(db.DateTime, nullable=True)
+    updated_at      = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,165 @@
+"""
+Landmark-study pairing: which drawing each annotator landmarks. The unit of work is a
+(drawing, annotator) slot. DrawingCoverage counts a drawing's slots; a slot is taken
+when the drawing is handed out and finished when the annotator saves landmarks for
+that task. Slots left unanswered past the TTL are released.
+
+next_batch takes, per task, the drawing that is best by (quality tier, slots taken).
+It only considers drawings below the target count on tasks the annotator hasn't done.
+The top tier is an effort score of at least LANDMARK_MIN_EFFORT and no duplicate flag.
+Lower-tier drawings are served only when no preferred drawing of the task has a free
+slot. All of this is one windowed query over indexed columns, and each slot is
+claimed by a guarded UPDATE, so concurrent batches can't push a drawing past the target.
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, case, delete, exists, func, insert, select, tuple_, update
+from src.shared.models import db, Task, Drawing, Landmark, EffortScore, DuplicateFlag, DrawingCoverage, LandmarkAssignment
+
+RELEASE_LIMIT = 500  # expired assignments freed per call; any more wait for the next batch request
+
+
+def ensure_coverage_rows():
+    """Create missing coverage rows for drawings that have an image (e.g. saved before pairing existed)."""
+    missing = (
+        select(Drawing.id, Drawing.task_id)
+        .outerjoin(DrawingCoverage, DrawingCoverage.drawing_id == Drawing.id)
+        .where(Drawing.drawing_path.isnot(None), DrawingCoverage.drawing_id.is_(None))
+    )
+    db.session.execute(insert(DrawingCoverage).from_select(["drawing_id", "task_id"], missing))
+
+
+def ensure_coverage(drawing):
+    """Stage a coverage row for a drawing that just got its first image (the caller commits)."""
+    if drawing.id is None:
+        db.session.flush()
+    if db.session.get(DrawingCoverage, drawing.id) is None:
+        db.session.add(DrawingCoverage(drawing_id=drawing.id, task_id=drawing.task_id, slots=0, annotated=0))
+
+
+def release_expired(ttl_seconds, limit=RELEASE_LIMIT):
+    """
+    Free the slots of up to `limit` assignments nobody answered within ttl_seconds, oldest
+    first: one DELETE that returns their drawings and one UPDATE of those drawings'
+    coverage. A concurrent call can't free the same slot twice, since only the rows its
+    own DELETE removed are counted. Returns how many were freed.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=ttl_seconds)
+    stale = (
+        select(LandmarkAssignment.user_id, LandmarkAssignment.task_id)
+        .where(LandmarkAssignment.done.is_(False), LandmarkAssignment.assigned_at < cutoff)
+        .order_by(LandmarkAssignment.assigned_at)
+        .limit(limit)
+    )
+    freed = db.session.execute(
+        delete(LandmarkAssignment)
+        .where(tuple_(LandmarkAssignment.user_id, LandmarkAssignment.task_id).in_(stale),
+               LandmarkAssignment.done.is_(False))
+        .returning(LandmarkAssignment.drawing_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    if freed:
+        per_drawing = Counter(freed)
+        db.session.execute(
+            update(DrawingCoverage)
+            .where(DrawingCoverage.drawing_id.in_(per_drawing))
+            .values(slots=DrawingCoverage.slots - case(per_drawing, value=DrawingCoverage.drawing_id))
+            .execution_options(synchronize_session=False)
+        )
+    return len(freed)
+
+
+def _candidates(user_id, n, target, min_effort, unavailable_routes, skip, chosen_tasks=()):
+    """Best free drawing per task for this annotator, best first: [(task_id, drawing_id)]."""
+    flagged = exists().where(DuplicateFlag.user_id == Drawing.user_id, DuplicateFlag.task_id == Drawing.task_id)
+    tier = case((and_(EffortScore.score >= min_effort, ~flagged), 0), else_=1)
+    done_tasks = select(Landmark.task_id).where(Landmark.user_id == user_id)
+    held_tasks = select(LandmarkAssignment.task_id).where(LandmarkAssignment.user_id == user_id)
+    ranked = (
+        select(
+            DrawingCoverage.task_id,
+            DrawingCoverage.drawing_id,
+            tier.label("tier"),
+            DrawingCoverage.slots,
+            func.row_number().over(
+                partition_by=DrawingCoverage.task_id,
+                order_by=(tier, DrawingCoverage.slots, DrawingCoverage.drawing_id),
+            ).label("rank"),
+        )
+        .join(Drawing, Drawing.id == DrawingCoverage.drawing_id)
+        .join(Task, Task.id == DrawingCoverage.task_id)
+        .outerjoin(EffortScore, and_(
+            EffortScore.study == "draw", EffortScore.user_id == Drawing.user_id, EffortScore.task_id == Drawing.task_id,
+        ))
+        .where(
+            DrawingCoverage.slots < target,
+            Drawing.user_id != user_id,
+            DrawingCoverage.task_id.notin_(done_tasks),
+            DrawingCoverage.task_id.notin_(held_tasks),
+            DrawingCoverage.task_id.notin_(list(chosen_tasks)),
+            Task.route_id.notin_(unavailable_routes),
+            DrawingCoverage.drawing_id.notin_(skip),
+        )
+        .subquery()
+    )
+    q = (
+        select(ranked.c.task_id, ranked.c.drawing_id)
+        .where(ranked.c.rank == 1)
+        .order_by(ranked.c.tier, ranked.c.slots, ranked.c.task_id)
+        .limit(n)
+    )
+    return db.session.execute(q).all()
+
+
+def assign(user_id, n, target, min_effort, unavailable_routes=()):
+    """
+    Claim up to n slots for the annotator, one drawing per task, and stage their
+    assignments (the caller commits). Returns {task_id: drawing_id}.
+    """
+    chosen, skip = {}, set()
+    now = datetime.now(timezone.utc)
+    # one UPDATE per slot is the claim itself; the assignments are added together at the
+    # end, since each UPDATE would otherwise autoflush the previous one as its own INSERT
+    for _ in range(3):  # a slot lost to a concurrent batch is replaced by the next best
+        missing = n - len(chosen)
+        if missing <= 0:
+            break
+        rows = _candidates(user_id, missing, target, min_effort, list(unavailable_routes), list(skip), chosen)
+        if not rows:
+            break
+        for task_id, drawing_id in rows:
+            if task_id in chosen:
+                continue
+            claimed = DrawingCoverage.query.filter(
+                DrawingCoverage.drawing_id == drawing_id, DrawingCoverage.slots < target,
+            ).update({"slots": DrawingCoverage.slots + 1, "updated_at": now}, synchronize_session=False)
+            if not claimed:
+                skip.add(drawing_id)
+                continue
+            chosen[task_id] = drawing_id
+    db.session.add_all(
+        LandmarkAssignment(user_id=user_id, task_id=task_id, drawing_id=drawing_id, assigned_at=now)
+        for task_id, drawing_id in chosen.items()
+    )
+    return chosen
+
+
+def record_annotation(user_id, task_id):
+    """Mark the annotator's slot on this task finished (idempotent; the caller commits)."""
+    a = db.session.get(LandmarkAssignment, (user_id, task_id))
+    if a is None or a.done:
+        return
+    a.done = True
+    DrawingCoverage.query.filter_by(drawing_id=a.drawing_id).update(
+        {"annotated": DrawingCoverage.annotated + 1, "updated_at": datetime.now(timezone.utc)},
+        synchronize_session=False)
+
+
+def assigned_drawings(user_id, task_ids):
+    """{task_id: Drawing} the annotator was paired with."""
+    rows = (
+        db.session.query(LandmarkAssignment.task_id, Drawing)
+        .join(Drawing, Drawing.id == LandmarkAssignment.drawing_id)
+        .filter(LandmarkAssignment.user_id == user_id, LandmarkAssignment.task_id.in_(task_ids))
+    )
+    return dict(rows.all())
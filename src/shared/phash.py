@@ -0,0 +1,324 @@
+"""
+Perceptual hashes of drawings and route maps, for finding near-duplicate submissions
+(one drawing reused across tasks or participants) and drawings copied from a map.
+
+Each image gets a 64-bit pHash (signs of the low 8x8 DCT coefficients of a 32x32
+greyscale thumbnail against their median), stored in ImageHash together with its four
+16-bit quarters. Two hashes within Hamming distance d agree within d // 4 bits on at
+least one quarter (pigeonhole), so a lookup only has to probe the quarter values that
+close to the query's on indexed columns: a multi-index Hamming search. HashIndex does the
+same in memory for all pairs, comparing a bounded block of candidates at a time.
+
+save_drawing hashes each upload; `flask hash-images` hashes the route maps and any
+drawings saved before this existed; `flask flag-duplicates` rewrites DuplicateFlag.
+"""
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import batched
+import numpy as np
+from flask import jsonify, request
+from PIL import Image
+from sqlalchemy import or_
+from src.shared.models import db, Drawing, ImageHash, DuplicateFlag
+from src.shared.drawing_store import drawing_key
+from src.shared.admin import admin_required
+
+CHUNKS = 4
+CHUNK_BITS = 16
+MIN_BITS = 6  # blank canvases hash to 0; hashes this sparse are never matched
+BLANK_STD = 0.5  # grey-level spread of the 32x32 thumbnail below which an image counts as blank
+DEFAULT_DISTANCE = 6
+BLOCK = 1 << 20  # candidate pairs HashIndex.pairs compares per step
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    d = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    d[0] /= np.sqrt(2.0)
+    return d
+
+
+DCT32 = _dct_matrix(32)
+
+
+def phash(im):
+    """64-bit pHash of a PIL image as an unsigned int; transparency is flattened onto white."""
+    if im.mode in ("RGBA", "LA", "PA") or "transparency" in im.info:
+        rgba = im.convert("RGBA")
+        im = Image.alpha_composite(Image.new("RGBA", rgba.size, (255, 255, 255, 255)), rgba)
+    thumb = np.asarray(im.convert("L").resize((32, 32), Image.Resampling.BOX), dtype=np.float64)
+    if thumb.std() < BLANK_STD:
+        return 0  # a median of rounding noise would give a random hash
+    coeffs = (DCT32 @ thumb @ DCT32.T)[:8, :8].ravel()
+    bits = coeffs > np.median(coeffs[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def phash_bytes(data):
+    with Image.open(io.BytesIO(data)) as im:
+        return phash(im)
+
+
+def quarters(h):
+    return [(h >> (CHUNK_BITS * k)) & 0xFFFF for k in range(CHUNKS)]
+
+
+def _signed(h):
+    # BIGINT is signed; the bit pattern is what matters
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def _unsigned(h):
+    return h & 0xFFFFFFFFFFFFFFFF
+
+
+@lru_cache(maxsize=None)
+def _masks(radius):
+    return np.array([m for m in range(1 << CHUNK_BITS) if m.bit_count() <= radius], dtype=np.uint16)
+
+
+def _values(h, radius):
+    """Per quarter, every 16-bit value within `radius` bits of the hash's quarter."""
+    masks = _masks(radius)
+    return [(np.uint16(q) ^ masks).tolist() for q in quarters(h)]
+
+
+# ---- storage ----
+def store_hash(kind, key, h, user_id=None, task_id=None, route_id=None, source_mtime_ns=None):
+    """Upsert one image's hash on the session (the caller commits)."""
+    row = ImageHash.query.filter_by(kind=kind, key=key).first()
+    if row is None:
+        row = ImageHash(kind=kind, key=key)
+        db.session.add(row)
+    row.user_id, row.task_id, row.route_id = user_id, task_id, route_id
+    row.phash = _signed(h)
+    row.bits = h.bit_count()
+    row.c0, row.c1, row.c2, row.c3 = quarters(h)
+    row.source_mtime_ns = source_mtime_ns
+    row.updated_at = datetime.now(timezone.utc)
+    return row
+
+
+def hash_drawing(user_id, task_id, png_bytes):
+    """Stage the hash of a just-saved drawing (the caller commits); unreadable images are skipped."""
+    try:
+        h = phash_bytes(png_bytes)
+    except (OSError, Image.UnidentifiedImageError, Image.DecompressionBombError):
+        return None
+    return store_hash("drawing", f"{user_id}_{task_id}.png", h, user_id=user_id, task_id=task_id)
+
+
+def near_duplicates(h, max_distance=DEFAULT_DISTANCE, exclude=None):
+    """
+    Stored hashes within max_distance of h, nearest first, as (ImageHash, distance).
+    `exclude` is an ImageHash id to leave out (the query image itself).
+    """
+    if h.bit_count() < MIN_BITS:
+        return []
+    radius = max_distance // CHUNKS
+    cols = (ImageHash.c0, ImageHash.c1, ImageHash.c2, ImageHash.c3)
+    q = ImageHash.query.filter(or_(*(col.in_(vals) for col, vals in zip(cols, _values(h, radius)))))
+    q = q.filter(ImageHash.bits >= MIN_BITS)
+    if exclude is not None:
+        q = q.filter(ImageHash.id != exclude)
+    found = [(row, (h ^ _unsigned(row.phash)).bit_count()) for row in q]
+    return sorted(((row, d) for row, d in found if d <= max_distance), key=lambda rd: rd[1])
+
+
+# ---- bulk ----
+class HashIndex:
+    """In-memory multi-index over an array of 64-bit hashes, for all-pairs near-duplicate search."""
+
+    def __init__(self, hashes):
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.quarters = [
+            ((self.hashes >> np.uint64(CHUNK_BITS * k)) & np.uint64(0xFFFF)).astype(np.uint16)
+            for k in range(CHUNKS)
+        ]
+        self.order = [np.argsort(q, kind="stable") for q in self.quarters]
+        # bucket of quarter value v: order[k][start[k][v]:start[k][v] + size[k][v]]
+        self.size = [np.bincount(q, minlength=1 << CHUNK_BITS) for q in self.quarters]
+        self.start = [np.cumsum(c) - c for c in self.size]
+
+    def pairs(self, max_distance=DEFAULT_DISTANCE, block=BLOCK):
+        """
+        Yields (i, j, distance) arrays that together hold every pair i < j within
+        max_distance exactly once. Every bucket is searched, however many hashes share
+        it; memory stays bounded because about `block` candidates are compared at a time
+        (more only for a single hash whose bucket is larger than that).
+        """
+        n = len(self.hashes)
+        if not n:
+            return
+        radius = max_distance // CHUNKS
+        for k, (q, order, size, start) in enumerate(zip(self.quarters, self.order, self.size, self.start)):
+            for mask in _masks(radius):
+                keys = q ^ mask
+                counts = size[keys]
+                ends = np.cumsum(counts)
+                # runs of hashes with about `block` candidates between them; one hash's
+                # candidates (a single bucket) are never split
+                cuts = np.searchsorted(ends, np.arange(block, int(ends[-1]), block))
+                for a, b in zip(np.concatenate(([0], cuts)), np.concatenate((cuts, [n]))):
+                    c = counts[a:b]
+                    total = int(c.sum())
+                    if not total:
+                        continue
+                    i = np.repeat(np.arange(a, b), c)
+                    firsts = np.repeat(start[keys[a:b]] - (np.cumsum(c) - c), c)
+                    j = order[firsts + np.arange(total)]
+                    keep = i < j
+                    i, j = i[keep], j[keep]
+                    d = np.bitwise_count(self.hashes[i] ^ self.hashes[j])
+                    close = d <= max_distance
+                    i, j, d = i[close], j[close], d[close]
+                    # pairs that are candidates on an earlier quarter were reported there
+                    for earlier in self.quarters[:k]:
+                        keep = np.bitwise_count(earlier[i] ^ earlier[j]) > radius
+                        i, j, d = i[keep], j[keep], d[keep]
+                    if len(i):
+                        yield i, j, d
+
+
+def _hash_file(path):
+    """Worker: (path, hash or None). No DB."""
+    try:
+        with Image.open(path) as im:
+            return path, phash(im)
+    except (OSError, Image.UnidentifiedImageError, Image.DecompressionBombError):
+        return path, None
+
+
+def _hash_blob(item):
+    key, data = item
+    try:
+        return key, phash_bytes(data)
+    except (OSError, Image.UnidentifiedImageError, Image.DecompressionBombError):
+        return key, None
+
+
+def hash_maps(maps_dir, routes_data, workers=None):
+    """Hash every route's map whose file changed since it was last hashed. Returns the count hashed."""
+    known = {row.key: row.source_mtime_ns for row in ImageHash.query.filter_by(kind="map")}
+    todo = {}
+    for route_id, rd in routes_data.items():
+        name = os.path.basename(rd.get("map") or "")
+        path = os.path.join(maps_dir, name)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        if known.get(name) != mtime_ns:
+            todo[path] = (name, route_id, mtime_ns)
+    if not todo:
+        return 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, h in pool.map(_hash_file, todo, chunksize=16):
+            if h is not None:
+                name, route_id, mtime_ns = todo[path]
+                store_hash("map", name, h, route_id=route_id, source_mtime_ns=mtime_ns)
+    db.session.commit()
+    return len(todo)
+
+
+def hash_missing_drawings(store, workers=None, batch_size=500):
+    """Hash saved drawings that have no ImageHash yet (saved before hashing existed). Yields the running count."""
+    hashed = {key for (key,) in db.session.query(ImageHash.key).filter_by(kind="drawing")}
+    rows = [
+        (user_id, task_id, path)
+        for user_id, task_id, path in db.session.query(Drawing.user_id, Drawing.task_id, Drawing.drawing_path)
+        .filter(Drawing.drawing_path.isnot(None)).order_by(Drawing.id)
+        if f"{user_id}_{task_id}.png" not in hashed
+    ]
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in batched(rows, batch_size):
+            blobs, owners = [], {}
+            for user_id, task_id, path in batch:
+                try:
+                    with store.open(drawing_key(path)) as f:
+                        blobs.append((f"{user_id}_{task_id}.png", f.read()))
+                except OSError:
+                    continue
+                owners[blobs[-1][0]] = (user_id, task_id)
+            for key, h in pool.map(_hash_blob, blobs, chunksize=16):
+                if h is not None:
+                    user_id, task_id = owners[key]
+                    store_hash("drawing", key, h, user_id=user_id, task_id=task_id)
+            db.session.commit()
+            done += len(batch)
+            yield done
+
+
+def flag_duplicates(max_distance=DEFAULT_DISTANCE):
+    """
+    Rebuild DuplicateFlag from all stored hashes. A drawing is flagged when it is within
+    max_distance of another task's drawing by the same participant ("self"), of another
+    participant's drawing ("shared"), or of a route map ("map"). Returns counts by reason.
+    """
+    rows = (
+        db.session.query(ImageHash.kind, ImageHash.key, ImageHash.user_id, ImageHash.task_id, ImageHash.phash)
+        .filter(ImageHash.bits >= MIN_BITS).order_by(ImageHash.id).all()
+    )
+    index = HashIndex(np.array([r.phash for r in rows], dtype=np.int64).view(np.uint64))
+
+    DuplicateFlag.query.delete()
+    now = datetime.now(timezone.utc)
+    counts = {}
+    flags = []
+    for ii, jj, dd in index.pairs(max_distance):
+        for i, j, d in zip(ii.tolist(), jj.tolist(), dd.tolist()):
+            a, b = rows[i], rows[j]
+            for x, y in ((a, b), (b, a)):
+                if x.kind != "drawing":
+                    continue
+                if y.kind == "map":
+                    reason = "map"
+                elif y.user_id == x.user_id:
+                    if y.task_id == x.task_id:
+                        continue
+                    reason = "self"
+                else:
+                    reason = "shared"
+                counts[reason] = counts.get(reason, 0) + 1
+                flags.append({"user_id": x.user_id, "task_id": x.task_id, "reason": reason,
+                              "other": f"{y.kind}:{y.key}", "distance": d, "flagged_at": now})
+            if len(flags) >= 1000:
+                db.session.execute(DuplicateFlag.__table__.insert(), flags)
+                flags = []
+    if flags:
+        db.session.execute(DuplicateFlag.__table__.insert(), flags)
+    db.session.commit()
+    return counts
+
+
+def register_phash_routes(app):
+    @app.route("/admin/near_duplicates")
+    @admin_required
+    def admin_near_duplicates():
+        """?user_id=&task_id= (a drawing) or ?route_id= (a map), optionally &max_distance=."""
+        max_distance = request.args.get("max_distance", DEFAULT_DISTANCE, type=int)
+        if not 0 <= max_distance <= 16:
+            return jsonify({"status": "error", "message": "max_distance must be 0-16"}), 400
+        if request.args.get("route_id"):
+            row = ImageHash.query.filter_by(kind="map", route_id=request.args["route_id"]).first()
+        else:
+            user_id = request.args.get("user_id", type=int)
+            task_id = request.args.get("task_id", type=int)
+            row = ImageHash.query.filter_by(kind="drawing", key=f"{user_id}_{task_id}.png").first()
+        if row is None:
+            return jsonify({"status": "error", "message": "no hash for that image"}), 404
+        matches = near_duplicates(_unsigned(row.phash), max_distance, exclude=row.id)
+        return jsonify({
+            "key": row.key,
+            "kind": row.kind,
+            "matches": [
+                {"kind": m.kind, "key": m.key, "user_id": m.user_id, "task_id": m.task_id,
+                 "route_id": m.route_id, "distance": d}
+                for m, d in matches
+            ],
+        })
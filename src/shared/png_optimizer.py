@@ -0,0 +1,124 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import batched
+from PIL import Image
+from src.shared.drawing_store import replace_lock
+from src.shared.models import db, Drawing, User
+
+# modes that are already as small as we know how to make them
+COMPACT_MODES = ("1", "L", "LA", "P")
+
+
+def _encode(img) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", optimize=True, compress_level=9)
+    return buf.getvalue()
+
+
+def _candidates(rgba):
+    """Yield lossless re-encodings of an RGBA canvas export, smallest modes first."""
+    opaque = rgba.getchannel("A").getextrema() == (255, 255)
+    rgb = rgba.convert("RGB")
+    gray = rgb.convert("L")
+    is_gray = gray.convert("RGB").tobytes() == rgb.tobytes()
+
+    if is_gray:
+        yield gray if opaque else Image.merge("LA", (gray, rgba.getchannel("A")))
+    if opaque:
+        if rgb.getcolors(256) is not None:
+            yield rgb.convert("P", palette=Image.Palette.ADAPTIVE, colors=256)
+        yield rgb
+    else:
+        if rgba.getcolors(256) is not None:
+            yield rgba.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+        yield rgba
+
+
+def optimize_png(path: str, dry_run: bool = False) -> dict:
+    """
+    Re-encode one drawing with the smallest pixel-identical PNG mode and swap it in
+    atomically. Runs in a worker process, so it never touches the database. The
+    swap happens under the store's replace_lock and only if the file is still the one
+    that was encoded, so a concurrent autosave is never overwritten.
+    """
+    result = {"path": path, "before": 0, "after": 0, "status": "skipped"}
+    try:
+        st = os.stat(path)
+        result["before"] = result["after"] = st.st_size
+        with Image.open(path) as im:
+            if im.format != "PNG" or im.mode in COMPACT_MODES:
+                result["status"] = "already-compact"
+                return result
+            rgba = im.convert("RGBA")
+    except (OSError, Image.UnidentifiedImageError) as e:
+        result["status"] = f"error: {e}"
+        return result
+
+    reference = rgba.tobytes()
+    best = None
+    for candidate in _candidates(rgba):
+        data = _encode(candidate)
+        if best is not None and len(data) >= len(best):
+            continue
+        with Image.open(io.BytesIO(data)) as check:
+            if check.convert("RGBA").tobytes() != reference:
+                continue
+        best = data
+
+    if best is None or len(best) >= st.st_size:
+        result["status"] = "no-gain"
+        return result
+    if dry_run:
+        result["after"] = len(best)
+        result["status"] = "would-optimize"
+        return result
+
+    tmp = f"{path}.opt-{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(best)
+            f.flush()
+            os.fsync(f.fileno())
+        # an autosave may have rewritten the drawing while we were encoding; saves swap
+        # their file in under the same lock, so none can land between check and replace
+        with replace_lock(os.path.dirname(path)):
+            now = os.stat(path)
+            if (now.st_ino, now.st_mtime_ns, now.st_size) != (st.st_ino, st.st_mtime_ns, st.st_size):
+                os.remove(tmp)
+                result["status"] = "changed"
+                return result
+            os.replace(tmp, path)
+    except OSError as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        result["status"] = f"error: {e}"
+        return result
+
+    result["after"] = len(best)
+    result["status"] = "optimized"
+    return result
+
+
+def completed_drawing_paths(batch_size: int = 1000):
+    """Stream drawing paths whose owners are no longer working on a batch."""
+    q = (
+        db.session.query(Drawing.drawing_path)
+        .join(User, User.id == Drawing.user_id)
+        .filter(Drawing.drawing_path.isnot(None))
+        .filter(User.inflight_batch.isnot(True))
+        .order_by(Drawing.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for (path,) in q:
+        yield path
+
+
+def optimize_drawings(paths, workers: int | None = None, dry_run: bool = False, chunk: int = 256):
+    """Fan drawings out to a process pool, yielding per-file results as they finish."""
+    work = partial(optimize_png, dry_run=dry_run)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # submit in slices so a huge corpus never sits in memory as one list of futures
+        for batch in batched(paths, chunk):
+            yield from pool.map(work, batch, chunksize=16)
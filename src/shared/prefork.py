@@ -0,0 +1,56 @@
+"""
+Fork safety for gunicorn --preload (see src/gunicorn_conf.py). With preload the master
+builds the apps once: it parses the routes, syncs Task, and scans the media
+directories. The workers then inherit all of that copy-on-write instead of redoing it.
+
+Anything holding a socket or file handle must not cross the fork. The SQLAlchemy pools
+are emptied in the master before forking and dropped again (without closing the
+parent's connections) in each worker. The SQLite drawing store, the S3 session, the
+ingest spool and the flusher threads already open per process, keyed on os.getpid().
+gc.freeze() moves everything the master allocated into the permanent generation, so
+collections in the workers don't touch those objects and unshare their pages.
+"""
+import gc
+import time
+from src.shared.models import db
+
+_apps = []
+
+
+def register(app):
+    """Called by create_app for every app built in this process."""
+    _apps.append(app)
+
+
+def _engines():
+    seen = {}
+    for app in _apps:
+        for engine in db._app_engines.get(app, {}).values():
+            seen[id(engine)] = engine  # apps built with share_with share their engines
+    return seen.values()
+
+
+def before_fork():
+    """
+    In the master, once the apps are loaded: warm the read-only state the workers
+    will share, close every pooled connection, then freeze the heap.
+    """
+    for app in _apps:
+        index = app.extensions.get("media_index")
+        if index is not None and index._scanned_at is None:
+            index.rescan()
+    for engine in _engines():
+        engine.dispose()
+    gc.collect()
+    gc.freeze()
+
+
+def after_fork():
+    """In each worker, first thing after the fork."""
+    for engine in _engines():
+        # connections the master may still hold belong to it; only forget them here
+        engine.dispose(close=False)
+    for app in _apps:
+        health = app.extensions.get("health")
+        if health is not None:
+            health.started_at = time.time()
@@ -0,0 +1,249 @@
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from flask import g, jsonify, request
+from src.shared.admin import admin_required
+
+CONTROL_FILE = "control.json"
+_SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _profile_files(directory):
+    try:
+        return sorted(f for f in os.listdir(directory) if f.endswith(".collapsed"))
+    except OSError:
+        return []
+
+
+# setting -> (lowest, highest) accepted value
+LIMITS = {"sample_rate": (0.0, 1.0), "slow_ms": (0.0, math.inf)}
+
+
+def parse_settings(data):
+    """The profiler settings present in data, checked; raises ValueError on a bad one."""
+    parsed = {}
+    enabled = data.get("enabled")
+    if enabled is not None:
+        if not isinstance(enabled, bool):
+            raise ValueError("enabled must be true or false")
+        parsed["enabled"] = enabled
+    for key, (lo, hi) in LIMITS.items():
+        value = data.get(key)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"{key} must be a finite number")
+        if not lo <= value <= hi:
+            raise ValueError(f"{key} must be at least {lo:g}" if hi == math.inf else f"{key} must be between {lo:g} and {hi:g}")
+        parsed[key] = float(value)
+    return parsed
+
+
+class _Req:
+    __slots__ = ("endpoint", "start", "sampled", "samples")
+
+    def __init__(self, endpoint, sampled):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.sampled = sampled
+        self.samples = Counter()
+
+
+class SamplingProfiler:
+    """
+    Stack-sampling profiler for in-flight requests. A daemon thread wakes every
+    `interval_ms` and records the stack of each request thread that was picked by
+    `sample_rate` or has been running longer than `slow_ms`, so slow requests are
+    captured from the moment they cross the threshold. Finished profiles are written
+    as collapsed stacks (flamegraph.pl / speedscope input) to a directory that keeps
+    at most `max_files` of them.
+
+    Settings live in <directory>/control.json so a change made through one worker
+    reaches every worker within a second, without a restart.
+    """
+
+    def __init__(self, directory, enabled=False, sample_rate=0.01, slow_ms=1000.0,
+                 interval_ms=5.0, max_files=200):
+        self.directory = directory
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.interval_ms = interval_ms
+        self.max_files = max_files
+        self._active = {}
+        self._samples_lock = threading.Lock()  # the sampler thread writes req.samples; end_request reads them
+        self._labels = {}
+        self._sampler_pid = None
+        self._control_mtime = None
+        self._control_checked = 0.0
+
+    # ---- runtime control ----
+    def settings(self):
+        return {"enabled": self.enabled, "sample_rate": self.sample_rate, "slow_ms": self.slow_ms}
+
+    def update(self, **changes):
+        """Apply and persist new settings; raises ValueError (nothing applied) if one is invalid."""
+        for key, value in parse_settings(changes).items():
+            setattr(self, key, value)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, CONTROL_FILE)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.settings(), f)
+        os.replace(tmp, path)
+
+    def refresh(self):
+        """Pick up settings written by another worker; checks the file at most once a second."""
+        now = time.monotonic()
+        if now - self._control_checked < 1.0:
+            return
+        self._control_checked = now
+        path = os.path.join(self.directory, CONTROL_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._control_mtime:
+            return
+        self._control_mtime = mtime
+        try:
+            with open(path, "r") as f:
+                settings = parse_settings(json.load(f))
+        except (OSError, ValueError, AttributeError):
+            return  # unreadable or hand-edited badly: keep the current settings
+        for key, value in settings.items():
+            setattr(self, key, value)
+
+    # ---- request hooks ----
+    def start_request(self, endpoint):
+        self._ensure_sampler()
+        req = _Req(endpoint, random.random() < self.sample_rate)
+        self._active[threading.get_ident()] = req
+        return req
+
+    def end_request(self, req):
+        with self._samples_lock:
+            self._active.pop(threading.get_ident(), None)
+            samples = req.samples.copy()
+        elapsed_ms = (time.perf_counter() - req.start) * 1000.0
+        if samples and (req.sampled or elapsed_ms >= self.slow_ms):
+            self._write(req.endpoint, samples, elapsed_ms)
+
+    # ---- sampling ----
+    def _ensure_sampler(self):
+        if self._sampler_pid == os.getpid():
+            return
+        self._sampler_pid = os.getpid()
+        self._active = {}
+        threading.Thread(target=self._loop, name="request-profiler", daemon=True).start()
+
+    def _loop(self):
+        interval = self.interval_ms / 1000.0
+        while True:
+            time.sleep(interval)
+            if not self._active:
+                continue
+            now = time.perf_counter()
+            frames = None
+            with self._samples_lock:
+                for tid, req in list(self._active.items()):
+                    if not req.sampled and (now - req.start) * 1000.0 < self.slow_ms:
+                        continue
+                    if frames is None:
+                        frames = sys._current_frames()
+                    frame = frames.get(tid)
+                    if frame is not None:
+                        req.samples[self._collapse(frame)] += 1
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            fname = code.co_filename
+            if fname.startswith(_SRC_DIR):
+                fname = "src" + fname[len(_SRC_DIR):]
+            else:
+                fname = os.path.basename(fname)
+            label = self._labels[code] = f"{code.co_name} ({fname}:{code.co_firstlineno})"
+        return label
+
+    def _collapse(self, frame):
+        stack = []
+        while frame is not None:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def _write(self, endpoint, samples, elapsed_ms):
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        safe_endpoint = endpoint.strip("/").replace("/", "_").replace("<", "").replace(">", "") or "root"
+        name = f"{stamp}_{os.getpid()}_{safe_endpoint}_{int(elapsed_ms)}ms.collapsed"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, name), "w") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            self._rotate()
+        except OSError:
+            pass
+
+    def _rotate(self):
+        files = _profile_files(self.directory)
+        for old in files[: max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError:
+                pass
+
+
+def init_profiler(app):
+    """
+    Opt-in: installed when PROFILE_ENABLED=1 or ADMIN_TOKEN is set. With only the token,
+    the hooks stay idle (one stat of the control file per second) until an admin turns
+    sampling on through POST /admin/profiling.
+    """
+    if not (app.config.get("PROFILE_ENABLED") or app.config.get("ADMIN_TOKEN")):
+        return None
+    profiler = SamplingProfiler(
+        app.config["PROFILE_DIR"],
+        enabled=app.config["PROFILE_ENABLED"],
+        sample_rate=app.config["PROFILE_SAMPLE_RATE"],
+        slow_ms=app.config["PROFILE_SLOW_MS"],
+        interval_ms=app.config["PROFILE_INTERVAL_MS"],
+        max_files=app.config["PROFILE_MAX_FILES"],
+    )
+    app.extensions["profiler"] = profiler
+
+    @app.before_request
+    def _profile_start():
+        profiler.refresh()
+        if profiler.enabled:
+            rule = request.url_rule
+            g._profile_req = profiler.start_request(rule.rule if rule is not None else request.path)
+
+    @app.teardown_request
+    def _profile_done(exc=None):
+        req = g.pop("_profile_req", None)
+        if req is not None:
+            profiler.end_request(req)
+
+    @app.route("/admin/profiling", methods=["GET", "POST"])
+    @admin_required
+    def admin_profiling():
+        if request.method == "POST":
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({"status": "error", "message": "expected a JSON object"}), 400
+            try:
+                profiler.update(**{k: data.get(k) for k in ("enabled", "sample_rate", "slow_ms")})
+            except ValueError as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+        files = _profile_files(profiler.directory)
+        return jsonify({**profiler.settings(), "directory": profiler.directory, "recent": files[-20:]})
+
+    return profiler
@@ -0,0 +1,203 @@
+"""
+Hot reload of ROUTES_FILE. Each worker stats the file at most every
+ROUTES_RELOAD_SECONDS (on a request, like the media index). When its mtime or size
+changes, the worker parses the file and diffs it per route against the routes it serves:
+
+    added     new route ids                  Task row created
+    changed   map, observations, landmarks   Task row updated
+              or endpoint markers differ
+    removed   ids no longer in the file      Task row and answers kept, no longer scheduled
+
+Only added and changed routes are written, and the writes are idempotent, so the
+first worker to see the change does the work and the rest find nothing to update.
+The new route dict is then swapped in with one assignment on every app sharing it:
+a request reads app.extensions["routes_data"] once and sees either the old routes or
+the new ones, never a mix. A file that fails to parse (e.g. caught mid-write) is retried
+on the next check; the old routes keep serving. POST /admin/reload_routes runs the
+check right away in the worker that receives it.
+"""
+import os
+import threading
+import time
+from itertools import batched
+from flask import jsonify, request
+from sqlalchemy.exc import IntegrityError
+from src.shared.models import db, Task
+from src.shared.task_stats import ensure_stats_rows
+from src.shared.utils import parse_routes, ROUTES_FILE
+from src.shared.admin import admin_required
+
+IN_CHUNK = 500  # route ids per IN (...); SQLite limits the bound parameters of a statement
+
+
+def upsert_tasks(routes):
+    """Create or update the Task rows of these routes (the caller commits). Returns the new Tasks."""
+    existing = {}
+    for chunk in batched(routes, IN_CHUNK):
+        existing.update((t.route_id, t) for t in Task.query.filter(Task.route_id.in_(chunk)))
+    created = []
+    for rid, rd in routes.items():
+        t = existing.get(rid)
+        if t is None:
+            t = Task(
+                route_id=rid,
+                served_count_draw=0,
+                served_count_landmarks=0,
+                landmarks=rd["landmarks"],
+                endpoints=rd["endpoints"],
+            )
+            db.session.add(t)
+            created.append(t)
+        else:
+            t.landmarks = rd["landmarks"]
+            t.endpoints = rd["endpoints"]
+    db.session.flush()
+    return created
+
+
+def diff_routes(old, new):
+    """{"added": [...], "changed": [...], "removed": [...]} route ids, each sorted."""
+    return {
+        "added": sorted(new.keys() - old.keys()),
+        "changed": sorted(rid for rid in new.keys() & old.keys() if new[rid] != old[rid]),
+        "removed": sorted(old.keys() - new.keys()),
+    }
+
+
+def retired_route_ids(routes_data):
+    """Route ids with a Task row but no longer in the routes file."""
+    return {rid for (rid,) in db.session.query(Task.route_id)} - routes_data.keys()
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class RoutesReloader:
+    """The routes one process serves, and the watcher that replaces them when the file changes."""
+
+    def __init__(self, path, routes_data, check_seconds=30.0):
+        self.path = path
+        self.check_seconds = check_seconds
+        self.data = routes_data
+        self.retired = set()
+        self.version = 1
+        self.last = None  # summary of the last reload
+        self.apps = []
+        self._signature = _signature(path)
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def attach(self, app):
+        """Serve this reloader's routes from app (every app built with share_with shares one reloader)."""
+        self.apps.append(app)
+        app.extensions["routes_data"] = self.data
+        app.extensions["routes_reloader"] = self
+        app.extensions["health"].set_routes(self.data)
+
+    def maybe_reload(self):
+        if self.check_seconds <= 0 or time.monotonic() - self._checked_at < self.check_seconds:
+            return
+        # one request pays for the check; the rest keep serving the current routes
+        if self._lock.acquire(blocking=False):
+            try:
+                self._checked_at = time.monotonic()
+                if _signature(self.path) != self._signature:
+                    self._reload_locked()
+            finally:
+                self._lock.release()
+
+    def reload(self):
+        """Re-read the file now, changed or not. Returns the diff summary."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            return self._reload_locked()
+
+    def _reload_locked(self):
+        signature = _signature(self.path)
+        app = self.apps[0]
+        try:
+            new = parse_routes(self.path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            app.logger.warning("routes reload: keeping version %d, %s unreadable: %s", self.version, self.path, e)
+            return {"status": "error", "message": str(e), "version": self.version}
+
+        diff = diff_routes(self.data, new)
+        if any(diff.values()):
+            with app.app_context():
+                self._apply(new, diff)
+                retired = retired_route_ids(new)
+            # the swap: requests already running finish on the old dict
+            self.retired = retired
+            self.data = new
+            for a in self.apps:
+                a.extensions["routes_data"] = new
+                a.extensions["health"].set_routes(new)
+            self.version += 1
+            app.logger.info(
+                "routes reload: version %d (%d added, %d changed, %d removed)",
+                self.version, len(diff["added"]), len(diff["changed"]), len(diff["removed"]),
+            )
+        self._signature = signature
+        self.last = {
+            "status": "ok",
+            "version": self.version,
+            "reloaded_at": time.time(),
+            **{k: len(v) for k, v in diff.items()},
+        }
+        return {**self.last, "routes": diff}
+
+    def _apply(self, new, diff):
+        routes = {rid: new[rid] for rid in diff["added"] + diff["changed"]}
+        for attempt in range(2):
+            try:
+                created = upsert_tasks(routes)
+                ensure_stats_rows([t.id for t in created])
+                db.session.commit()
+                return
+            except IntegrityError:
+                # another worker inserted the same new route first; its row is updated on retry
+                db.session.rollback()
+                if attempt:
+                    raise
+
+    def status(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "count": len(self.data),
+            "retired": sorted(self.retired),
+            "check_seconds": self.check_seconds,
+            "last": self.last,
+        }
+
+
+def init_routes_reload(app, share_with=None):
+    """
+    Parse ROUTES_FILE (or reuse share_with's routes) and serve it from app, watching the
+    file for changes. Returns the reloader; the caller syncs Task rows at startup.
+    """
+    if share_with is not None:
+        reloader = share_with.extensions["routes_reloader"]
+    else:
+        reloader = RoutesReloader(ROUTES_FILE, parse_routes(ROUTES_FILE), check_seconds=app.config["ROUTES_RELOAD_SECONDS"])
+    reloader.attach(app)
+
+    @app.before_request
+    def _routes_check():
+        reloader.maybe_reload()
+
+    @app.route("/admin/reload_routes", methods=["GET", "POST"])
+    @admin_required
+    def admin_reload_routes():
+        """GET: the routes version this worker serves; POST: re-read the routes file now."""
+        if request.method == "POST":
+            result = reloader.reload()
+            return jsonify(result), 200 if result["status"] == "ok" else 500
+        return jsonify(reloader.status())
+
+    return reloader
@@ -43,6 +43,7 @@ def register_shared_routes(app):
         session["study_id"] = prolific_study_id
 
         login_user(user)
+        app.extensions["user_cache"].invalidate(user.id)
 
         # IMPORTANT: each app has its own landing route name
         if app.config["APP_MODE"] == "draw":
@@ -96,8 +97,9 @@ def register_shared_routes(app):
     @app.route("/complete", methods=["POST"])
     @login_required
     def complete():
-        current_user.inflight_batch = False
+        db.session.query(User).filter_by(id=current_user.id).update({"inflight_batch": False})
         db.session.commit()
+        app.extensions["user_cache"].invalidate(current_user.id)
         if app.config.get("APP_MODE") == "draw":
             completion_url = "https://app.prolific.com/submissions/complete?cc=C1N2OWCF"
         else:
@@ -0,0 +1,134 @@
+import contextvars
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# every QueryStats currently collecting in this context (request profiler, test budgets, ...)
+_active = contextvars.ContextVar("sql_query_stats", default=())
+_installed = False
+
+_WS = re.compile(r"\s+")
+_PARAM_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+
+
+def statement_shape(statement: str) -> str:
+    """Collapse literals and expanded IN lists so repeats of the same query compare equal."""
+    s = _WS.sub(" ", statement).strip()
+    s = _STRING.sub("?", s)
+    s = _NUMBER.sub("?", s)
+    return _PARAM_LIST.sub("(?, ...)", s)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, elapsed_ms):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, min_count=2):
+        """Statement shapes issued at least min_count times: the usual N+1 signature."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= min_count]
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get():
+        conn.info.setdefault("_sql_profiler_start", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    collectors = _active.get()
+    if not collectors:
+        return
+    starts = conn.info.get("_sql_profiler_start")
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000.0 if starts else 0.0
+    for stats in collectors:
+        stats.record(statement, elapsed_ms)
+
+
+def install():
+    """Hook cursor execution on every engine; a no-op unless something is collecting."""
+    global _installed
+    if _installed:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_execute)
+    event.listen(Engine, "after_cursor_execute", _after_execute)
+    _installed = True
+
+
+def _push(stats):
+    _active.set(_active.get() + (stats,))
+
+
+def _pop(stats):
+    _active.set(tuple(s for s in _active.get() if s is not stats))
+
+
+@contextmanager
+def count_queries():
+    """
+    Count the SQL statements run inside the block:
+
+        with count_queries() as stats:
+            client.get("/next_batch")
+        assert stats.count <= 6
+    """
+    install()
+    stats = QueryStats()
+    _push(stats)
+    try:
+        yield stats
+    finally:
+        _pop(stats)
+
+
+@contextmanager
+def query_budget(max_queries, max_repeats=None):
+    """Like count_queries, but raises AssertionError when the block goes over budget."""
+    with count_queries() as stats:
+        yield stats
+    problems = []
+    if stats.count > max_queries:
+        problems.append(f"{stats.count} queries (budget {max_queries})")
+    if max_repeats is not None:
+        problems.extend(f"{n}x {shape}" for shape, n in stats.repeated(max_repeats + 1))
+    if problems:
+        raise AssertionError("query budget exceeded: " + "; ".join(problems))
+
+
+def init_sql_profiler(app):
+    """Opt-in (SQL_PROFILE=1): log requests whose query count or DB time crosses a threshold."""
+    if not app.config.get("SQL_PROFILE"):
+        return
+    install()
+    max_queries = app.config["SQL_PROFILE_MAX_QUERIES"]
+    max_ms = app.config["SQL_PROFILE_MAX_MS"]
+
+    @app.before_request
+    def _sql_profile_start():
+        g._sql_stats = QueryStats()
+        _push(g._sql_stats)
+
+    @app.teardown_request
+    def _sql_profile_done(exc=None):
+        stats = g.pop("_sql_stats", None)
+        if stats is None:
+            return
+        _pop(stats)
+        if stats.count > max_queries or stats.total_ms > max_ms:
+            repeated = "".join(f"\n    {n}x {shape}" for shape, n in stats.repeated())
+            app.logger.warning(
+                "%s %s: %d queries, %.1f ms in DB%s",
+                request.method, request.path, stats.count, stats.total_ms,
+                repeated or "",
+            )
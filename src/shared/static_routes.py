@@ -1,27 +1,35 @@
 import os
 from pathlib import Path
-from flask import send_file, send_from_directory
+from flask import abort, send_from_directory
 
 APP_DIR = Path(__file__).resolve().parents[1]  # src/
-MAPS_DIR = "/home/claireji/napkin-map/route_creation_jacob/maps/"
-OBSERVATIONS_DIR = "/data/claireji/mapillary_jacob/mapillary/day2_seg13_images/"
-VIDEO_DIR = "/data/claireji/mapillary_jacob/mapillary/videos/"
-USER_DRAWINGS_DIR = (APP_DIR / ".." / "user_drawings").resolve()
+MAPS_DIR = os.getenv("MAPS_DIR", "/home/claireji/napkin-map/route_creation_jacob/maps/")
+OBSERVATIONS_DIR = os.getenv("OBSERVATIONS_DIR", "/data/claireji/mapillary_jacob/mapillary/day2_seg13_images/")
+VIDEO_DIR = os.getenv("VIDEO_DIR", "/data/claireji/mapillary_jacob/mapillary/videos/")
+USER_DRAWINGS_DIR = Path(os.getenv("USER_DRAWINGS_DIR", APP_DIR / "user_drawings")).resolve()
 
 def register_static_routes(app):
+    media_index = app.extensions["media_index"]
+    drawing_store = app.extensions["drawing_store"]
+
+    def _serve(kind, directory, fname):
+        # answer "is it there" from the index instead of letting send_file raise
+        if media_index.reachable(kind) and not media_index.exists(kind, fname):
+            abort(404)
+        return send_from_directory(directory, fname)
 
     @app.route("/videos/<path:filename>")
     def serve_video(filename):
-        return send_from_directory(VIDEO_DIR, filename)
+        return _serve("videos", VIDEO_DIR, filename)
 
     @app.route("/maps/<path:fname>")
     def get_map(fname):
-        return send_file(os.path.join(MAPS_DIR, fname))
+        return _serve("maps", MAPS_DIR, fname)
 
     @app.route("/observations/<path:fname>")
     def get_image(fname):
-        return send_file(os.path.join(OBSERVATIONS_DIR, fname))
+        return _serve("observations", OBSERVATIONS_DIR, fname)
 
     @app.route("/user_drawings/<path:fname>")
     def get_user_drawing(fname):
-        return send_from_directory(USER_DRAWINGS_DIR, fname)
\ No newline at end of file
+        return drawing_store.send(fname)
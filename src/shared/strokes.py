@@ -0,0 +1,156 @@
+"""
+Packed stroke telemetry. Each save_answer's strokes are appended to the answer's history
+as one StrokeChunk row, instead of a capped JSON point list in metrics_json; saving never
+reads the history back. Each chunk is a self-contained blob:
+
+    header   24 bytes               b"STK1", version u16, 0 u16, n_points u32, n_strokes u32, t0 f64
+    offsets  u32[n_strokes + 1]     stroke i is points offsets[i]:offsets[i + 1]
+    t        f32[n_points]          ms since t0 (epoch ms of the first stroke)
+    x, y     i16[n_points]          canvas pixels
+
+all little-endian, 8 bytes a point. decode() returns NumPy views over the blob itself;
+a history is decoded only when it is read for analysis (load_strokes).
+"""
+import math
+import struct
+from collections import namedtuple
+from datetime import datetime, timezone
+import numpy as np
+from src.shared.models import db, StrokeData, StrokeChunk
+
+MAGIC = b"STK1"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIId")
+MAX_SAVE_POINTS = 50000  # per save_answer; the stored history itself is not capped
+
+Strokes = namedtuple("Strokes", "t0 offsets t x y")
+
+
+def from_client(strokes):
+    """
+    Arrays from a save's drawing.strokes list, [{"t0": epoch ms, "pts": [x, y, dt_ms, ...]}, ...].
+    Malformed strokes are skipped. Returns Strokes, or None if nothing usable was sent.
+    """
+    starts, lengths, chunks, total = [], [], [], 0
+    for s in strokes if isinstance(strokes, list) else ():
+        if not isinstance(s, dict):
+            continue
+        t0, pts = s.get("t0"), s.get("pts")
+        if isinstance(t0, bool) or not isinstance(t0, (int, float)) or not math.isfinite(t0):
+            continue
+        if not isinstance(pts, list) or not pts or len(pts) % 3:
+            continue
+        n = len(pts) // 3
+        if total + n > MAX_SAVE_POINTS:
+            break
+        try:
+            arr = np.asarray(pts, dtype=np.float64).reshape(n, 3)
+        except (TypeError, ValueError):
+            continue
+        if not np.isfinite(arr).all():
+            continue
+        starts.append(float(t0))
+        lengths.append(n)
+        chunks.append(arr)
+        total += n
+    if not chunks:
+        return None
+    base = min(starts)
+    pts = np.concatenate(chunks)
+    t = np.repeat(np.asarray(starts) - base, lengths) + pts[:, 2]
+    xy = np.clip(np.rint(pts[:, :2]), -32768, 32767).astype(np.int16)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.uint32)
+    np.cumsum(lengths, out=offsets[1:])
+    return Strokes(base, offsets, t.astype(np.float32), xy[:, 0].copy(), xy[:, 1].copy())
+
+
+def concat(parts):
+    """One Strokes from a non-empty sequence of them, times rebased onto the first's t0."""
+    first = parts[0]
+    ends = np.cumsum([len(p.t) for p in parts])
+    return Strokes(
+        first.t0,
+        np.concatenate([first.offsets] + [
+            (p.offsets[1:] + end).astype(np.uint32) for p, end in zip(parts[1:], ends[:-1])
+        ]),
+        np.concatenate([(p.t.astype(np.float64) + (p.t0 - first.t0)).astype(np.float32) for p in parts]),
+        np.concatenate([p.x for p in parts]),
+        np.concatenate([p.y for p in parts]),
+    )
+
+
+def encode(s):
+    return b"".join((
+        HEADER.pack(MAGIC, VERSION, 0, len(s.t), len(s.offsets) - 1, s.t0),
+        s.offsets.astype("<u4").tobytes(),
+        s.t.astype("<f4").tobytes(),
+        s.x.astype("<i2").tobytes(),
+        s.y.astype("<i2").tobytes(),
+    ))
+
+
+def decode(blob):
+    """Strokes whose arrays are read-only views into `blob` (bytes or memoryview). Raises ValueError."""
+    if len(blob) < HEADER.size:
+        raise ValueError("truncated stroke blob")
+    magic, version, _, n_points, n_strokes, t0 = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a stroke blob")
+    if len(blob) != HEADER.size + 4 * (n_strokes + 1) + 8 * n_points:
+        raise ValueError("truncated stroke blob")
+    pos = HEADER.size
+    offsets = np.frombuffer(blob, "<u4", n_strokes + 1, pos)
+    pos += offsets.nbytes
+    t = np.frombuffer(blob, "<f4", n_points, pos)
+    pos += t.nbytes
+    x = np.frombuffer(blob, "<i2", n_points, pos)
+    y = np.frombuffer(blob, "<i2", n_points, pos + x.nbytes)
+    return Strokes(t0, offsets, t, x, y)
+
+
+def iter_strokes(s):
+    """(t, x, y) views for each stroke in turn."""
+    for start, end in zip(s.offsets[:-1], s.offsets[1:]):
+        yield s.t[start:end], s.x[start:end], s.y[start:end]
+
+
+def append_strokes(study, user_id, task_id, client_strokes):
+    """
+    Stage a save's drawing.strokes as the answer's next StrokeChunk (the caller commits).
+    Only the answer's StrokeData totals are read. Returns the appended Strokes, or None.
+    """
+    new = from_client(client_strokes)
+    if new is None:
+        return None
+    totals = (
+        StrokeData.query.filter_by(study=study, user_id=user_id, task_id=task_id)
+        .populate_existing().with_for_update().first()
+    )
+    if totals is None:
+        totals = StrokeData(study=study, user_id=user_id, task_id=task_id, n_chunks=0, n_strokes=0, n_points=0)
+        db.session.add(totals)
+    n_points, n_strokes = len(new.t), len(new.offsets) - 1
+    db.session.add(StrokeChunk(
+        study=study, user_id=user_id, task_id=task_id, seq=totals.n_chunks,
+        n_strokes=n_strokes, n_points=n_points, blob=encode(new),
+    ))
+    totals.n_chunks += 1
+    totals.n_strokes += n_strokes
+    totals.n_points += n_points
+    totals.updated_at = datetime.now(timezone.utc)
+    return new
+
+
+def join_chunks(blobs):
+    """The history packed in a sequence of chunk blobs (in seq order), or None if empty."""
+    parts = [decode(blob) for blob in blobs]
+    return concat(parts) if parts else None
+
+
+def load_strokes(study, user_id, task_id):
+    """The answer's decoded stroke history, or None if it has none."""
+    return join_chunks(
+        blob for (blob,) in db.session.query(StrokeChunk.blob)
+        .filter_by(study=study, user_id=user_id, task_id=task_id)
+        .order_by(StrokeChunk.seq)
+    )
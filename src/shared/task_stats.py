@@ -0,0 +1,286 @@
+import json
+import math
+import time
+from datetime import datetime, timezone
+from flask import jsonify, request
+from sqlalchemy import func, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.attributes import flag_modified
+from src.shared.models import db, Task, Drawing, Landmark, TaskStats
+from src.shared.admin import admin_required
+
+STUDIES = ("draw", "landmarks")
+
+# duration histogram edges in seconds; the last bucket is open-ended
+DURATION_EDGES = (5, 10, 20, 30, 45, 60, 90, 120, 180, 240, 300, 450, 600, 900, 1200, 1800, 2700, 3600)
+WATCH_EDGES = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+SCALARS = (
+    "answers",
+    "duration_n", "duration_sum", "duration_sumsq",
+    "strokes_n", "strokes_sum", "strokes_sumsq",
+    "watch_n", "watch_sum", "watch_sumsq",
+)
+
+
+def _bucket(edges, value):
+    for i, edge in enumerate(edges):
+        if value < edge:
+            return i
+    return len(edges)
+
+
+def _num(x):
+    try:
+        x = float(x)
+    except (TypeError, ValueError):
+        return None
+    return x if math.isfinite(x) else None
+
+
+def contribution(study, metrics):
+    """
+    What one Drawing/Landmark row adds to its task's stats, given its merged metrics
+    (None for a row save_answer has not touched yet). Returns (scalars, buckets) where
+    buckets maps "duration"/"watch" to a histogram index.
+    """
+    if metrics is None:
+        return dict.fromkeys(SCALARS, 0), {}
+    timing = metrics.get("timing") or {}
+    video = metrics.get("video") or {}
+    drawing = metrics.get("drawing") or {}
+    out = dict.fromkeys(SCALARS, 0)
+    out["answers"] = 1
+    buckets = {}
+
+    duration_ms = _num(timing.get("drawingDurationMs" if study == "draw" else "landmarkDurationMs"))
+    if duration_ms is not None and duration_ms >= 0:
+        seconds = duration_ms / 1000.0
+        out.update(duration_n=1, duration_sum=seconds, duration_sumsq=seconds * seconds)
+        buckets["duration"] = _bucket(DURATION_EDGES, seconds)
+
+    strokes = _num(drawing.get("strokeCount"))
+    if strokes is not None:
+        out.update(strokes_n=1, strokes_sum=strokes, strokes_sumsq=strokes * strokes)
+
+    watched, length = _num(video.get("maxWatchedTime")), _num(video.get("durationSec"))
+    if watched is not None and length:
+        frac = min(1.0, max(0.0, watched / length))
+        out.update(watch_n=1, watch_sum=frac, watch_sumsq=frac * frac)
+        buckets["watch"] = _bucket(WATCH_EDGES, frac)
+    return out, buckets
+
+
+def _empty_hist(edges):
+    return [0] * (len(edges) + 1)
+
+
+def _new_row(study, task_id):
+    row = TaskStats(study=study, task_id=task_id, duration_hist=_empty_hist(DURATION_EDGES),
+                    watch_hist=_empty_hist(WATCH_EDGES), **dict.fromkeys(SCALARS, 0))
+    db.session.add(row)
+    return row
+
+
+def ensure_stats_rows(task_ids):
+    """Create missing zeroed rows, so saves only ever update (and lock) an existing row."""
+    have = {(s, t) for s, t in db.session.query(TaskStats.study, TaskStats.task_id)}
+    for task_id in task_ids:
+        for study in STUDIES:
+            if (study, task_id) not in have:
+                _new_row(study, task_id)
+
+
+def record_answer(study, task_id, before, after):
+    """
+    Stage the change of one row's contribution (before and after the save, both from
+    contribution()) on its task's stats; it commits with the save.
+
+    SQLite ignores FOR UPDATE. There the read is still safe because the save's own
+    writes are flushed first (autoflush), so the transaction already holds the
+    database's single write lock.
+    """
+    (old, old_b), (new, new_b) = before, after
+    if old == new and old_b == new_b:
+        return
+    row = (
+        TaskStats.query.filter_by(study=study, task_id=task_id)
+        .populate_existing().with_for_update().first()
+    )
+    if row is None:
+        row = _new_row(study, task_id)
+    for col in SCALARS:
+        if new[col] != old[col]:
+            setattr(row, col, (getattr(row, col) or 0) + new[col] - old[col])
+    for name in ("duration", "watch"):
+        if old_b.get(name) != new_b.get(name):
+            hist = list(getattr(row, f"{name}_hist"))
+            if name in old_b:
+                hist[old_b[name]] -= 1
+            if name in new_b:
+                hist[new_b[name]] += 1
+            setattr(row, f"{name}_hist", hist)
+    row.updated_at = datetime.now(timezone.utc)
+
+
+# ---- reading ----
+def _percentile(hist, edges, q):
+    """Estimate from a bucketed histogram, interpolating linearly inside the bucket."""
+    total = sum(hist)
+    if total <= 0:
+        return None
+    target = q * total
+    seen = 0
+    for i, n in enumerate(hist):
+        if n and seen + n >= target:
+            lo = edges[i - 1] if i > 0 else 0.0
+            hi = edges[i] if i < len(edges) else edges[-1]
+            return round(lo + (hi - lo) * (target - seen) / n, 3)
+        seen += n
+    return float(edges[-1])
+
+
+def _moments(n, s, ss):
+    if not n:
+        return {"n": 0, "mean": None, "std": None}
+    mean = s / n
+    var = max(0.0, ss / n - mean * mean)
+    return {"n": int(n), "mean": round(mean, 3), "std": round(math.sqrt(var), 3)}
+
+
+def summarize(totals, duration_hist, watch_hist):
+    """Means, standard deviations and p50/p90 from summed stats columns."""
+    duration = _moments(totals["duration_n"], totals["duration_sum"], totals["duration_sumsq"])
+    duration.update({f"p{int(q * 100)}": _percentile(duration_hist, DURATION_EDGES, q) for q in (0.5, 0.9)})
+    watch = _moments(totals["watch_n"], totals["watch_sum"], totals["watch_sumsq"])
+    watch.update({f"p{int(q * 100)}": _percentile(watch_hist, WATCH_EDGES, q) for q in (0.5, 0.9)})
+    return {
+        "answers": int(totals["answers"] or 0),
+        "duration_seconds": duration,
+        "strokes": _moments(totals["strokes_n"], totals["strokes_sum"], totals["strokes_sumsq"]),
+        "video_watch_fraction": watch,
+    }
+
+
+def route_stats(study, route_id):
+    """One route's summary (a single-row lookup), or None for an unknown route."""
+    row = (
+        db.session.query(TaskStats)
+        .join(Task, Task.id == TaskStats.task_id)
+        .filter(TaskStats.study == study, Task.route_id == route_id)
+        .first()
+    )
+    if row is None:
+        return None
+    out = summarize({c: getattr(row, c) or 0 for c in SCALARS}, row.duration_hist, row.watch_hist)
+    out["route_id"] = route_id
+    return out
+
+
+def study_stats(study):
+    """Study-wide summary: sums over the per-task rows, independent of how many answers exist."""
+    totals = db.session.query(*(func.coalesce(func.sum(getattr(TaskStats, c)), 0) for c in SCALARS)).filter(
+        TaskStats.study == study).one()
+    duration_hist, watch_hist = _empty_hist(DURATION_EDGES), _empty_hist(WATCH_EDGES)
+    for dh, wh in db.session.query(TaskStats.duration_hist, TaskStats.watch_hist).filter(TaskStats.study == study):
+        duration_hist = [a + b for a, b in zip(duration_hist, dh)]
+        watch_hist = [a + b for a, b in zip(watch_hist, wh)]
+    out = summarize(dict(zip(SCALARS, totals)), duration_hist, watch_hist)
+    out["study"] = study
+    return out
+
+
+# ---- backfill ----
+def _begin_write():
+    """
+    On SQLite, take the write lock before reading (FOR UPDATE is ignored there). Waits
+    for it up to the driver's busy timeout, then raises OperationalError.
+    """
+    if db.engine.dialect.name == "sqlite":
+        db.session.execute(text("BEGIN IMMEDIATE"))
+
+
+def _is_busy(error):
+    return "locked" in str(error.orig) or "busy" in str(error.orig)
+
+
+def _rebuild(chunk):
+    _begin_write()
+    rows = {
+        (r.study, r.task_id): r
+        for r in TaskStats.query.filter(TaskStats.task_id.in_(chunk)).populate_existing().with_for_update()
+    }
+    for row in rows.values():
+        for col in SCALARS:
+            setattr(row, col, 0)
+        row.duration_hist, row.watch_hist = _empty_hist(DURATION_EDGES), _empty_hist(WATCH_EDGES)
+    for study, model in (("draw", Drawing), ("landmarks", Landmark)):
+        q = (
+            db.session.query(model.task_id, model.metrics_json)
+            .filter(model.task_id.in_(chunk), model.metrics_json.isnot(None))
+            .yield_per(1000)
+        )
+        for task_id, metrics_json in q:
+            try:
+                metrics = json.loads(metrics_json)
+            except ValueError:
+                continue
+            if not isinstance(metrics, dict):
+                continue
+            scalars, buckets = contribution(study, metrics)
+            row = rows[(study, task_id)]
+            for col in SCALARS:
+                setattr(row, col, getattr(row, col) + scalars[col])
+            for name, idx in buckets.items():
+                hist = getattr(row, f"{name}_hist")
+                hist[idx] += 1
+    now = datetime.now(timezone.utc)
+    for row in rows.values():
+        row.updated_at = now
+        flag_modified(row, "duration_hist")  # filled in place above
+        flag_modified(row, "watch_hist")
+    db.session.commit()
+
+
+def backfill(batch_size=50, retries=5):
+    """
+    Rebuild every task's stats from its Drawing/Landmark rows, `batch_size` tasks per
+    transaction. Each chunk locks its tasks' rows (on SQLite, the whole database, with
+    BEGIN IMMEDIATE) before reading, and overwrites them rather than adding to them, so
+    saves that land while this runs are neither lost nor counted twice; on SQLite they
+    wait for the chunk to commit. A chunk that can't get the lock is retried with
+    backoff, up to `retries` times. Yields the number of tasks done after each batch.
+    """
+    task_ids = [tid for (tid,) in db.session.query(Task.id).order_by(Task.id)]
+    ensure_stats_rows(task_ids)
+    db.session.commit()
+    done = 0
+    for start in range(0, len(task_ids), batch_size):
+        chunk = task_ids[start:start + batch_size]
+        for attempt in range(retries + 1):
+            try:
+                _rebuild(chunk)
+                break
+            except OperationalError as e:
+                db.session.rollback()
+                if attempt == retries or not _is_busy(e):
+                    raise
+                time.sleep(0.1 * 2 ** attempt)
+        done += len(chunk)
+        yield done
+
+
+def register_task_stats_routes(app):
+    @app.route("/admin/task_stats")
+    @admin_required
+    def admin_task_stats():
+        """?study=draw|landmarks (default: this app's) and optionally &route_id=..."""
+        study = request.args.get("study", app.config["APP_MODE"])
+        if study not in STUDIES:
+            return jsonify({"status": "error", "message": "unknown study"}), 400
+        route_id = request.args.get("route_id")
+        if route_id is None:
+            return jsonify(study_stats(study))
+        out = route_stats(study, route_id)
+        if out is None:
+            return jsonify({"status": "error", "message": "unknown route"}), 404
+        return jsonify(out)
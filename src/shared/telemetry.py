@@ -0,0 +1,202 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from flask import request, session
+from sqlalchemy import insert
+from src.shared.models import db, ClientTelemetry
+
+# what the app.js clients report; anything else is dropped
+TELEMETRY_METRICS = {
+    "map_load_ms",
+    "drawing_load_ms",
+    "video_start_ms",
+    "export_png_ms",
+    "next_batch_ms",
+    "save_answer_rtt_ms",
+    "save_drawing_rtt_ms",
+    "save_landmarks_rtt_ms",
+}
+MAX_SAMPLES_PER_BEACON = 100
+MAX_VALUE_MS = 10 * 60 * 1000
+
+_BROWSERS = [  # order matters: Edge/Opera UAs also say Chrome, Chrome UAs also say Safari
+    ("edge", re.compile(r"Edg(e|A|iOS)?/")),
+    ("opera", re.compile(r"OPR/|Opera")),
+    ("firefox", re.compile(r"Firefox/|FxiOS/")),
+    ("chrome", re.compile(r"Chrome/|CriOS/")),
+    ("safari", re.compile(r"Safari/")),
+]
+
+
+def browser_family(user_agent):
+    for name, pattern in _BROWSERS:
+        if pattern.search(user_agent or ""):
+            return name
+    return "other"
+
+
+class TelemetryBuffer:
+    """
+    Bounded in-memory queue of telemetry rows, written to the table in one bulk insert
+    every `flush_seconds` by a per-process daemon thread. The /telemetry request itself
+    never touches the database, so beacons cannot queue behind (or ahead of) saves.
+    When the buffer is full the oldest samples are dropped.
+    """
+
+    def __init__(self, app, max_rows=50000, flush_seconds=10.0):
+        self.app = app
+        self.flush_seconds = flush_seconds
+        self._rows = deque(maxlen=max_rows)
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, rows):
+        self._ensure_flusher()
+        with self._lock:
+            overflow = len(self._rows) + len(rows) - self._rows.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+            self._rows.extend(rows)
+
+    def flush(self):
+        with self._lock:
+            rows = list(self._rows)
+            self._rows.clear()
+        if not rows:
+            return 0
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(ClientTelemetry), rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.dropped += len(rows)
+                self.app.logger.warning("telemetry flush failed, dropped %d samples: %s", len(rows), e)
+                return 0
+        return len(rows)
+
+    def _ensure_flusher(self):
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def _loop():
+            while True:
+                time.sleep(self.flush_seconds)
+                self.flush()
+
+        threading.Thread(target=_loop, name="telemetry-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+
+def _parse_beacon(raw):
+    # sendBeacon posts a Blob, so don't rely on the Content-Type header
+    try:
+        payload = json.loads(raw or b"{}")
+    except ValueError:
+        return []
+    samples = payload.get("samples") if isinstance(payload, dict) else None
+    return samples[:MAX_SAMPLES_PER_BEACON] if isinstance(samples, list) else []
+
+
+def register_telemetry_routes(app):
+    buffer = TelemetryBuffer(
+        app,
+        max_rows=app.config["TELEMETRY_BUFFER_MAX"],
+        flush_seconds=app.config["TELEMETRY_FLUSH_SECONDS"],
+    )
+    app.extensions["telemetry"] = buffer
+    app.extensions["health"].add_backlog("telemetry", buffer.__len__)
+
+    @app.route("/telemetry", methods=["POST"])
+    def telemetry():
+        samples = _parse_beacon(request.get_data(cache=False))
+        if not samples:
+            return "", 204
+
+        now = datetime.now(timezone.utc)
+        # read the id flask-login keeps in the session rather than loading the user from the DB
+        user_id = session.get("_user_id")
+        user_id = int(user_id) if user_id and str(user_id).isdigit() else None
+        study = app.config["APP_MODE"]
+        browser = browser_family(request.headers.get("User-Agent"))
+
+        rows = []
+        for s in samples:
+            if not isinstance(s, dict) or s.get("m") not in TELEMETRY_METRICS:
+                continue
+            try:
+                value = float(s.get("v"))
+            except (TypeError, ValueError):
+                continue
+            if not (0.0 <= value <= MAX_VALUE_MS):
+                continue
+            route_id = s.get("r")
+            rows.append({
+                "received_at": now,
+                "user_id": user_id,
+                "study": study,
+                "route_id": str(route_id)[:32] if route_id is not None else None,
+                "metric": s["m"],
+                "value_ms": value,
+                "browser": browser,
+            })
+        if rows:
+            buffer.add(rows)
+        return "", 204
+
+
+# ---------------- aggregation ----------------
+GROUPINGS = {
+    "study": ClientTelemetry.study,
+    "route": ClientTelemetry.route_id,
+    "browser": ClientTelemetry.browser,
+}
+
+
+def _percentile(sorted_vals, q):
+    k = (len(sorted_vals) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def summarize(by="study", since=None, percentiles=(0.5, 0.75, 0.95, 0.99), batch_size=5000):
+    """
+    Percentiles of each metric per study, route or browser. Rows arrive ordered by
+    (group, metric, value), so only one group's values are held in memory at a time.
+    """
+    col = GROUPINGS[by]
+    q = db.session.query(col, ClientTelemetry.metric, ClientTelemetry.value_ms)
+    if since is not None:
+        q = q.filter(ClientTelemetry.received_at >= since)
+    q = q.order_by(col, ClientTelemetry.metric, ClientTelemetry.value_ms).execution_options(
+        stream_results=True, yield_per=batch_size)
+
+    def _emit(key, vals):
+        return {
+            by: key[0],
+            "metric": key[1],
+            "count": len(vals),
+            "mean_ms": round(sum(vals) / len(vals), 1),
+            **{f"p{int(p * 100)}_ms": round(_percentile(vals, p), 1) for p in percentiles},
+        }
+
+    key, vals = None, []
+    for group, metric, value in q:
+        if (group, metric) != key:
+            if vals:
+                yield _emit(key, vals)
+            key, vals = (group, metric), []
+        vals.append(value)
+    if vals:
+        yield _emit(key, vals)
@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from src.shared.models import db, User
+
+
+class UserSnapshot(UserMixin):
+    """Detached, read-only view of the User columns request handlers use."""
+
+    def __init__(self, id, hit_id, inflight_batch, last_batch):
+        self.id = id
+        self.hit_id = hit_id
+        self.inflight_batch = bool(inflight_batch)
+        self.last_batch = list(last_batch or [])
+
+
+class UserCache:
+    """
+    Per-worker LRU of UserSnapshots with a TTL, so @login_required requests (autosaves,
+    media fetches) don't each load the user row. id and hit_id never change; the batch
+    fields can be changed by another worker, so handlers that act on them call
+    refresh() instead of trusting the cached copy, and handlers that change them call
+    invalidate().
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=60.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # user id -> (loaded_at, snapshot)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        if self.ttl_seconds > 0:
+            with self._lock:
+                hit = self._entries.get(user_id)
+                if hit is not None and time.monotonic() - hit[0] < self.ttl_seconds:
+                    self._entries.move_to_end(user_id)
+                    return hit[1]
+        return self.refresh(user_id)
+
+    def refresh(self, user_id):
+        row = (
+            db.session.query(User.id, User.hit_id, User.inflight_batch, User.last_batch)
+            .filter(User.id == user_id)
+            .first()
+        )
+        if row is None:
+            self.invalidate(user_id)
+            return None
+        snap = UserSnapshot(*row)
+        if self.ttl_seconds > 0:
+            with self._lock:
+                self._entries[user_id] = (time.monotonic(), snap)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return snap
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
@@ -0,0 +1,390 @@
+"""
+Microbenchmarks for the server hot paths.
+
+    python -m src.tools.bench --save bench-baseline.json
+    python -m src.tools.bench --compare bench-baseline.json        # exit 1 on regression
+    python -m src.tools.bench --scale full --only next_batch
+
+Runs against a throwaway SQLite database and synthetic routes file (see --scale for
+sizes). Each benchmark is warmed up, then timed over several rounds; the median
+per-op time is what baselines store and what --compare checks against --tolerance.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parents[2]
+SCALES = {
+    # tasks, answer rows (Drawing + Landmark), users those answers are spread over
+    "small": {"tasks": 10_000, "answers": 100_000, "users": 5_000},
+    "full": {"tasks": 100_000, "answers": 1_000_000, "users": 50_000},
+}
+BENCHMARKS = {}
+
+
+def benchmark(name, number=1, rounds=15, warmup=1):
+    def deco(fn):
+        BENCHMARKS[name] = {"fn": fn, "number": number, "rounds": rounds, "warmup": warmup}
+        return fn
+    return deco
+
+
+# ---------------- fixtures ----------------
+def _stroke_points(rng, n):
+    return [{"x": rng.random() * 800, "y": rng.random() * 600} for _ in range(n)]
+
+
+def _task_metrics(rng, points):
+    return {
+        "timing": {"pageEnterMs": 1234.5, "firstInteractionMs": 2345.6, "drawingDurationMs": 10000.0},
+        "video": {"playCount": 1, "pauseCount": 1, "seekCount": 2, "totalWatchTimeMs": 5000.0,
+                  "maxWatchedTime": 12.5, "lastPlayStartedMs": 3456.7},
+        "interactions": {"undo": 1, "redo": 0, "clickedGoToLandmarksMs": 9999.0},
+        "drawing": {"strokeCount": 4, "firstStrokeMs": 2500.0, "lastStrokeMs": 9000.0,
+                    "points": _stroke_points(rng, points)},
+    }
+
+
+def write_routes_file(path, num_routes, obs_per_route=20):
+    routes = [{
+        "route_id": rid,
+        "lat_lng_path": [{"image_id": f"obs_{rid}_{j}.jpg"} for j in range(obs_per_route)],
+        "endpoint_markers": [{"label": "Point A"}, {"label": "Point B"}, {"label": "Point C"}],
+    } for rid in range(1, num_routes + 1)]
+    path.write_text(json.dumps(routes))
+
+
+def seed_database(db_path, scale, routes_data):
+    """Bulk-load tasks, users and answer rows with sqlite3 so the apps' startup sync only updates."""
+    rng = random.Random(0)
+    con = sqlite3.connect(db_path)
+    try:
+        con.executescript("""
+            CREATE TABLE IF NOT EXISTS user (id INTEGER PRIMARY KEY, hit_id VARCHAR(128) NOT NULL UNIQUE,
+                prolific_pid VARCHAR(64), prolific_study_id VARCHAR(64), prolific_session_id VARCHAR(64),
+                email VARCHAR(256) UNIQUE, created_at DATETIME, last_batch JSON, inflight_batch BOOLEAN,
+                passed_quiz BOOLEAN);
+            CREATE TABLE IF NOT EXISTS task (id INTEGER PRIMARY KEY, route_id VARCHAR NOT NULL UNIQUE,
+                served_count_draw INTEGER, served_count_landmarks INTEGER, landmarks JSON, endpoints JSON);
+            CREATE TABLE IF NOT EXISTS drawing (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user(id),
+                task_id INTEGER NOT NULL REFERENCES task(id), drawing_path TEXT, metrics_json TEXT, timestamp DATETIME);
+            CREATE TABLE IF NOT EXISTS landmark (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user(id),
+                task_id INTEGER NOT NULL REFERENCES task(id), landmarks JSON, metrics_json TEXT, timestamp DATETIME);
+        """)
+        n_tasks = scale["tasks"]
+        # leave the last 10% of tasks unserved so selection has something to find
+        served = int(n_tasks * 0.9)
+        con.executemany(
+            "INSERT INTO task (id, route_id, served_count_draw, served_count_landmarks, landmarks, endpoints) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            ((i, rid, 1 if i <= served else 0, 0, json.dumps(rd["landmarks"]), json.dumps(rd["endpoints"]))
+             for i, (rid, rd) in enumerate(routes_data.items(), start=1)),
+        )
+        con.executemany(
+            "INSERT INTO user (id, hit_id, last_batch, inflight_batch, passed_quiz) VALUES (?, ?, '[]', 0, 1)",
+            ((u, f"seed_{u}") for u in range(1, scale["users"] + 1)),
+        )
+        metrics = json.dumps(_task_metrics(rng, 50))
+        half = scale["answers"] // 2
+        con.executemany(
+            "INSERT INTO drawing (user_id, task_id, drawing_path, metrics_json, timestamp) "
+            "VALUES (?, ?, ?, ?, '2025-01-01 00:00:00')",
+            ((rng.randint(1, scale["users"]), rng.randint(1, served), f"/nonexistent/{i}.png", metrics)
+             for i in range(half)),
+        )
+        con.executemany(
+            "INSERT INTO landmark (user_id, task_id, landmarks, metrics_json, timestamp) "
+            "VALUES (?, ?, '[\"Start (S)\", \"End (G)\"]', ?, '2025-01-01 00:00:00')",
+            ((rng.randint(1, scale["users"]), rng.randint(1, served), metrics)
+             for _ in range(scale["answers"] - half)),
+        )
+        con.commit()
+    finally:
+        con.close()
+
+
+class Env:
+    """Synthetic study environment; the apps are imported only once it is in place."""
+
+    def __init__(self, scale):
+        self.scale = scale
+        self.workdir = Path(tempfile.mkdtemp(prefix="bench-"))
+        self.routes_file = self.workdir / "routes.json"
+        write_routes_file(self.routes_file, scale["tasks"])
+        os.environ.update({
+            "DATABASE_URL": f"sqlite:///{self.workdir / 'bench.db'}",
+            "ROUTES_FILE": str(self.routes_file),
+            # unreachable media roots: nothing is excluded from scheduling
+            "MAPS_DIR": str(self.workdir / "no-maps"),
+            "OBSERVATIONS_DIR": str(self.workdir / "no-observations"),
+            "VIDEO_DIR": str(self.workdir / "no-videos"),
+            "USER_DRAWINGS_DIR": str(self.workdir / "user_drawings"),
+            "SECRET_KEY": "bench",
+        })
+        os.chdir(self.workdir)  # save_answer / save_landmarks write their JSON side files to cwd
+        from src.shared.utils import parse_routes
+        seed_database(self.workdir / "bench.db", scale, parse_routes(self.routes_file))
+        self._apps = {}
+        self._n_users = 0
+
+    def app(self, mode):
+        if mode not in self._apps:
+            if mode == "draw":
+                from src.draw_site.draw_app import app
+            else:
+                from src.landmark_site.landmark_app import app
+            self._apps[mode] = app
+        return self._apps[mode]
+
+    def logged_in_client(self, mode):
+        self._n_users += 1
+        client = self.app(mode).test_client()
+        r = client.get(f"/prolific?PROLIFIC_PID=bench{self._n_users}&STUDY_ID=bench&SESSION_ID={mode}")
+        assert r.status_code == 302, r.status_code
+        return client
+
+    def close(self):
+        os.chdir(REPO_DIR)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# ---------------- benchmarks ----------------
+@benchmark("merge_metrics", number=200)
+def bench_merge_metrics(env):
+    from src.shared.answer_routes import _merge_metrics
+    rng = random.Random(1)
+    prev = _merge_metrics({}, _task_metrics(rng, 2000))
+    incoming = _task_metrics(rng, 200)
+
+    def run():
+        _merge_metrics(prev, incoming)
+    return run
+
+
+@benchmark("merge_metrics_fresh", number=200)
+def bench_merge_metrics_fresh(env):
+    # the first save of a task: nothing stored yet
+    from src.shared.answer_routes import _merge_metrics
+    incoming = _task_metrics(random.Random(2), 200)
+
+    def run():
+        _merge_metrics({}, copy.copy(incoming))
+    return run
+
+
+@benchmark("parse_routes", rounds=5)
+def bench_parse_routes(env):
+    from src.shared.utils import parse_routes
+
+    def run():
+        parse_routes(env.routes_file)
+    return run
+
+
+@benchmark("make_trajectory", number=1000)
+def bench_make_trajectory(env):
+    from src.shared.batch_routes import make_trajectory
+    from src.shared.models import Task
+    app = env.app("draw")
+    routes_data = app.extensions["routes_data"]
+    with app.app_context():
+        tasks = Task.query.limit(1000).all()
+    it = iter(tasks * 1000)
+
+    def run():
+        make_trajectory(next(it), routes_data)
+    return run
+
+
+def _next_batch_bench(mode):
+    def setup(env):
+        pool = [env.logged_in_client(mode) for _ in range(40)]
+        it = iter(pool)
+
+        def run():
+            # a fresh participant every call, so this measures selection and not the inflight shortcut
+            r = next(it).get("/next_batch")
+            assert r.status_code == 200, r.status_code
+        return run
+    return setup
+
+
+benchmark("next_batch_draw", rounds=30, warmup=2)(_next_batch_bench("draw"))
+benchmark("next_batch_landmarks", rounds=30, warmup=2)(_next_batch_bench("landmarks"))
+
+
+@benchmark("next_batch_inflight", number=20)
+def bench_next_batch_inflight(env):
+    client = env.logged_in_client("draw")
+    client.get("/next_batch")
+
+    def run():
+        client.get("/next_batch")
+    return run
+
+
+def _save_answer_bench(mode):
+    def setup(env):
+        client = env.logged_in_client(mode)
+        tasks = client.get("/next_batch").get_json()["trajectories"] or [{"task_id": 1}]
+        rng = random.Random(3)
+        payloads = [{"task_id": t["task_id"], "landmarks": ["Start (S)", "Point A", "End (G)"],
+                     "task_metrics": _task_metrics(rng, 200)} for t in tasks]
+        it = iter(payloads * 10_000)
+
+        def run():
+            r = client.post("/save_answer", json=next(it))
+            assert r.status_code == 200, r.status_code
+        return run
+    return setup
+
+
+benchmark("save_answer_draw", number=20)(_save_answer_bench("draw"))
+benchmark("save_answer_landmarks", number=20)(_save_answer_bench("landmarks"))
+
+
+@benchmark("save_drawing", number=20)
+def bench_save_drawing(env):
+    import base64
+    from src.tools.loadtest import _png_bytes
+    client = env.logged_in_client("draw")
+    tasks = client.get("/next_batch").get_json()["trajectories"]
+    image = "data:image/png;base64," + base64.b64encode(_png_bytes((800, 600), 40, 0)).decode("ascii")
+    it = iter([t["task_id"] for t in tasks] * 10_000)
+
+    def run():
+        r = client.post("/save_drawing", json={"task_id": next(it), "image": image})
+        assert r.status_code == 200, r.status_code
+    return run
+
+
+@benchmark("save_landmarks", number=20)
+def bench_save_landmarks(env):
+    client = env.logged_in_client("landmarks")
+    tasks = client.get("/next_batch").get_json()["trajectories"] or [{"task_id": 1}]
+    it = iter([t["task_id"] for t in tasks] * 10_000)
+    landmarks = ["Start (S)", "Point A", "Point B", "Point C", "End (G)"]
+
+    def run():
+        r = client.post("/save_landmarks", json={"task_id": next(it), "landmarks": landmarks})
+        assert r.status_code == 200, r.status_code
+    return run
+
+
+# ---------------- runner ----------------
+def run_benchmark(env, spec):
+    run = spec["fn"](env)
+    for _ in range(spec["warmup"]):
+        for _ in range(spec["number"]):
+            run()
+    per_op = []
+    for _ in range(spec["rounds"]):
+        t0 = time.perf_counter_ns()
+        for _ in range(spec["number"]):
+            run()
+        per_op.append((time.perf_counter_ns() - t0) / spec["number"] / 1000.0)
+    per_op.sort()
+    q1, _, q3 = statistics.quantiles(per_op, n=4) if len(per_op) > 1 else (per_op[0],) * 3
+    return {
+        "median_us": round(statistics.median(per_op), 3),
+        "min_us": round(per_op[0], 3),
+        "max_us": round(per_op[-1], 3),
+        "iqr_us": round(q3 - q1, 3),
+        "rounds": spec["rounds"],
+        "number": spec["number"],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Per-benchmark ratio against the baseline medians; 'regression' when slower than tolerance."""
+    out = {}
+    for name, r in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            out[name] = {"status": "new"}
+            continue
+        ratio = r["median_us"] / base["median_us"] if base["median_us"] else float("inf")
+        # ignore differences inside the noise band of either run
+        noise = max(r["iqr_us"], base.get("iqr_us", 0.0))
+        delta = r["median_us"] - base["median_us"]
+        if ratio > 1 + tolerance and delta > noise:
+            status = "regression"
+        elif ratio < 1 - tolerance and -delta > noise:
+            status = "improvement"
+        else:
+            status = "ok"
+        out[name] = {"status": status, "ratio": round(ratio, 3), "baseline_median_us": base["median_us"]}
+    return out
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scale", choices=sorted(SCALES), default="small")
+    ap.add_argument("--only", action="append", help="Run benchmarks whose name starts with this (repeatable).")
+    ap.add_argument("--save", help="Write results as a baseline JSON file.")
+    ap.add_argument("--compare", help="Compare against a saved baseline; exit 1 on regression.")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown ratio (default 0.10).")
+    args = ap.parse_args(argv)
+
+    selected = {n: s for n, s in BENCHMARKS.items() if not args.only or any(n.startswith(o) for o in args.only)}
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    if baseline and baseline.get("meta", {}).get("scale") != args.scale:
+        print(f"warning: baseline was recorded at scale {baseline['meta'].get('scale')!r}", file=sys.stderr)
+
+    sys.path.insert(0, str(REPO_DIR))
+    env = Env(SCALES[args.scale])
+    results = {}
+    try:
+        for name, spec in selected.items():
+            results[name] = run_benchmark(env, spec)
+            print(f"{name:28s} {results[name]['median_us']:12.1f} us/op  (iqr {results[name]['iqr_us']:.1f})",
+                  file=sys.stderr)
+    finally:
+        env.close()
+
+    report = {
+        "meta": {
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "scale": args.scale,
+            **SCALES[args.scale],
+        },
+        "results": results,
+    }
+    exit_code = 0
+    if baseline:
+        report["comparison"] = compare(results, baseline, args.tolerance)
+        regressions = [n for n, c in report["comparison"].items() if c["status"] == "regression"]
+        for n in regressions:
+            c = report["comparison"][n]
+            print(f"REGRESSION {n}: {c['ratio']:.2f}x baseline ({c['baseline_median_us']} us)", file=sys.stderr)
+        exit_code = 1 if regressions else 0
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, indent=2) + "\n")
+    print(json.dumps(report, indent=2))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
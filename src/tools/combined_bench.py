@@ -0,0 +1,189 @@
+"""
+Compare serving both studies as two deployments vs one combined deployment.
+
+    python -m src.tools.combined_bench --participants 20 --workers 3 --threads 2
+    python -m src.tools.combined_bench --combined-workers 3 --out combined.json
+
+"separate" starts src.draw_site.draw_app and src.landmark_site.landmark_app under
+their own gunicorn masters with --workers each; "combined" starts src.combined_app
+once with --combined-workers (default: the same --workers, i.e. half the processes).
+Both setups share one database between the studies, get the same synthetic data (half
+the routes pre-drawn for the landmark study) and the same participant load on each study
+at once, and the report gives memory (PSS, so pages shared after fork count once),
+throughput and per-study latency for each, plus combined/separate ratios.
+"""
+import argparse
+import base64
+import json
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from src.tools.loadtest import (
+    Participant, Recorder, _percentile, _png_bytes, build_workdir, seed_drawings, start_server,
+)
+
+COMBINED_MODULE = "src.combined_app:app"
+HOSTS = {"draw": "draw.bench", "landmarks": "landmarks.bench"}
+
+
+def _tree_pids(pid):
+    pids = [pid]
+    try:
+        children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    except OSError:
+        return pids
+    for child in children:
+        pids.extend(_tree_pids(int(child)))
+    return pids
+
+
+def tree_memory_mb(pid):
+    """(processes, PSS MB, RSS MB) of a process and its descendants, from /proc."""
+    pss = rss = 0
+    pids = _tree_pids(pid)
+    for p in pids:
+        try:
+            for line in Path(f"/proc/{p}/smaps_rollup").read_text().splitlines():
+                if line.startswith("Pss:"):
+                    pss += int(line.split()[1])
+                elif line.startswith("Rss:"):
+                    rss += int(line.split()[1])
+        except OSError:
+            continue
+    return len(pids), round(pss / 1024, 1), round(rss / 1024, 1)
+
+
+def run_load(targets, args):
+    """targets: study -> (base_url, host header or None). Runs every study's participants at once."""
+    drawings = ["data:image/png;base64," + base64.b64encode(_png_bytes((800, 600), args.strokes, i)).decode("ascii")
+                for i in range(8)]
+    recorders = {study: Recorder() for study in targets}
+    delay = args.ramp / max(args.participants, 1)
+
+    def _one(job):
+        study, i = job
+        time.sleep(i * delay)
+        base_url, host = targets[study]
+        p = Participant(i + (0 if study == "draw" else 100_000), base_url, study, recorders[study], args,
+                        drawings if study == "draw" else [])
+        if host:
+            p.http.headers["Host"] = host
+        return p.run()
+
+    jobs = [(study, i) for i in range(args.participants) for study in targets]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        completed = sum(1 for ok in pool.map(_one, jobs) if ok)
+    return recorders, time.perf_counter() - t0, completed
+
+
+def summarize(recorders, wall_s, completed, memory):
+    total = sum(len(v) for rec in recorders.values() for v in rec.samples.values())
+    errors = sum(sum(rec.errors.values()) for rec in recorders.values())
+    studies = {}
+    for study, rec in recorders.items():
+        vals = sorted(v for samples in rec.samples.values() for v in samples)
+        studies[study] = {
+            "requests": len(vals),
+            "errors": sum(rec.errors.values()),
+            "p50_ms": round(_percentile(vals, 0.50), 3) if vals else None,
+            "p95_ms": round(_percentile(vals, 0.95), 3) if vals else None,
+            "p99_ms": round(_percentile(vals, 0.99), 3) if vals else None,
+        }
+    processes, pss_mb, rss_mb = memory
+    return {
+        "processes": processes,
+        "pss_mb": pss_mb,
+        "rss_mb": rss_mb,
+        "wall_s": round(wall_s, 3),
+        "requests": total,
+        "throughput_rps": round(total / wall_s, 3),
+        "errors": errors,
+        "participants_completed": completed,
+        "studies": studies,
+    }
+
+
+def run_separate(args):
+    workdir = Path(tempfile.mkdtemp(prefix="combined-bench-separate-"))
+    procs = []
+    try:
+        env = build_workdir(workdir, args.routes, args.video_kb)
+        targets = {}
+        for study in ("draw", "landmarks"):
+            proc, url = start_server(study, env, workdir, args.workers, args.threads, seed=False)
+            procs.append(proc)
+            targets[study] = (url, None)
+        seed_drawings(workdir, env, limit=args.routes // 2)
+        recorders, wall_s, completed = run_load(targets, args)
+        mems = [tree_memory_mb(p.pid) for p in procs]
+        memory = tuple(round(sum(m[i] for m in mems), 1) for i in range(3))
+        return summarize(recorders, wall_s, completed, memory)
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_combined(args):
+    workdir = Path(tempfile.mkdtemp(prefix="combined-bench-combined-"))
+    proc = None
+    try:
+        env = build_workdir(workdir, args.routes, args.video_kb)
+        env["COMBINED_HOSTS"] = ",".join(f"{host}={study}" for study, host in HOSTS.items())
+        proc, url = start_server("combined", env, workdir, args.combined_workers, args.threads,
+                                 module=COMBINED_MODULE, seed=False)
+        seed_drawings(workdir, env, limit=args.routes // 2)
+        recorders, wall_s, completed = run_load({study: (url, host) for study, host in HOSTS.items()}, args)
+        return summarize(recorders, wall_s, completed, tree_memory_mb(proc.pid))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--participants", type=int, default=10, help="Participants per study.")
+    ap.add_argument("--ramp", type=float, default=5.0)
+    ap.add_argument("--ticks", type=int, default=2)
+    ap.add_argument("--autosave-interval", type=float, default=0.5)
+    ap.add_argument("--images-per-task", type=int, default=2)
+    ap.add_argument("--strokes", type=int, default=40)
+    ap.add_argument("--routes", type=int, default=None)
+    ap.add_argument("--video-kb", type=int, default=64)
+    ap.add_argument("--workers", type=int, default=3, help="Workers per study in the separate setup.")
+    ap.add_argument("--combined-workers", type=int, default=None, help="Workers in the combined setup (default: --workers).")
+    ap.add_argument("--threads", type=int, default=2)
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--out", help="Write the JSON report here as well as to stdout.")
+    args = ap.parse_args(argv)
+    args.combined_workers = args.combined_workers or args.workers
+    # first half gets seeded drawings for the landmark study, the rest is left for draw
+    args.routes = args.routes or 2 * max(60, args.participants * 6 + 6)
+
+    separate = run_separate(args)
+    combined = run_combined(args)
+    report = {
+        "config": {k: getattr(args, k) for k in (
+            "participants", "ticks", "autosave_interval", "workers", "combined_workers", "threads",
+        )},
+        "separate": separate,
+        "combined": combined,
+        "ratio": {
+            k: round(combined[k] / separate[k], 3) if separate[k] else None
+            for k in ("processes", "pss_mb", "rss_mb", "throughput_rps")
+        },
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
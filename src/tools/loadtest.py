@@ -0,0 +1,351 @@
+"""
+Participant-simulation load test for the draw and landmark apps.
+
+    python -m src.tools.loadtest --app draw --participants 50 --out draw.json
+    python -m src.tools.loadtest --app landmarks --participants 50 --workers 3 --threads 2
+
+Builds a throwaway work directory (synthetic routes file, stand-in maps/observations/
+videos, SQLite DB), starts the app under gunicorn with that environment, and runs
+simulated participants through /prolific -> /next_batch -> autosave ticks ->
+/complete. Prints a JSON report (throughput, per-endpoint p50/p95/p99, error rates).
+Pass --url to drive a server that is already running instead.
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import requests
+from PIL import Image, ImageDraw
+
+REPO_DIR = Path(__file__).resolve().parents[2]
+APP_MODULES = {
+    "draw": "src.draw_site.draw_app:app",
+    "landmarks": "src.landmark_site.landmark_app:app",
+}
+OBS_PER_ROUTE = 8
+
+
+# ---------------- synthetic study data ----------------
+def _png_bytes(size, strokes, seed):
+    rng = random.Random(seed)
+    im = Image.new("RGBA", size, (255, 255, 255, 255))
+    d = ImageDraw.Draw(im)
+    for _ in range(strokes):
+        pts = [(rng.randrange(size[0]), rng.randrange(size[1])) for _ in range(rng.randint(2, 8))]
+        d.line(pts, fill=(0, 0, 0, 255), width=3)
+    buf = io.BytesIO()
+    im.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _jpeg_bytes(size, seed):
+    im = Image.new("RGB", size, tuple(random.Random(seed).randrange(256) for _ in range(3)))
+    buf = io.BytesIO()
+    im.save(buf, format="JPEG", quality=70)
+    return buf.getvalue()
+
+
+def build_workdir(workdir, num_routes, video_kb):
+    """Write routes.json plus stand-in media; returns the environment the app should run with."""
+    paths = {k: workdir / k for k in ("maps", "observations", "videos", "user_drawings")}
+    for p in paths.values():
+        p.mkdir(parents=True, exist_ok=True)
+
+    map_png = _png_bytes((640, 480), 30, 0)
+    obs_jpg = _jpeg_bytes((640, 360), 0)
+    video = os.urandom(video_kb * 1024)
+
+    routes = []
+    for rid in range(1, num_routes + 1):
+        images = [f"obs_{rid}_{j}.jpg" for j in range(OBS_PER_ROUTE)]
+        routes.append({
+            "route_id": rid,
+            "lat_lng_path": [{"image_id": img} for img in images],
+            "endpoint_markers": [{"label": "Point A"}, {"label": "Point B"}, {"label": "Point C"}],
+        })
+        (paths["maps"] / f"{rid}.png").write_bytes(map_png)
+        (paths["videos"] / f"{rid}.mp4").write_bytes(video)
+        for img in images:
+            (paths["observations"] / img).write_bytes(obs_jpg)
+
+    routes_file = workdir / "routes.json"
+    routes_file.write_text(json.dumps(routes))
+
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": str(REPO_DIR),
+        "DATABASE_URL": f"sqlite:///{workdir / 'loadtest.db'}",
+        "ROUTES_FILE": str(routes_file),
+        "MAPS_DIR": str(paths["maps"]) + "/",
+        "OBSERVATIONS_DIR": str(paths["observations"]) + "/",
+        "VIDEO_DIR": str(paths["videos"]) + "/",
+        "USER_DRAWINGS_DIR": str(paths["user_drawings"]),
+        "SECRET_KEY": "loadtest",
+    })
+    return env
+
+
+def seed_drawings(workdir, env, limit=None):
+    """Landmark mode only schedules tasks that already have a drawing: give every task (or the first `limit`) one."""
+    db_path = env["DATABASE_URL"].removeprefix("sqlite:///")
+    png = _png_bytes((800, 600), 40, 1)
+    con = sqlite3.connect(db_path)
+    try:
+        cur = con.execute("INSERT INTO user (hit_id, inflight_batch, passed_quiz) VALUES ('loadtest_seed', 0, 1)")
+        uid = cur.lastrowid
+        rows = []
+        task_ids = [tid for (tid,) in con.execute("SELECT id FROM task ORDER BY id LIMIT ?", (limit or -1,))]
+        for task_id in task_ids:
+            path = Path(env["USER_DRAWINGS_DIR"]) / f"{uid}_{task_id}.png"
+            path.write_bytes(png)
+            rows.append((uid, task_id, str(path)))
+        con.executemany("INSERT INTO drawing (user_id, task_id, drawing_path) VALUES (?, ?, ?)", rows)
+        con.executemany("UPDATE task SET served_count_draw = 1 WHERE id = ?", [(t,) for t in task_ids])
+        con.commit()
+    finally:
+        con.close()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app_name, env, workdir, workers, threads, module=None, seed=None):
+    """Start gunicorn on a free port; `module` overrides APP_MODULES, `seed` overrides whether to seed_drawings."""
+    module = module or APP_MODULES[app_name]
+    # import the app once up front so gunicorn workers don't all race to create and sync the tables
+    subprocess.run([sys.executable, "-c", f"import {module.split(':')[0]}"],
+                   env=env, cwd=workdir, check=True)
+    if seed is None:
+        seed = app_name == "landmarks"
+    if seed:
+        seed_drawings(workdir, env)
+
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}",
+         "--workers", str(workers), "--threads", str(threads), module],
+        env=env, cwd=workdir, stdout=subprocess.DEVNULL, stderr=open(workdir / f"server-{app_name}.log", "w"),
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url + "/login_page", timeout=1).status_code == 200:
+                return proc, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"server did not come up; see {workdir / f'server-{app_name}.log'}")
+
+
+# ---------------- participants ----------------
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}   # endpoint -> [latency_ms]
+        self.errors = {}    # endpoint -> count
+
+    def record(self, endpoint, ms, ok):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(ms)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+class Participant:
+    def __init__(self, idx, base_url, app_name, recorder, args, drawings):
+        self.idx = idx
+        self.drawings = drawings
+        self.base_url = base_url
+        self.app_name = app_name
+        self.rec = recorder
+        self.args = args
+        self.http = requests.Session()
+        self.rng = random.Random(idx)
+
+    def call(self, method, path, endpoint=None, **kw):
+        t0 = time.perf_counter()
+        try:
+            r = self.http.request(method, self.base_url + path, timeout=self.args.timeout, **kw)
+            ok = r.status_code < 400
+        except requests.RequestException:
+            r, ok = None, False
+        self.rec.record(endpoint or path, (time.perf_counter() - t0) * 1000.0, ok)
+        return r
+
+    def run(self):
+        pid = f"lt{self.idx:06d}"
+        r = self.call("GET", f"/prolific?PROLIFIC_PID={pid}&STUDY_ID=loadtest&SESSION_ID={self.idx}", "/prolific")
+        if r is None or r.status_code >= 400:
+            return False
+        r = self.call("GET", "/next_batch")
+        if r is None or r.status_code >= 400:
+            return False
+        batch = r.json()
+
+        for traj in batch.get("trajectories", []):
+            task_id = traj["task_id"]
+            self.call("GET", traj["map_url"], "/maps/<fname>")
+            for img in traj["images"][: self.args.images_per_task]:
+                self.call("GET", img, "/observations/<fname>")
+            self.call("GET", f"/videos/{traj['video']}", "/videos/<filename>")
+
+            drawing_uri = self.rng.choice(self.drawings) if self.drawings else None
+
+            for tick in range(self.args.ticks):
+                time.sleep(self.args.autosave_interval * self.rng.uniform(0.8, 1.2))
+                metrics = {
+                    "timing": {"drawingDurationMs": 1000.0 * self.args.autosave_interval},
+                    "drawing": {
+                        "strokeCount": 3,
+                        "strokes": [
+                            {"t0": time.time() * 1000.0,
+                             "pts": [v for i in range(67) for v in (self.rng.randrange(800), self.rng.randrange(600), 16 * i)]}
+                            for _ in range(3)
+                        ],
+                    },
+                    "interactions": {},
+                    "video": {"playCount": 1, "totalWatchTimeMs": 500.0},
+                }
+                landmarks = ["Start (S)", "Point A", "Point B", "Point C", "End (G)"]
+                if self.app_name == "draw":
+                    self.call("POST", "/save_drawing", json={"task_id": task_id, "image": drawing_uri})
+                else:
+                    self.call("POST", "/save_landmarks", json={"task_id": task_id, "landmarks": landmarks})
+                self.call("POST", "/save_answer", json={
+                    "task_id": task_id, "landmarks": landmarks, "task_metrics": metrics,
+                })
+
+        r = self.call("POST", "/complete")
+        return r is not None and r.status_code < 400
+
+
+# ---------------- report ----------------
+def _percentile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    k = (len(sorted_vals) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def build_report(recorder, wall_s, completed, args):
+    endpoints, total, total_err = {}, 0, 0
+    for ep, vals in sorted(recorder.samples.items()):
+        vals = sorted(vals)
+        errs = recorder.errors.get(ep, 0)
+        total += len(vals)
+        total_err += errs
+        endpoints[ep] = {
+            "count": len(vals),
+            "errors": errs,
+            "error_rate": errs / len(vals),
+            "rps": round(len(vals) / wall_s, 3),
+            "mean_ms": round(sum(vals) / len(vals), 3),
+            "p50_ms": round(_percentile(vals, 0.50), 3),
+            "p95_ms": round(_percentile(vals, 0.95), 3),
+            "p99_ms": round(_percentile(vals, 0.99), 3),
+            "max_ms": round(vals[-1], 3),
+        }
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                             capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {
+        "app": args.app,
+        "git_rev": rev,
+        "config": {k: getattr(args, k) for k in (
+            "participants", "concurrency", "ticks", "autosave_interval", "workers", "threads", "strokes",
+        )},
+        "wall_s": round(wall_s, 3),
+        "requests": total,
+        "throughput_rps": round(total / wall_s, 3),
+        "errors": total_err,
+        "error_rate": (total_err / total) if total else 0.0,
+        "participants_completed": completed,
+        "participants_failed": args.participants - completed,
+        "endpoints": endpoints,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--app", choices=sorted(APP_MODULES), default="draw")
+    ap.add_argument("--url", help="Drive an already-running server instead of starting one.")
+    ap.add_argument("--participants", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=None, help="Participants active at once (default: all).")
+    ap.add_argument("--ramp", type=float, default=5.0, help="Seconds over which participants arrive.")
+    ap.add_argument("--ticks", type=int, default=3, help="Autosave ticks per task.")
+    ap.add_argument("--autosave-interval", type=float, default=1.0, help="Seconds between ticks.")
+    ap.add_argument("--images-per-task", type=int, default=2)
+    ap.add_argument("--strokes", type=int, default=40, help="Strokes per synthetic drawing.")
+    ap.add_argument("--routes", type=int, default=None, help="Synthetic routes (default: enough for everyone).")
+    ap.add_argument("--video-kb", type=int, default=64)
+    ap.add_argument("--workers", type=int, default=3)
+    ap.add_argument("--threads", type=int, default=2)
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--keep", action="store_true", help="Keep the work directory.")
+    ap.add_argument("--out", help="Write the JSON report here as well as to stdout.")
+    args = ap.parse_args(argv)
+    args.concurrency = args.concurrency or args.participants
+
+    workdir, proc = None, None
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            workdir = Path(tempfile.mkdtemp(prefix=f"loadtest-{args.app}-"))
+            # draw mode serves each route to one participant; leave headroom for every batch
+            num_routes = args.routes or max(60, args.participants * 6 + 6)
+            env = build_workdir(workdir, num_routes, args.video_kb)
+            proc, base_url = start_server(args.app, env, workdir, args.workers, args.threads)
+
+        recorder = Recorder()
+        # encode drawings up front so PNG work in client threads doesn't skew latencies
+        drawings = []
+        if args.app == "draw":
+            drawings = ["data:image/png;base64," + base64.b64encode(_png_bytes((800, 600), args.strokes, i)).decode("ascii")
+                        for i in range(8)]
+        delay = args.ramp / max(args.participants, 1)
+
+        def _one(i):
+            time.sleep(i * delay if i < args.concurrency else 0)
+            return Participant(i, base_url, args.app, recorder, args, drawings).run()
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            completed = sum(1 for ok in pool.map(_one, range(args.participants)) if ok)
+        wall_s = time.perf_counter() - t0
+
+        report = build_report(recorder, wall_s, completed, args)
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.out:
+            Path(args.out).write_text(text + "\n")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        if workdir is not None and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
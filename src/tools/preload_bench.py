@@ -0,0 +1,128 @@
+"""
+Boot cost of gunicorn with and without preloading the app in the master.
+
+    python -m src.tools.preload_bench --routes 5000 --workers 8
+    python -m src.tools.preload_bench --module src.combined_app:app --out preload.json
+
+Starts the app twice on the same synthetic data: plainly (every worker imports the app,
+parses the routes and runs the Task sync) and with -c python:src.gunicorn_conf (the
+master does it once and forks). Startup is the time from launch until every worker
+has answered /readyz. Memory is read from /proc once all the workers are up. It gives
+the RSS and the private (unshared) part of each worker, plus the PSS of the whole
+process tree, where pages shared after the fork count once.
+"""
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import requests
+from src.tools.loadtest import APP_MODULES, _free_port, build_workdir
+from src.tools.combined_bench import _tree_pids
+
+PRELOAD_CONFIG = "python:src.gunicorn_conf"
+
+
+def process_memory_kb(pid):
+    """{"rss": .., "pss": .., "private": ..} in kB, from /proc/<pid>/smaps_rollup."""
+    out = {"rss": 0, "pss": 0, "private": 0}
+    try:
+        lines = Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()
+    except OSError:
+        return out
+    for line in lines:
+        field, _, rest = line.partition(":")
+        if field == "Rss":
+            out["rss"] = int(rest.split()[0])
+        elif field == "Pss":
+            out["pss"] = int(rest.split()[0])
+        elif field in ("Private_Clean", "Private_Dirty"):
+            out["private"] += int(rest.split()[0])
+    return out
+
+
+def boot(module, env, workdir, workers, threads, preload, timeout=300.0):
+    """Start gunicorn and wait until every worker answers /readyz. Returns (proc, seconds, worker pids)."""
+    port = _free_port()
+    cmd = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}",
+           "--workers", str(workers), "--threads", str(threads)]
+    if preload:
+        cmd += ["-c", PRELOAD_CONFIG]
+    log = open(workdir / f"server-{'preload' if preload else 'plain'}.log", "w")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd + [module], env=env, cwd=workdir, stdout=subprocess.DEVNULL, stderr=log)
+    seen = set()
+    deadline = time.monotonic() + timeout
+    while len(seen) < workers and time.monotonic() < deadline:
+        try:
+            # a fresh connection per probe so the requests spread over the workers
+            r = requests.get(f"http://127.0.0.1:{port}/readyz", timeout=2, headers={"Connection": "close"})
+            if r.status_code == 200:
+                seen.add(r.json()["pid"])
+                continue
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - t0
+    if len(seen) < workers:
+        proc.terminate()
+        raise RuntimeError(f"only {len(seen)}/{workers} workers came up; see {log.name}")
+    return proc, elapsed, sorted(seen)
+
+
+def measure(args, env, workdir, preload):
+    proc, elapsed, pids = boot(args.module, env, workdir, args.workers, args.threads, preload)
+    try:
+        time.sleep(args.settle)
+        workers = [process_memory_kb(p) for p in pids]
+        tree_pss = sum(process_memory_kb(p)["pss"] for p in _tree_pids(proc.pid))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    n = len(workers)
+    return {
+        "startup_s": round(elapsed, 3),
+        "worker_rss_mb": round(sum(w["rss"] for w in workers) / n / 1024, 1),
+        "worker_private_mb": round(sum(w["private"] for w in workers) / n / 1024, 1),
+        "tree_pss_mb": round(tree_pss / 1024, 1),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--module", default=APP_MODULES["draw"])
+    ap.add_argument("--routes", type=int, default=5000)
+    ap.add_argument("--video-kb", type=int, default=1)
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--threads", type=int, default=2)
+    ap.add_argument("--settle", type=float, default=2.0, help="Seconds to wait after startup before reading memory.")
+    ap.add_argument("--out", help="Write the JSON report here as well as to stdout.")
+    args = ap.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix="preload-bench-"))
+    try:
+        env = build_workdir(workdir, args.routes, args.video_kb)
+        # create and fill the tables first: both runs then pay the steady-state sync, not the first one
+        subprocess.run([sys.executable, "-c", f"import {args.module.split(':')[0]}"], env=env, cwd=workdir, check=True)
+        plain = measure(args, env, workdir, preload=False)
+        preload = measure(args, env, workdir, preload=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "config": {k: getattr(args, k) for k in ("module", "routes", "workers", "threads")},
+        "plain": plain,
+        "preload": preload,
+        "ratio": {k: round(preload[k] / plain[k], 3) if plain[k] else None for k in plain},
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Minimal S3-compatible object server for exercising DRAWING_STORE=s3 without AWS or MinIO.
+
+    python -m src.tools.s3_standin --root /tmp/s3 --port 9000 --access-key dev --secret-key devsecret
+
+Serves path-style PUT/GET/HEAD/DELETE on /<bucket>/<key>, storing each object as a
+file under --root. Requests must carry a valid SigV4 signature, either in the
+Authorization header or as a presigned query string (which is also checked for
+expiry), so the signing code in src/shared/drawing_store.py is exercised end to end.
+Buckets are created on first PUT. No listing, multipart or ACLs.
+"""
+import argparse
+import datetime as dt
+import email.utils
+import hmac
+import os
+import re
+import shutil
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+from src.shared.drawing_store import canonical_request, sigv4_signature
+
+CHUNK = 256 * 1024
+AUTH_RE = re.compile(r"AWS4-HMAC-SHA256 Credential=([^/]+)/(\d{8})/([^/]+)/s3/aws4_request, "
+                     r"SignedHeaders=([^,]+), Signature=([0-9a-f]+)")
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "s3-standin"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    # ---- helpers ----
+    def _error(self, status, code):
+        body = f"<Error><Code>{code}</Code></Error>".encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _object_path(self, path):
+        parts = unquote(path).lstrip("/").split("/", 1)
+        if len(parts) != 2 or not parts[0] or not parts[1] or ".." in parts[1].split("/"):
+            return None
+        return os.path.join(self.server.root, parts[0], parts[1])
+
+    def _authorized(self):
+        url = urlsplit(self.path)
+        query = parse_qsl(url.query, keep_blank_values=True)
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        params = dict(query)
+        if "X-Amz-Signature" in params:
+            credential = params.get("X-Amz-Credential", "").split("/")
+            if len(credential) != 5:
+                return False
+            access_key, date, region = credential[:3]
+            amz_date = params.get("X-Amz-Date", "")
+            signed = params.get("X-Amz-SignedHeaders", "host").split(";")
+            given = params["X-Amz-Signature"]
+            query = [(k, v) for k, v in query if k != "X-Amz-Signature"]
+            payload_hash = "UNSIGNED-PAYLOAD"
+            try:
+                issued = dt.datetime.strptime(amz_date, "%Y%m%dT%H%M%SZ").replace(tzinfo=dt.timezone.utc)
+                expires = int(params.get("X-Amz-Expires", "0"))
+            except ValueError:
+                return False
+            if dt.datetime.now(dt.timezone.utc) > issued + dt.timedelta(seconds=expires):
+                return False
+        else:
+            m = AUTH_RE.fullmatch(headers.get("authorization", ""))
+            if not m:
+                return False
+            access_key, date, region, signed, given = m.groups()
+            signed = signed.split(";")
+            amz_date = headers.get("x-amz-date", "")
+            payload_hash = headers.get("x-amz-content-sha256", "UNSIGNED-PAYLOAD")
+        if access_key != self.server.access_key or not amz_date.startswith(date):
+            return False
+        if any(h not in headers for h in signed):
+            return False
+        creq = canonical_request(self.command, unquote(url.path), query, headers, signed, payload_hash)
+        expected = sigv4_signature(self.server.secret_key, region, amz_date, creq)
+        return hmac.compare_digest(expected, given)
+
+    def _prepare(self):
+        if not self._authorized():
+            self._error(403, "SignatureDoesNotMatch")
+            return None
+        path = self._object_path(urlsplit(self.path).path)
+        if path is None:
+            self._error(400, "InvalidRequest")
+        return path
+
+    # ---- verbs ----
+    def do_PUT(self):
+        path = self._prepare()
+        if path is None:
+            return
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self._error(411, "MissingContentLength")
+            return
+        remaining = int(length)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            while remaining:
+                chunk = self.rfile.read(min(CHUNK, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+        if remaining:
+            os.remove(tmp)
+            self.close_connection = True
+            return
+        os.replace(tmp, path)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._get(send_body=False)
+
+    def do_GET(self):
+        self._get(send_body=True)
+
+    def _get(self, send_body):
+        path = self._prepare()
+        if path is None:
+            return
+        try:
+            f = open(path, "rb")
+        except (FileNotFoundError, IsADirectoryError):
+            self._error(404, "NoSuchKey")
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png" if path.endswith(".png") else "application/octet-stream")
+            self.send_header("Content-Length", str(st.st_size))
+            self.send_header("Last-Modified", email.utils.formatdate(st.st_mtime, usegmt=True))
+            self.end_headers()
+            if send_body:
+                shutil.copyfileobj(f, self.wfile, CHUNK)
+
+    def do_DELETE(self):
+        path = self._prepare()
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self.send_response(204)
+        self.end_headers()
+
+
+def make_server(root, host="127.0.0.1", port=9000, access_key="dev", secret_key="devsecret", verbose=False):
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.root = os.path.abspath(root)
+    server.access_key = access_key
+    server.secret_key = secret_key
+    server.verbose = verbose
+    os.makedirs(server.root, exist_ok=True)
+    return server
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--root", default="s3-standin", help="Directory holding the buckets.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9000)
+    ap.add_argument("--access-key", default=os.getenv("S3_ACCESS_KEY", "dev"))
+    ap.add_argument("--secret-key", default=os.getenv("S3_SECRET_KEY", "devsecret"))
+    ap.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = ap.parse_args(argv)
+    server = make_server(args.root, args.host, args.port, args.access_key, args.secret_key, args.verbose)
+    print(f"s3 stand-in on http://{args.host}:{args.port} serving {server.root}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
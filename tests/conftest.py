@@ -0,0 +1,69 @@
+"""
+Both study apps on a throwaway SQLite database, routes file and media tree. The app
+reads its settings from the environment at import time, so the environment is set
+before anything under src.shared is imported.
+"""
+import base64
+import itertools
+import os
+import shutil
+import tempfile
+from pathlib import Path
+import pytest
+from src.tools.loadtest import _png_bytes, build_workdir
+
+NUM_ROUTES = 40  # every test takes fresh routes for its drawings
+
+WORKDIR = Path(tempfile.mkdtemp(prefix="napkin-tests-"))
+_env = build_workdir(WORKDIR, NUM_ROUTES, video_kb=1)
+os.environ.update({k: _env[k] for k in (
+    "DATABASE_URL", "ROUTES_FILE", "MAPS_DIR", "OBSERVATIONS_DIR", "VIDEO_DIR", "USER_DRAWINGS_DIR", "SECRET_KEY",
+)})
+os.environ.update({
+    "INGEST_MODE": "sync",
+    "INGEST_SPOOL_DIR": str(WORKDIR / "ingest_spool"),
+    "ROUTES_RELOAD_SECONDS": "0",
+    "PROFILE_DIR": str(WORKDIR / "profiles"),
+})
+for key in ("ADMIN_TOKEN", "METRICS_DIR", "SQL_PROFILE", "PROFILE_ENABLED", "DRAWING_STORE", "COMBINED_HOSTS"):
+    os.environ.pop(key, None)
+
+_users = itertools.count(1)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def apps():
+    cwd = os.getcwd()
+    os.chdir(WORKDIR)  # user_answers/ and user_landmarks/ are written to the working directory
+    try:
+        from src import combined_app
+        yield {"draw": combined_app.draw_app, "landmarks": combined_app.landmark_app}
+    finally:
+        os.chdir(cwd)
+
+
+def login(app):
+    """A test client signed in as a new participant."""
+    client = app.test_client()
+    r = client.post("/authenticate", json={"user_id": f"test_{next(_users)}", "study_id": "ClaireTest123"})
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return client
+
+
+@pytest.fixture
+def draw_client(apps):
+    return login(apps["draw"])
+
+
+@pytest.fixture
+def landmark_client(apps):
+    return login(apps["landmarks"])
+
+
+@pytest.fixture(scope="session")
+def drawing_data_url():
+    return "data:image/png;base64," + base64.b64encode(_png_bytes((400, 300), 20, 3)).decode()
@@ -0,0 +1,48 @@
+"""
+save_answer's effort scoring keeps the stroke entropy in step with the full history
+while binning only each save's new points.
+"""
+import pytest
+from src.shared import effort
+from src.shared.models import EffortScore, StrokeGrid, db
+from src.shared.strokes import load_strokes
+
+CANVAS = {"canvasW": 400, "canvasH": 300}
+
+
+def _strokes(i):
+    # 30 points a save, spread over the canvas
+    pts = []
+    for k in range(30):
+        pts += [(37 * (k + i)) % 400, (53 * (k + 3 * i)) % 300, 16 * k]
+    return [{"t0": 1_700_000_000_000 + 10_000 * i, "pts": pts}]
+
+
+def _save(client, task_id, seq):
+    r = client.post("/save_answer", json={
+        "task_id": task_id, "landmarks": [], "seq": seq, "epoch": "e1",
+        "task_metrics": {"drawing": {**CANVAS, "strokes": _strokes(seq)}},
+    })
+    assert r.status_code == 200, r.get_data(as_text=True)
+
+
+def test_entropy_tracks_history(apps, draw_client, monkeypatch):
+    task_id = draw_client.get("/next_batch").get_json()["trajectories"][0]["task_id"]
+    with draw_client.session_transaction() as sess:
+        key = ("draw", int(sess["_user_id"]), task_id)
+
+    _save(draw_client, task_id, 1)
+
+    def no_decode(*args):
+        pytest.fail("a save with a started grid decoded the stroke history")
+    monkeypatch.setattr(effort, "load_strokes", no_decode)
+    _save(draw_client, task_id, 2)
+    monkeypatch.undo()
+
+    with apps["draw"].app_context():
+        history = load_strokes(*key)
+        assert len(history.t) == 60
+        assert sum(db.session.get(StrokeGrid, key).counts) == 60
+        want = effort.grid_entropy(history.x, history.y, CANVAS["canvasW"], CANVAS["canvasH"])
+        assert want > 0
+        assert db.session.get(EffortScore, key).entropy == pytest.approx(want)
@@ -0,0 +1,39 @@
+"""
+Releasing landmark assignments nobody answered in time.
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from src.shared import pairing
+from src.shared.models import DrawingCoverage, LandmarkAssignment, db
+from src.shared.sql_profiler import count_queries
+
+
+def test_release_expired(apps, draw_client, landmark_client, drawing_data_url):
+    for task in draw_client.get("/next_batch").get_json()["trajectories"]:
+        r = draw_client.post("/save_drawing", json={"task_id": task["task_id"], "image": drawing_data_url})
+        assert r.status_code == 200
+    assert landmark_client.get("/next_batch").status_code == 200
+    with landmark_client.session_transaction() as sess:
+        user_id = int(sess["_user_id"])
+
+    with apps["landmarks"].app_context():
+        mine = LandmarkAssignment.query.filter_by(user_id=user_id).all()
+        assert len(mine) > 2
+        held = Counter(a.drawing_id for a in mine)
+        slots = {c.drawing_id: c.slots for c in DrawingCoverage.query.filter(DrawingCoverage.drawing_id.in_(held))}
+        for a in mine:
+            a.assigned_at = datetime.now(timezone.utc) - timedelta(days=1)
+        db.session.flush()
+
+        assert pairing.release_expired(3600, limit=2) == 2
+        assert LandmarkAssignment.query.filter_by(user_id=user_id).count() == len(mine) - 2
+        # one DELETE ... RETURNING and one UPDATE, however many were freed
+        with count_queries() as q:
+            assert pairing.release_expired(3600) == len(mine) - 2
+        assert q.count == 2
+        assert pairing.release_expired(3600) == 0
+
+        assert LandmarkAssignment.query.filter_by(user_id=user_id).count() == 0
+        after = {c.drawing_id: c.slots for c in DrawingCoverage.query.filter(DrawingCoverage.drawing_id.in_(held))}
+        assert after == {d: slots[d] - n for d, n in held.items()}
+        db.session.rollback()
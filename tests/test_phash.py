@@ -0,0 +1,41 @@
+"""
+HashIndex.pairs against a brute-force all-pairs comparison.
+"""
+import numpy as np
+from src.shared.phash import HashIndex
+
+
+def _brute_force(hashes, max_distance):
+    found = set()
+    for i in range(len(hashes)):
+        d = np.bitwise_count(hashes[i] ^ hashes[i + 1:])
+        for j in np.flatnonzero(d <= max_distance):
+            found.add((i, i + 1 + int(j), int(d[j])))
+    return found
+
+
+def _pairs(index, max_distance, block):
+    out = []
+    for i, j, d in index.pairs(max_distance, block=block):
+        out += zip(i.tolist(), j.tolist(), d.tolist())
+    return out
+
+
+def test_pairs_match_brute_force():
+    rng = np.random.default_rng(7)
+    base = rng.integers(0, 1 << 63, 200, dtype=np.uint64)
+    # near copies of a few hashes, and a hot bucket: one quarter value shared by 300 hashes
+    flips = np.uint64(1) << rng.integers(0, 64, 200).astype(np.uint64)
+    hot = (rng.integers(0, 1 << 63, 300, dtype=np.uint64) & ~np.uint64(0xFFFF)) | np.uint64(0x1234)
+    hashes = np.concatenate([base, base[:100] ^ flips[:100], hot, hot[:20] ^ np.uint64(0x30000)])
+
+    want = _brute_force(hashes, 6)
+    assert len(want) > 100
+    for block in (97, 1 << 20):
+        got = _pairs(HashIndex(hashes), 6, block)
+        assert len(got) == len(set(got))
+        assert set(got) == want
+
+
+def test_pairs_empty():
+    assert list(HashIndex([]).pairs()) == []
@@ -0,0 +1,87 @@
+"""
+SQL statements per request on the hot endpoints, pinned with query_budget. A budget
+failure lists the statement shapes that repeated, which is usually an N+1 that
+slipped in; raise a budget only for a deliberate extra query.
+"""
+from src.shared.batch_routes import NUM_TASKS_PER_BATCH
+from src.shared.sql_profiler import count_queries, query_budget
+
+# the login loader (after next_batch invalidates its cache entry) and next_batch's
+# forced refresh each load the user
+USER_LOADS = 2
+
+
+def _batch(client):
+    r = client.get("/next_batch")
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return r.get_json()["trajectories"]
+
+
+def _task_ids(tasks):
+    return sorted(t["task_id"] for t in tasks)
+
+
+def test_next_batch_draw(draw_client):
+    with query_budget(5, max_repeats=USER_LOADS):
+        tasks = _batch(draw_client)
+    assert len(tasks) == NUM_TASKS_PER_BATCH
+    # the in-flight batch again, with its saved drawings
+    with query_budget(4, max_repeats=USER_LOADS):
+        assert _task_ids(_batch(draw_client)) == _task_ids(tasks)
+
+
+def test_save_drawing(draw_client, drawing_data_url):
+    task = _batch(draw_client)[0]
+    with query_budget(11, max_repeats=1):
+        r = draw_client.post("/save_drawing", json={"task_id": task["task_id"], "image": drawing_data_url})
+    assert r.status_code == 200, r.get_data(as_text=True)
+    # saving again updates the rows instead of adding them
+    with query_budget(8, max_repeats=1):
+        r = draw_client.post("/save_drawing", json={"task_id": task["task_id"], "image": drawing_data_url})
+    assert r.status_code == 200
+
+
+def test_save_answer(draw_client):
+    task = _batch(draw_client)[0]
+    body = {"task_id": task["task_id"], "landmarks": [{"x": 1, "y": 2}], "seq": 1, "epoch": "e1"}
+    with query_budget(12, max_repeats=1):
+        r = draw_client.post("/save_answer", json=body)
+    assert r.status_code == 200, r.get_data(as_text=True)
+    with query_budget(7, max_repeats=1):
+        r = draw_client.post("/save_answer", json={**body, "seq": 2})
+    assert r.status_code == 200
+
+
+def _seed_drawings(client, data_url):
+    for task in _batch(client):
+        r = client.post("/save_drawing", json={"task_id": task["task_id"], "image": data_url})
+        assert r.status_code == 200
+
+
+def test_next_batch_landmarks(draw_client, landmark_client, drawing_data_url):
+    _seed_drawings(draw_client, drawing_data_url)
+    # one conditional UPDATE per slot is how a slot is claimed (src/shared/pairing.py)
+    with query_budget(8 + NUM_TASKS_PER_BATCH, max_repeats=NUM_TASKS_PER_BATCH):
+        tasks = _batch(landmark_client)
+    assert tasks
+    with query_budget(4, max_repeats=USER_LOADS):
+        assert _task_ids(_batch(landmark_client)) == _task_ids(tasks)
+
+
+def test_save_landmarks(draw_client, landmark_client, drawing_data_url):
+    _seed_drawings(draw_client, drawing_data_url)
+    task = _batch(landmark_client)[0]
+    body = {"task_id": task["task_id"], "landmarks": [{"label": "church", "x": 10, "y": 20}]}
+    with query_budget(8, max_repeats=1):
+        r = landmark_client.post("/save_landmarks", json=body)
+    assert r.status_code == 200, r.get_data(as_text=True)
+    with query_budget(3, max_repeats=1):
+        r = landmark_client.post("/save_landmarks", json=body)
+    assert r.status_code == 200
+
+
+def test_count_queries_nests():
+    with count_queries() as outer:
+        with count_queries() as inner:
+            pass
+    assert outer.count == inner.count == 0
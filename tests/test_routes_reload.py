@@ -0,0 +1,23 @@
+"""
+upsert_tasks on more routes than one IN (...) may bind.
+"""
+from src.shared import routes_reload
+from src.shared.models import Task, db
+from src.shared.sql_profiler import count_queries
+
+
+def test_upsert_tasks_in_chunks(apps, monkeypatch):
+    monkeypatch.setattr(routes_reload, "IN_CHUNK", 7)
+    app = apps["draw"]
+    with app.app_context():
+        routes = dict(app.extensions["routes_data"])
+        new_rid = "test-upsert-new-route"
+        routes[new_rid] = {**next(iter(routes.values())), "landmarks": [{"label": "new"}]}
+
+        with count_queries() as q:
+            created = routes_reload.upsert_tasks(routes)
+        assert [t.route_id for t in created] == [new_rid]
+        # ceil(41 / 7) SELECTs and the INSERT; the existing rows are unchanged
+        assert q.count == 6 + 1
+        assert db.session.query(Task.id).count() == len(routes)
+        db.session.rollback()
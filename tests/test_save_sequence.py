@@ -0,0 +1,32 @@
+"""
+save_answer's (epoch, seq) replay guard: each client epoch keeps its own high-water
+mark, so a retry is dropped even after another epoch has saved in between.
+"""
+from src.shared.models import StrokeData, db
+
+
+def _save(client, task_id, epoch, seq):
+    r = client.post("/save_answer", json={
+        "task_id": task_id,
+        "landmarks": [],
+        "seq": seq,
+        "epoch": epoch,
+        "task_metrics": {"drawing": {"strokes": [{"t0": 1_700_000_000_000, "pts": [1, 2, 0, 3, 4, 16]}]}},
+    })
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return r.get_json()["status"]
+
+
+def test_older_epoch_replay_after_newer_epoch(apps, draw_client):
+    task_id = draw_client.get("/next_batch").get_json()["trajectories"][0]["task_id"]
+    assert _save(draw_client, task_id, "A", 1) == "ok"
+    assert _save(draw_client, task_id, "B", 1) == "ok"
+    # a retry of A's first save, arriving after B's
+    assert _save(draw_client, task_id, "A", 1) == "duplicate"
+    assert _save(draw_client, task_id, "A", 2) == "ok"
+    with draw_client.session_transaction() as sess:
+        user_id = int(sess["_user_id"])
+
+    with apps["draw"].app_context():
+        row = db.session.query(StrokeData).filter_by(study="draw", user_id=user_id, task_id=task_id).one()
+        assert row.n_strokes == 3
@@ -0,0 +1,39 @@
+"""
+Stroke histories: each save appends a chunk, and load_strokes reads them back in order.
+"""
+import numpy as np
+from src.shared.models import StrokeChunk, StrokeData, db
+from src.shared.strokes import concat, from_client, load_strokes
+
+SAVES = [
+    [{"t0": 1_700_000_000_000, "pts": [1, 2, 0, 3, 4, 16]}],
+    [{"t0": 1_700_000_001_000, "pts": [5, 6, 0]}, {"t0": 1_700_000_002_000, "pts": [7, 8, 0, 9, 10, 8]}],
+]
+
+
+def test_saves_append_chunks(apps, draw_client):
+    task_id = draw_client.get("/next_batch").get_json()["trajectories"][0]["task_id"]
+    for seq, strokes in enumerate(SAVES, 1):
+        r = draw_client.post("/save_answer", json={
+            "task_id": task_id, "landmarks": [], "seq": seq, "epoch": "e1",
+            "task_metrics": {"drawing": {"strokes": strokes}},
+        })
+        assert r.status_code == 200, r.get_data(as_text=True)
+    with draw_client.session_transaction() as sess:
+        user_id = int(sess["_user_id"])
+
+    with apps["draw"].app_context():
+        key = {"study": "draw", "user_id": user_id, "task_id": task_id}
+        chunks = StrokeChunk.query.filter_by(**key).order_by(StrokeChunk.seq).all()
+        assert [(c.seq, c.n_strokes, c.n_points) for c in chunks] == [(0, 1, 2), (1, 2, 3)]
+        totals = StrokeData.query.filter_by(**key).one()
+        assert (totals.n_chunks, totals.n_strokes, totals.n_points) == (2, 3, 5)
+
+        s = load_strokes(**key)
+        expected = concat([from_client(strokes) for strokes in SAVES])
+        assert s.t0 == expected.t0 == 1_700_000_000_000
+        for got, want in zip(s[1:], expected[1:]):
+            np.testing.assert_array_equal(got, want)
+        np.testing.assert_array_equal(s.offsets, [0, 2, 3, 5])
+        np.testing.assert_array_equal(s.t, [0, 16, 1000, 2000, 2008])
+        np.testing.assert_array_equal(s.x, [1, 3, 5, 7, 9])